@@ -0,0 +1,286 @@
+"""Benchmarks of the data pipeline and model on synthetic data. Results are plain dicts
+so they can be dumped to JSON and compared across commits.
+"""
+import json
+import os
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import sqlalchemy
+import torch
+
+from song2vec import db, evaluation
+from song2vec.cli import load
+from song2vec.cli.commands.load_playlists import load_playlists
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.inference import InferenceEngine
+from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+
+
+def generate_slices(
+    raw_data_dir: str,
+    num_playlists: int = 1000,
+    num_tracks: int = 10000,
+    zipf_skew: float = 1.0,
+    playlists_per_slice: int = 1000,
+    min_length: int = 5,
+    max_length: int = 250,
+    seed: int = 0,
+) -> List[str]:
+    """Write synthetic slices in the format of the Million Playlist Dataset.
+
+    Track popularity follows a Zipf distribution, like in the real dataset. Each artist
+    has ten tracks and each album five.
+
+    Arguments:
+        raw_data_dir: directory to write the slices to.
+        num_playlists: total number of playlists.
+        num_tracks: number of distinct tracks to sample from.
+        zipf_skew: exponent of the Zipf distribution. 0 is uniform.
+        playlists_per_slice: number of playlists in each file.
+        min_length: minimum number of tracks in a playlist, unless there are fewer
+            tracks.
+        max_length: maximum number of tracks in a playlist.
+        seed: random seed.
+
+    Returns:
+        The paths of the slices.
+    """
+    rng = np.random.default_rng(seed)
+    probabilities = 1 / np.arange(1, num_tracks + 1) ** zipf_skew
+    probabilities /= probabilities.sum()
+
+    filenames = []
+    for start in range(0, num_playlists, playlists_per_slice):
+        end = min(start + playlists_per_slice, num_playlists)
+        playlists = []
+        for pid in range(start, end):
+            length = min(int(rng.integers(min_length, max_length + 1)), num_tracks)
+            # Playlists don't repeat tracks. Sampling with replacement until there are
+            # enough distinct tracks takes forever when a few tracks have most of the
+            # weight.
+            track_ids = rng.choice(num_tracks, length, replace=False, p=probabilities)
+            playlists.append(
+                {
+                    "name": f"playlist {pid}",
+                    "pid": pid,
+                    "tracks": [
+                        _synthetic_track(track_id, pos)
+                        for pos, track_id in enumerate(track_ids.tolist())
+                    ],
+                }
+            )
+        filename = os.path.join(raw_data_dir, f"mpd.slice.{start}-{end - 1}.json")
+        with open(filename, "w") as file:
+            json.dump(
+                {"info": {"slice": f"{start}-{end - 1}"}, "playlists": playlists}, file
+            )
+        filenames.append(filename)
+    return filenames
+
+
+def _synthetic_track(track_id: int, pos: int) -> dict:
+    """A track as stored in the Spotify dataset."""
+    return {
+        "pos": pos,
+        "track_uri": f"spotify:track:{track_id}",
+        "track_name": f"track {track_id}",
+        "artist_uri": f"spotify:artist:{track_id // 10}",
+        "artist_name": f"artist {track_id // 10}",
+        "album_uri": f"spotify:album:{track_id // 5}",
+        "album_name": f"album {track_id // 5}",
+        "duration_ms": 200000,
+    }
+
+
+def time_calls(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Call `func` `repeat` times and summarize the wall clock time of each call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "repeat": repeat,
+        "total_s": sum(times),
+        "mean_s": statistics.mean(times),
+        "p50_s": times[len(times) // 2],
+        "p95_s": times[min(int(len(times) * 0.95), len(times) - 1)],
+    }
+
+
+def benchmark_load(raw_data_dir: str, db_url: str) -> Dict[str, float]:
+    """Time `load-playlists` end to end on an empty db."""
+    start = time.perf_counter()
+    load_playlists.main(
+        ["--raw-data-dir", raw_data_dir, "--db-url", db_url], standalone_mode=False
+    )
+    elapsed = time.perf_counter() - start
+
+    session = sqlalchemy.orm.sessionmaker(bind=sqlalchemy.create_engine(db_url))()
+    num_associations = session.query(db.Association).count()
+    session.close()
+    return {
+        "total_s": elapsed,
+        "associations": num_associations,
+        "rows_per_s": num_associations / elapsed,
+    }
+
+
+def benchmark_dataset(
+    dataset: MillionPlaylistDataset, keys: List[str], repeat: int, batch_size: int
+) -> Dict[str, Dict[str, float]]:
+    """Time `__getitem__` on single keys and `query_db` on batches of keys."""
+    rng = random.Random(0)
+    return {
+        "getitem": time_calls(lambda: dataset[rng.choice(keys)], repeat),
+        "query_db": time_calls(
+            lambda: dataset.query_db(rng.sample(keys, min(batch_size, len(keys)))),
+            repeat,
+        ),
+    }
+
+
+def benchmark_encode(
+    dataset: MillionPlaylistDataset, keys: List[str], repeat: int, batch_size: int
+) -> Dict[str, float]:
+    """Measure the throughput of `MultiHotEncoder.encode` in tokens per second."""
+    token_lists = dataset.query_db(keys[:batch_size])
+    num_tokens = sum(map(len, token_lists))
+    result = time_calls(lambda: dataset.multi_hot_encoder.encode(token_lists), repeat)
+    result["tokens_per_s"] = num_tokens * repeat / result["total_s"]
+    return result
+
+
+def benchmark_training_step(
+    dataset: MillionPlaylistDataset, keys: List[str], repeat: int, embedding_dim: int
+) -> Dict[str, float]:
+    """Measure CBOW forward and backward steps per second."""
+    model = ContinousBagOfWords(
+        vocab_size=len(dataset.multi_hot_encoder.vocabulary),
+        embedding_dim=embedding_dim,
+    )
+    data_points = [dataset[key] for key in keys[:repeat]]
+    data_points = [x for x in data_points if len(x.values()) > 1]
+    iterator = iter(data_points * (repeat // max(len(data_points), 1) + 1))
+
+    def step():
+        model.zero_grad()
+        loss = model.training_step([next(iterator)], 0)
+        loss.backward()
+
+    result = time_calls(step, repeat)
+    result["steps_per_s"] = repeat / result["total_s"]
+    return result
+
+
+def benchmark_inference(
+    dataset: MillionPlaylistDataset,
+    keys: List[str],
+    repeat: int,
+    batch_size: int,
+    embedding_dim: int,
+    k: int = 10,
+) -> Dict[str, Dict[str, float]]:
+    """Compare recommending the top `k` tracks for one playlist at a time with the
+    model's `forward` and with `InferenceEngine`, alone and in batches."""
+    model = ContinousBagOfWords(
+        vocab_size=len(dataset.multi_hot_encoder.vocabulary),
+        embedding_dim=embedding_dim,
+    )
+    engine = InferenceEngine(
+        evaluation.export_weights(model), dataset.multi_hot_encoder.vocabulary
+    )
+    contexts = dataset.query_db(keys[:batch_size])
+    encoded = [dataset.multi_hot_encoder.encode([x]) for x in contexts]
+    rng = random.Random(0)
+
+    def forward():
+        with torch.no_grad():
+            torch.topk(model(rng.choice(encoded)), k)
+
+    results = {
+        "forward": time_calls(forward, repeat),
+        "engine": time_calls(
+            lambda: engine.recommend([rng.choice(contexts)], k), repeat
+        ),
+        "engine_batch": time_calls(lambda: engine.recommend(contexts, k), repeat),
+    }
+    for name in ("forward", "engine"):
+        results[name]["requests_per_s"] = repeat / results[name]["total_s"]
+    results["engine_batch"]["requests_per_s"] = (
+        repeat * len(contexts) / results["engine_batch"]["total_s"]
+    )
+    return results
+
+
+def benchmark_remove_unique_tracks(db_url: str) -> Dict[str, float]:
+    """Time `remove_unique_tracks`. This modifies the db so it should run last."""
+    session = sqlalchemy.orm.sessionmaker(bind=sqlalchemy.create_engine(db_url))()
+    start = time.perf_counter()
+    load.remove_unique_tracks(session)
+    elapsed = time.perf_counter() - start
+    session.close()
+    return {"total_s": elapsed}
+
+
+def run(
+    work_dir: str,
+    num_playlists: int = 1000,
+    num_tracks: int = 10000,
+    zipf_skew: float = 1.0,
+    repeat: int = 100,
+    batch_size: int = 64,
+    embedding_dim: int = 64,
+    seed: int = 0,
+) -> dict:
+    """Generate a synthetic dataset in `work_dir` and run all the benchmarks.
+
+    Arguments:
+        work_dir: empty directory for the synthetic slices and the db.
+        See `generate_slices` and the `benchmark_*` functions for the rest.
+
+    Returns:
+        The parameters and the results of each benchmark.
+    """
+    raw_data_dir = os.path.join(work_dir, "raw")
+    os.makedirs(raw_data_dir, exist_ok=True)
+    db_url = f"sqlite:///{os.path.join(work_dir, 'db')}"
+    generate_slices(
+        raw_data_dir,
+        num_playlists=num_playlists,
+        num_tracks=num_tracks,
+        zipf_skew=zipf_skew,
+        seed=seed,
+    )
+
+    results = {"load_playlists": benchmark_load(raw_data_dir, db_url)}
+    dataset = MillionPlaylistDataset(db_url)
+    keys = [str(key) for key in dataset.keys]
+    results.update(benchmark_dataset(dataset, keys, repeat, batch_size))
+    results["encode"] = benchmark_encode(dataset, keys, repeat, batch_size)
+    results["training_step"] = benchmark_training_step(
+        dataset, keys, repeat, embedding_dim
+    )
+    results["inference"] = benchmark_inference(
+        dataset, keys, repeat, batch_size, embedding_dim
+    )
+    results["remove_unique_tracks"] = benchmark_remove_unique_tracks(db_url)
+
+    return {
+        "params": {
+            "num_playlists": num_playlists,
+            "num_tracks": num_tracks,
+            "zipf_skew": zipf_skew,
+            "repeat": repeat,
+            "batch_size": batch_size,
+            "embedding_dim": embedding_dim,
+            "seed": seed,
+        },
+        "versions": {"torch": torch.__version__, "sqlalchemy": sqlalchemy.__version__},
+        "results": results,
+    }
@@ -0,0 +1,167 @@
+"""On-disk cache of data derived from the db, like the vocabulary.
+
+Entries are addressed by a fingerprint of the db and the parameters used to build them,
+so they are never stale: once the db changes, lookups miss and the entry is rebuilt.
+Entries of older versions of the db are removed with `ArtifactCache.invalidate`, and the
+least recently used entries are evicted when the cache grows past its size limit.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy
+
+from song2vec import db
+from song2vec.instrumentation import METRICS
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value: Any) -> str:
+    """Hash of a value that can be dumped to JSON."""
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def db_fingerprint(engine: sqlalchemy.engine.Engine) -> str:
+    """Fingerprint of the contents of a db. Changes when rows are inserted or deleted.
+
+    Arguments:
+        engine: engine of the db.
+
+    Returns:
+        A hash of the number of rows and, on SQLite, the largest rowid of each table.
+    """
+    with METRICS.timer("cache.fingerprint"):
+        markers = {}
+        inspector = sqlalchemy.inspect(engine)
+        with engine.connect() as connection:
+            for table in db.Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                columns = [sqlalchemy.func.count()]
+                if engine.dialect.name == "sqlite":
+                    columns.append(sqlalchemy.func.max(sqlalchemy.column("rowid")))
+                row = connection.execute(
+                    sqlalchemy.select(*columns).select_from(table)
+                ).one()
+                markers[table.name] = list(row)
+    return _hash(markers)
+
+
+class ArtifactCache:
+    """Pickled artifacts in a directory, e.g. `data/cache`.
+
+    Attributes:
+        cache_dir: directory with the entries.
+        max_bytes: maximum total size of the entries.
+    """
+
+    cache_dir: str
+    max_bytes: int
+
+    def __init__(self, cache_dir: str, max_bytes: int = 4 * 2 ** 30):
+        """Initiate an instance of the class. Creates `cache_dir` if needed.
+
+        Arguments:
+            See class docstring.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, name: str, source: str, fingerprint: str, params: dict) -> str:
+        """Path of an entry. It starts with the hash of `source`, then the fingerprint,
+        so the entries of old versions of a source can be found."""
+        key = _hash({"name": name, "params": params})
+        return os.path.join(
+            self.cache_dir,
+            f"{_hash(source)[:16]}.{fingerprint[:16]}.{name}.{key[:16]}.pkl",
+        )
+
+    def get_or_build(
+        self,
+        name: str,
+        source: str,
+        fingerprint: str,
+        build: Callable[[], Any],
+        params: Optional[dict] = None,
+    ) -> Any:
+        """Load an artifact from the cache, or build it and add it to the cache.
+
+        Arguments:
+            name: name of the artifact, e.g. "vocabulary".
+            source: what the artifact is built from, e.g. the url of the db.
+            fingerprint: fingerprint of the contents of `source`, see `db_fingerprint`.
+            build: function that builds the artifact. Its result must be picklable.
+            params: parameters passed to `build` that change the result.
+
+        Returns:
+            The artifact.
+        """
+        path = self.path(name, source, fingerprint, params or {})
+        try:
+            with METRICS.timer("cache.read"), open(path, "rb") as file:
+                artifact = pickle.load(file)
+        except FileNotFoundError:
+            METRICS.count("cache.misses")
+        else:
+            METRICS.count("cache.hits")
+            # The modification time is used as the access time for eviction.
+            os.utime(path)
+            return artifact
+
+        artifact = build()
+        with METRICS.timer("cache.write"):
+            # Write to a temporary file first so readers never see a partial entry.
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(artifact, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        self.evict()
+        return artifact
+
+    def entries(self) -> List[str]:
+        """Paths of all the entries, least recently used first."""
+        paths = [
+            os.path.join(self.cache_dir, x)
+            for x in os.listdir(self.cache_dir)
+            if x.endswith(".pkl")
+        ]
+        return sorted(paths, key=os.path.getmtime)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits in `max_bytes`."""
+        sizes: Dict[str, int] = {x: os.path.getsize(x) for x in self.entries()}
+        total = sum(sizes.values())
+        for path, size in sizes.items():
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logger.info("Evicted %s from the cache.", path)
+
+    def invalidate(self, source: str, fingerprint: str) -> int:
+        """Remove the entries of a source that were built from other versions of it.
+
+        Arguments:
+            source: see `get_or_build`.
+            fingerprint: fingerprint of the current contents of `source`.
+
+        Returns:
+            The number of entries that were removed.
+        """
+        prefix = f"{_hash(source)[:16]}."
+        current = f"{prefix}{fingerprint[:16]}."
+        removed = 0
+        for path in self.entries():
+            name = os.path.basename(path)
+            if name.startswith(prefix) and not name.startswith(current):
+                os.remove(path)
+                removed += 1
+        return removed
@@ -0,0 +1,193 @@
+"""Checkpoint format that can be memory-mapped.
+
+A checkpoint is a directory with:
+
+- `tensors.bin`: the raw bytes of each tensor, aligned to `ALIGNMENT` bytes.
+- `vocabulary.txt`: the vocabulary, one token per line.
+- `index.json`: the dtype, shape and offset of each tensor, the fingerprint of the
+  vocabulary and any other metadata. Written last, so a checkpoint without an index is
+  incomplete.
+
+Loading maps `tensors.bin` copy-on-write, so tensors are only read from disk when they
+are used and never copied unless they are modified.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from song2vec.instrumentation import METRICS
+
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+INDEX_FILE = "index.json"
+TENSORS_FILE = "tensors.bin"
+VOCABULARY_FILE = "vocabulary.txt"
+
+
+def vocabulary_fingerprint(vocabulary: List[str]) -> str:
+    """Hash of a vocabulary. Two encoders with the same fingerprint give every token
+    the same index."""
+    digest = hashlib.sha256()
+    for token in vocabulary:
+        digest.update(token.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def is_checkpoint(path: str) -> bool:
+    """Whether `path` is a complete checkpoint in this format."""
+    return os.path.isfile(os.path.join(path, INDEX_FILE))
+
+
+def save(
+    path: str,
+    tensors: Dict[str, Union[Tensor, List[np.ndarray]]],
+    vocabulary: List[str],
+    metadata: dict,
+) -> None:
+    """Save a checkpoint. An existing checkpoint at `path` is only replaced once the new
+    one is complete.
+
+    Arguments:
+        path: directory to save the checkpoint to.
+        tensors: the tensors to save, e.g. a state dict. A tensor can also be a list of
+            arrays to concatenate along the first dimension, e.g. memory-mapped shards,
+            which are written one at a time so the whole tensor is never in memory.
+        vocabulary: the vocabulary of the encoder the model was trained with.
+        metadata: anything else, as long as it can be dumped to JSON.
+    """
+    with METRICS.timer("checkpoint.save"):
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".checkpoint-")
+        index = {"version": FORMAT_VERSION, "tensors": {}}
+        with open(os.path.join(tmp_dir, TENSORS_FILE), "wb") as file:
+            for name, tensor in tensors.items():
+                if isinstance(tensor, list):
+                    chunks = tensor
+                    shape = [sum(len(x) for x in chunks), *chunks[0].shape[1:]]
+                else:
+                    chunks = [tensor.detach().cpu().contiguous().numpy()]
+                    shape = list(chunks[0].shape)
+                file.write(b"\0" * (-file.tell() % ALIGNMENT))
+                index["tensors"][name] = {
+                    "dtype": chunks[0].dtype.str,
+                    "shape": shape,
+                    "offset": file.tell(),
+                }
+                for chunk in chunks:
+                    file.write(np.ascontiguousarray(chunk).tobytes())
+                    METRICS.count("checkpoint.save.bytes", chunk.nbytes)
+        with open(os.path.join(tmp_dir, VOCABULARY_FILE), "w") as file:
+            file.writelines(f"{token}\n" for token in vocabulary)
+        index["vocabulary_fingerprint"] = vocabulary_fingerprint(vocabulary)
+        index["metadata"] = metadata
+        with open(os.path.join(tmp_dir, INDEX_FILE), "w") as file:
+            json.dump(index, file, indent=2)
+
+        old_dir = None
+        if os.path.exists(path):
+            old_dir = tempfile.mkdtemp(dir=parent, prefix=".checkpoint-old-")
+            os.replace(path, os.path.join(old_dir, "checkpoint"))
+        os.replace(tmp_dir, path)
+        if old_dir is not None:
+            shutil.rmtree(old_dir)
+
+
+def read_index(path: str) -> dict:
+    """Read the index of a checkpoint, without loading any tensor."""
+    with open(os.path.join(path, INDEX_FILE)) as file:
+        return json.load(file)
+
+
+def load(path: str) -> Tuple[Dict[str, Tensor], List[str], dict]:
+    """Load a checkpoint lazily.
+
+    Arguments:
+        path: directory of the checkpoint.
+
+    Returns:
+        The tensors, which share memory with the file, the vocabulary and the metadata.
+
+    Raises:
+        ValueError: if the vocabulary doesn't match its fingerprint.
+    """
+    with METRICS.timer("checkpoint.load"):
+        index = read_index(path)
+        if index["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unknown checkpoint version {index['version']}.")
+        tensors_path = os.path.join(path, TENSORS_FILE)
+        tensors = {}
+        for name, spec in index["tensors"].items():
+            shape = tuple(spec["shape"])
+            if np.prod(shape, dtype=np.int64) == 0:
+                # Empty files and arrays can't be mapped.
+                tensors[name] = torch.from_numpy(np.zeros(shape, dtype=spec["dtype"]))
+                continue
+            array = np.memmap(
+                tensors_path,
+                dtype=spec["dtype"],
+                mode="c",
+                offset=spec["offset"],
+                shape=shape,
+            )
+            tensors[name] = torch.from_numpy(array)
+        with open(os.path.join(path, VOCABULARY_FILE)) as file:
+            vocabulary = file.read().splitlines()
+        if vocabulary_fingerprint(vocabulary) != index["vocabulary_fingerprint"]:
+            raise ValueError(f"The vocabulary of {path} doesn't match its fingerprint.")
+    return tensors, vocabulary, index["metadata"]
+
+
+class AsyncSaver:
+    """Save checkpoints in a background thread so training doesn't wait for the disk.
+
+    The tensors are copied before `save` returns, which is much faster than writing
+    them, so training can keep updating the weights. At most one save runs at a time.
+    """
+
+    executor: ThreadPoolExecutor
+    pending: Optional[Future]
+
+    def __init__(self):
+        """Initiate an instance of the class."""
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = None
+
+    def save(
+        self,
+        path: str,
+        tensors: Dict[str, Tensor],
+        vocabulary: List[str],
+        metadata: dict,
+    ) -> None:
+        """Snapshot the tensors and save them in the background. See `save`. Waits for
+        the previous save to finish first."""
+        self.wait()
+        with METRICS.timer("checkpoint.snapshot"):
+            snapshot = {name: x.detach().clone() for name, x in tensors.items()}
+        self.pending = self.executor.submit(
+            save, path, snapshot, list(vocabulary), metadata
+        )
+
+    def wait(self) -> None:
+        """Wait for the pending save and raise its exception, if any."""
+        if self.pending is not None:
+            with METRICS.timer("checkpoint.wait"):
+                pending, self.pending = self.pending, None
+                pending.result()
+
+    def close(self) -> None:
+        """Wait for the pending save and stop the thread."""
+        try:
+            self.wait()
+        finally:
+            self.executor.shutdown()
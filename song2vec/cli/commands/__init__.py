@@ -0,0 +1,3 @@
+"""Commands of the cli. Each command has its own module, which is only imported when
+the command is used. See `song2vec.cli.lazy`.
+"""
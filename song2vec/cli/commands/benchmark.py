@@ -0,0 +1,38 @@
+"""Command to benchmark the pipeline."""
+# This is a Click convention. Heavy imports go in the command so that they are only
+# imported when the command runs.
+# pylint: disable=import-outside-toplevel
+import click
+
+
+@click.command()
+@click.option(
+    "--output",
+    type=str,
+    default="-",
+    help="File to write the results to as JSON. Defaults to stdout.",
+)
+@click.option("--num-playlists", type=int, default=1000, help="Synthetic playlists.")
+@click.option("--num-tracks", type=int, default=10000, help="Synthetic vocab size.")
+@click.option(
+    "--zipf-skew",
+    type=float,
+    default=1.0,
+    help="Exponent of the Zipf distribution of track popularity.",
+)
+@click.option("--repeat", type=int, default=100, help="Calls per timed benchmark.")
+@click.option("--batch-size", type=int, default=64, help="Playlists per query.")
+@click.option("--embedding-dim", type=int, default=64, help="Size of the embeddings.")
+@click.option("--seed", type=int, default=0, help="Random seed.")
+def benchmark(output: str, **kwargs):
+    """Benchmark loading, dataset access, encoding and training on synthetic data."""
+    import json
+    import tempfile
+
+    from song2vec import benchmark as benchmarks
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = benchmarks.run(work_dir, **kwargs)
+    with click.open_file(output, "w") as file:
+        json.dump(results, file, indent=2)
+        file.write("\n")
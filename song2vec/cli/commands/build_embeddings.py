@@ -0,0 +1,67 @@
+"""Command to build the embedding indexes of tracks, artists and albums."""
+# This is a Click convention. Heavy imports go in the command so that they are only
+# imported when the command runs.
+# pylint: disable=import-outside-toplevel
+from typing import Optional
+
+import click
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    type=str,
+    default="sqlite:///data/db",
+    help="URL to the database for Sqlalchemy (e.g. sqlite:///data/db)",
+)
+@click.option(
+    "--checkpoint",
+    type=str,
+    default="data/checkpoint",
+    help="Checkpoint of the model to take the track embeddings from.",
+)
+@click.option(
+    "--output-dir",
+    type=str,
+    default="data/embeddings",
+    help="Directory to save the track, artist and album indexes to.",
+)
+@click.option(
+    "--cache-dir",
+    type=str,
+    default=None,
+    help="Directory to cache the number of playlists of each track in, so it is only "
+    "counted again when the db changes.",
+)
+def build_embeddings(
+    db_url: str, checkpoint: str, output_dir: str, cache_dir: Optional[str]
+):
+    """Build embeddings of artists and albums from the embeddings of their tracks."""
+    import logging
+
+    import sqlalchemy
+
+    from song2vec import embeddings, evaluation, training
+    from song2vec.instrumentation import METRICS
+
+    logging.basicConfig(
+        format="%(asctime)s:%(levelname)s:%(name)s:%(message)s", level=logging.INFO
+    )
+    METRICS.reset()
+    cache = None
+    if cache_dir is not None:
+        from song2vec.cache import ArtifactCache
+
+        cache = ArtifactCache(cache_dir)
+    logging.info("Loading checkpoint...")
+    model, multi_hot_encoder, _ = training.load_checkpoint(checkpoint)
+    sizes = embeddings.build_indexes(
+        evaluation.export_weights(model)["embeddings"],
+        multi_hot_encoder.vocabulary,
+        sqlalchemy.create_engine(db_url),
+        output_dir,
+        cache=cache,
+    )
+    for kind, size in sizes.items():
+        logging.info("Saved %d %s embeddings.", size, kind)
+    click.echo(METRICS.report(), err=True)
@@ -0,0 +1,138 @@
+"""Command to evaluate models on playlist continuation."""
+# This is a Click convention. Heavy imports go in the command so that they are only
+# imported when the command runs.
+# pylint: disable=import-outside-toplevel
+import os
+from typing import Optional
+
+import click
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    type=str,
+    default="sqlite:///data/db",
+    help="URL to the database for Sqlalchemy (e.g. sqlite:///data/db)",
+)
+@click.option(
+    "--parquet-dir",
+    type=str,
+    default=None,
+    help="Read the playlists from Parquet files written by load-playlists instead of "
+    "the db.",
+)
+@click.option(
+    "--checkpoint",
+    type=str,
+    default="data/checkpoint",
+    help="Checkpoint of the model to evaluate. Ignored with --embeddings.",
+)
+@click.option(
+    "--embeddings",
+    type=str,
+    default=None,
+    help="Evaluate a .npy file with an embedding per track instead of a model. Tracks "
+    "are scored by their dot product with the mean of the seeds.",
+)
+@click.option(
+    "--vocabulary",
+    type=str,
+    default=None,
+    help="Text file with the uri of each row of --embeddings, one per line.",
+)
+@click.option("--num-playlists", type=int, default=10000, help="Playlists to sample.")
+@click.option(
+    "--after-pid",
+    type=int,
+    default=-1,
+    help="Only sample playlists with a larger id, e.g. ones the model wasn't trained "
+    "on.",
+)
+@click.option(
+    "--num-seeds", type=int, default=5, help="Tracks given to the model per playlist."
+)
+@click.option(
+    "--num-recommendations", type=int, default=500, help="Tracks recommended."
+)
+@click.option("--batch-size", type=int, default=64, help="Playlists scored at once.")
+@click.option(
+    "--num-workers",
+    type=int,
+    default=max((os.cpu_count() or 1) - 1, 1),
+    help="Number of processes to score playlists with.",
+)
+@click.option("--seed", type=int, default=0, help="Random seed of the sample.")
+@click.option(
+    "--output",
+    type=str,
+    default="-",
+    help="File to write the results to as JSON. Defaults to stdout.",
+)
+def evaluate(
+    db_url: str,
+    parquet_dir: Optional[str],
+    checkpoint: str,
+    embeddings: Optional[str],
+    vocabulary: Optional[str],
+    num_playlists: int,
+    after_pid: int,
+    num_seeds: int,
+    num_recommendations: int,
+    batch_size: int,
+    num_workers: int,
+    seed: int,
+    output: str,
+):
+    """Measure R-precision, NDCG and clicks of recommendations for held out tracks."""
+    import json
+    import logging
+
+    import numpy as np
+
+    from song2vec import evaluation
+    from song2vec.data.datasets import MillionPlaylistDataset
+    from song2vec.instrumentation import METRICS
+    from song2vec.utils import MultiHotEncoder
+
+    logging.basicConfig(
+        format="%(asctime)s:%(levelname)s:%(name)s:%(message)s", level=logging.INFO
+    )
+    METRICS.reset()
+    if embeddings is not None:
+        if vocabulary is None:
+            raise click.UsageError("--embeddings requires --vocabulary.")
+        with open(vocabulary) as file:
+            multi_hot_encoder = MultiHotEncoder(file.read().split(), sort=False)
+        weights = evaluation.embedding_weights(np.load(embeddings))
+    else:
+        from song2vec import training
+
+        logging.info("Loading checkpoint...")
+        model, multi_hot_encoder, _ = training.load_checkpoint(checkpoint)
+        weights = evaluation.export_weights(model)
+
+    if parquet_dir is None:
+        dataset = MillionPlaylistDataset(db_url, multi_hot_encoder=multi_hot_encoder)
+    else:
+        from song2vec.data.parquet import ParquetPlaylistDataset
+
+        dataset = ParquetPlaylistDataset(
+            parquet_dir, multi_hot_encoder=multi_hot_encoder
+        )
+
+    keys = evaluation.sample_keys(dataset, num_playlists, after_pid, seed)
+    logging.info("Evaluating on %d playlists...", len(keys))
+    results = evaluation.evaluate(
+        weights,
+        dataset,
+        keys,
+        num_seeds=num_seeds,
+        num_recommendations=num_recommendations,
+        batch_size=batch_size,
+        num_workers=num_workers,
+    )
+    click.echo(METRICS.report(), err=True)
+    with click.open_file(output, "w") as file:
+        json.dump(results, file, indent=2)
+        file.write("\n")
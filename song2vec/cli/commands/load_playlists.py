@@ -0,0 +1,214 @@
+"""Command to load the dataset."""
+# This is a Click convention. Heavy imports go in the command so that they are only
+# imported when the command runs.
+# pylint: disable=import-outside-toplevel
+import os
+from typing import Optional
+
+import click
+
+
+@click.command()
+@click.option(
+    "--raw-data-dir",
+    type=str,
+    default="data/raw/data",
+    help="Path to folder containing the json files with the Spotify dataset, which "
+    "can be gzipped or zstd compressed, or path to the zip archive of the dataset.",
+)
+@click.option(
+    "--db-url",
+    type=str,
+    default="sqlite:///data/db",
+    help="URL to the database for Sqlalchemy (e.g. sqlite:///data/db)",
+)
+@click.option(
+    "--remove-single/--no-remove-single",
+    type=bool,
+    default=False,
+    help="Make sure all tracks appear in multiple playlists and that all playlists have multiple tracks.",
+)
+@click.option(
+    "--num-workers",
+    type=int,
+    default=max((os.cpu_count() or 1) - 1, 1),
+    help="Number of processes parsing the json files.",
+)
+@click.option(
+    "--commit-every",
+    type=int,
+    default=10,
+    help="Number of slices to insert in each transaction.",
+)
+@click.option(
+    "--profile",
+    type=str,
+    default=None,
+    help="Directory to dump cProfile stats of each loader process to.",
+)
+@click.option(
+    "--parquet-dir",
+    type=str,
+    default=None,
+    help="Write the tables to partitioned Parquet files in this directory instead of "
+    "loading them into the db. Requires pyarrow.",
+)
+@click.option(
+    "--cache-dir",
+    type=str,
+    default=None,
+    help="Cache directory used by train. Entries built from the previous contents of "
+    "the db are removed.",
+)
+def load_playlists(
+    raw_data_dir: str,
+    db_url: str,
+    remove_single: bool,
+    num_workers: int,
+    commit_every: int,
+    profile: Optional[str],
+    parquet_dir: Optional[str],
+    cache_dir: Optional[str],
+):
+    """Load the Million Playlist Dataset into a SQLite database."""
+    import logging
+    import multiprocessing
+
+    import sqlalchemy
+    from sqlalchemy.orm.session import sessionmaker
+
+    from song2vec import db
+    from song2vec.cli import load
+    from song2vec.instrumentation import (
+        METRICS,
+        collect_metrics,
+        profiled,
+        run_instrumented,
+    )
+
+    # Set up connection
+    logger = logging.getLogger(__name__)
+    logging.basicConfig(
+        format="%(asctime)s:%(levelname)s:%(name)s:%(message)s", level=logging.INFO
+    )
+    METRICS.reset()
+    if profile is not None:
+        os.makedirs(profile, exist_ok=True)
+
+    if parquet_dir is not None:
+        from song2vec.data import parquet
+
+        if remove_single:
+            raise click.UsageError("--remove-single only works with a db.")
+        # Each process writes its own files, so there is nothing to lock.
+        filenames = parquet.get_new_slices(parquet_dir, load.get_slices(raw_data_dir))
+        logging.info("Writing %d new slices to %s...", len(filenames), parquet_dir)
+        num_workers = max(min(num_workers, len(filenames)), 1)
+        metrics_queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=run_instrumented,
+                args=(
+                    f"writer-{i}",
+                    metrics_queue,
+                    profile,
+                    parquet.write_slices,
+                    filenames[i::num_workers],
+                    parquet_dir,
+                ),
+            )
+            for i in range(num_workers)
+        ]
+        for process in processes:
+            process.start()
+        collect_metrics(metrics_queue, processes)
+        for process in processes:
+            process.join()
+        if any(process.exitcode for process in processes):
+            raise click.ClickException("A writer failed. See the traceback above.")
+        logging.info("Done writing Parquet files!")
+        click.echo(METRICS.report(), err=True)
+        return
+
+    logging.info("Connecting to db...")
+    engine = sqlalchemy.create_engine(db_url)
+    logging.info("Done connecting to db!")
+
+    logging.info("Creating tables...")
+    db.Base.metadata.create_all(engine)
+    for column in load.add_missing_columns(engine):
+        # Rows that were already loaded don't have the new column. Tracks without a
+        # position are ordered by when they were inserted.
+        logging.warning("Added %s to a db loaded by an older version.", column)
+    logging.info("Done creating tables!")
+
+    logging.info("Loading data...")
+    # Parser processes read the files and send rows to a single writer (this process),
+    # since SQLite only allows one writer at a time. Slices loaded by a previous run are
+    # skipped, and artists, albums and tracks already in the db are not inserted again.
+    try:
+        filenames = load.get_new_slices(
+            sessionmaker(bind=engine)(), load.get_slices(raw_data_dir)
+        )
+    except ValueError as error:
+        raise click.ClickException(str(error)) from error
+    logging.info("Found %d new slices.", len(filenames))
+    num_workers = max(min(num_workers, len(filenames)), 1)
+    rows_queue = multiprocessing.Queue(maxsize=2 * num_workers)
+    metrics_queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(
+            target=run_instrumented,
+            args=(
+                f"parser-{i}",
+                metrics_queue,
+                profile,
+                load.parse_slices,
+                filenames[i::num_workers],
+                rows_queue,
+            ),
+        )
+        for i in range(num_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        with profiled(
+            None if profile is None else os.path.join(profile, "writer.pstats")
+        ):
+            loaded = load.write_rows(
+                db_url, rows_queue, processes, commit_every=commit_every
+            )
+    except Exception as error:
+        # The parsers would wait forever for the writer to take their rows.
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        raise click.ClickException(f"Writing to the db failed: {error}") from error
+
+    # Empty the queue before joining, otherwise the workers can't exit.
+    collect_metrics(metrics_queue, processes)
+    for process in processes:
+        process.join()
+    if any(process.exitcode for process in processes):
+        raise click.ClickException("A parser failed. See the traceback above.")
+    logging.info("Done loading %d slices!", len(loaded))
+
+    logging.info("Creating indices...")
+    load.create_indices(engine)
+    logging.info("Done creating indices!")
+
+    if remove_single:
+        logging.info("Removing single tracks...")
+        load.remove_unique_tracks(sessionmaker(bind=engine)())  # add this as an option.
+        logging.info("Done removing single tracks!")
+
+    if cache_dir is not None:
+        from song2vec.cache import ArtifactCache, db_fingerprint
+
+        removed = ArtifactCache(cache_dir).invalidate(db_url, db_fingerprint(engine))
+        logging.info("Removed %d stale entries from the cache.", removed)
+
+    click.echo(METRICS.report(), err=True)
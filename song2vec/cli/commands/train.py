@@ -0,0 +1,339 @@
+"""Command to train models."""
+# This is a Click convention. Heavy imports go in the command so that they are only
+# imported when the command runs.
+# pylint: disable=import-outside-toplevel
+from typing import Optional
+
+import click
+
+
+@click.command()
+@click.option(
+    "--db-url",
+    type=str,
+    default="sqlite:///data/db",
+    help="URL to the database for Sqlalchemy (e.g. sqlite:///data/db)",
+)
+@click.option(
+    "--checkpoint",
+    type=str,
+    default="data/checkpoint",
+    help="Directory to save the trained model to.",
+)
+@click.option(
+    "--checkpoint-every",
+    type=int,
+    default=0,
+    help="Also save the model every this many steps, in the background, so training "
+    "can be resumed with --resume. 0 to only save at the end.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Resume training from where the run that saved --checkpoint was interrupted. "
+    "The playlists in the db must not have changed since. The model, --batch-size and "
+    "--max-tokens of the interrupted run are used.",
+)
+@click.option(
+    "--warm-start",
+    type=str,
+    default=None,
+    help="Checkpoint to continue training from. Only playlists loaded after the "
+    "checkpoint was saved are trained on, and new tracks are added to the model.",
+)
+@click.option(
+    "--model",
+    "model_name",
+    type=click.Choice(["cbow", "skip-gram", "sharded-skip-gram"]),
+    default="cbow",
+    help="Continous bag of words over whole playlists, or skip-gram over a sliding "
+    "window of the ordered playlists. sharded-skip-gram trains skip-gram embeddings "
+    "with negative sampling in memory-mapped tables, for vocabularies that don't fit "
+    "in memory. It is optimized with Adagrad, which needs a larger --learning-rate, "
+    "e.g. 0.1. Ignored with --warm-start.",
+)
+@click.option(
+    "--num-shards",
+    type=int,
+    default=8,
+    help="Number of files the tables of sharded-skip-gram are split into.",
+)
+@click.option("--window", type=int, default=5, help="Skip-gram window size.")
+@click.option(
+    "--batch-size", type=int, default=32, help="Playlists per skip-gram batch."
+)
+@click.option(
+    "--max-tokens",
+    type=int,
+    default=0,
+    help="Batch playlists of similar lengths with up to this many tracks per batch, "
+    "instead of one playlist (cbow) or --batch-size playlists (skip-gram) per batch. 0 "
+    "to disable.",
+)
+@click.option(
+    "--prefetch",
+    "prefetch_depth",
+    type=int,
+    default=4,
+    help="Number of batches to fetch ahead in background threads. 0 to disable.",
+)
+@click.option("--embedding-dim", type=int, default=64, help="Size of the embeddings.")
+@click.option("--epochs", type=int, default=1, help="Number of epochs to train for.")
+@click.option("--learning-rate", type=float, default=1e-3, help="Learning rate.")
+@click.option(
+    "--profile",
+    type=str,
+    default=None,
+    help="Directory to dump cProfile stats of the training loop to.",
+)
+@click.option(
+    "--parquet-dir",
+    type=str,
+    default=None,
+    help="Read the playlists from Parquet files written by load-playlists instead of "
+    "the db.",
+)
+@click.option(
+    "--cache-dir",
+    type=str,
+    default=None,
+    help="Directory to cache the vocabulary in, so it is only built again when the db "
+    "changes.",
+)
+def train(
+    db_url: str,
+    checkpoint: str,
+    checkpoint_every: int,
+    resume: bool,
+    warm_start: str,
+    model_name: str,
+    num_shards: int,
+    window: int,
+    batch_size: int,
+    max_tokens: int,
+    prefetch_depth: int,
+    embedding_dim: int,
+    epochs: int,
+    learning_rate: float,
+    profile: Optional[str],
+    parquet_dir: Optional[str],
+    cache_dir: Optional[str],
+):
+    """Train a continous bag of words or skip-gram model on the playlists in the db."""
+    import functools
+    import logging
+    import os
+    import tempfile
+
+    from torch import optim
+
+    from song2vec import training
+    from song2vec.checkpoint import AsyncSaver, vocabulary_fingerprint
+    from song2vec.data.datasets import MillionPlaylistDataset
+    from song2vec.data.sampler import BucketBatchSampler
+    from song2vec.instrumentation import METRICS, profiled
+    from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+    from song2vec.models.sharded_embedding import ShardedEmbedding
+    from song2vec.models.skip_gram import SkipGram
+
+    logging.basicConfig(
+        format="%(asctime)s:%(levelname)s:%(name)s:%(message)s", level=logging.INFO
+    )
+    if parquet_dir is None:
+        cache = None
+        if cache_dir is not None:
+            from song2vec.cache import ArtifactCache
+
+            cache = ArtifactCache(cache_dir)
+        make_dataset = functools.partial(MillionPlaylistDataset, db_url, cache=cache)
+    else:
+        from song2vec.data.parquet import ParquetPlaylistDataset
+
+        make_dataset = functools.partial(ParquetPlaylistDataset, parquet_dir)
+
+    profile_path = None
+    if profile is not None:
+        os.makedirs(profile, exist_ok=True)
+        profile_path = os.path.join(profile, "train.pstats")
+
+    if model_name == "sharded-skip-gram" and warm_start is None:
+        if resume or checkpoint_every or max_tokens:
+            raise click.UsageError(
+                "--model sharded-skip-gram can't be used with --resume, "
+                "--checkpoint-every or --max-tokens."
+            )
+        dataset = make_dataset()
+        keys = dataset.keys_after(-1)
+        logging.info("Training on %d playlists...", len(keys))
+        vocab_size = len(dataset.multi_hot_encoder.vocabulary)
+        parent = os.path.dirname(os.path.abspath(checkpoint))
+        os.makedirs(parent, exist_ok=True)
+        METRICS.reset()
+        # The tables are only needed until they are exported to the checkpoint, and are
+        # next to it since they are as large.
+        with tempfile.TemporaryDirectory(dir=parent) as tables_dir:
+            inputs = ShardedEmbedding(
+                os.path.join(tables_dir, "inputs"),
+                vocab_size,
+                embedding_dim,
+                num_shards=num_shards,
+                learning_rate=learning_rate,
+            )
+            outputs = ShardedEmbedding(
+                os.path.join(tables_dir, "outputs"),
+                vocab_size,
+                embedding_dim,
+                num_shards=num_shards,
+                learning_rate=learning_rate,
+                init_std=0.01,
+            )
+            with profiled(profile_path):
+                losses = training.fit_sharded_skip_gram(
+                    inputs,
+                    outputs,
+                    dataset,
+                    keys,
+                    window=window,
+                    epochs=epochs,
+                    batch_size=batch_size,
+                    prefetch_depth=prefetch_depth,
+                )
+            logging.info("Done training! Losses: %s", losses)
+            click.echo(METRICS.report(), err=True)
+            last_pid = max((int(key) for key in keys), default=-1)
+            training.save_sharded_checkpoint(
+                checkpoint,
+                inputs,
+                outputs,
+                dataset.multi_hot_encoder,
+                last_pid,
+                window,
+            )
+        logging.info("Saved checkpoint to %s.", checkpoint)
+        return
+
+    start = (0, 0)
+    position = None
+    if resume:
+        logging.info("Resuming from checkpoint...")
+        position = training.checkpoint_position(checkpoint)
+        if position is None:
+            raise click.UsageError(f"{checkpoint} is from a run that finished.")
+        model, multi_hot_encoder, last_pid = training.load_checkpoint(checkpoint)
+        dataset = make_dataset(multi_hot_encoder=multi_hot_encoder)
+        start = (position["epoch"], position["batch"])
+    elif warm_start is None:
+        dataset = make_dataset()
+        vocab_size = len(dataset.multi_hot_encoder.vocabulary)
+        if model_name == "skip-gram":
+            model = SkipGram(vocab_size, embedding_dim, window=window)
+        else:
+            model = ContinousBagOfWords(vocab_size, embedding_dim)
+        last_pid = -1
+    else:
+        logging.info("Loading checkpoint...")
+        model, multi_hot_encoder, last_pid = training.load_checkpoint(warm_start)
+        dataset = make_dataset(multi_hot_encoder=multi_hot_encoder)
+        num_new = multi_hot_encoder.extend(dataset.track_uris())
+        model.grow(len(multi_hot_encoder.vocabulary))
+        logging.info("Added %d new tracks to the model.", num_new)
+
+    keys = dataset.keys_after(last_pid)
+    # Positions are only meaningful for the same keys, and playlists may have been
+    # loaded since the checkpoint was saved.
+    keys_fingerprint = vocabulary_fingerprint(keys)
+    if resume and position.get("keys") != keys_fingerprint:
+        raise click.UsageError(
+            f"The playlists in the db changed since {checkpoint} was saved. Train "
+            "from scratch, or with --warm-start to only add the new playlists."
+        )
+    # Which playlists are in each batch also depends on these, so resuming uses the
+    # ones of the interrupted run. The model is restored from the checkpoint.
+    batching = {"batch_size": batch_size, "max_tokens": max_tokens, "seed": 0}
+    if resume:
+        if position.get("batching") is None:
+            raise click.UsageError(
+                f"{checkpoint} was saved without its batching options."
+            )
+        for name, value in position["batching"].items():
+            if value != batching[name]:
+                logging.warning(
+                    "Using the %s of the interrupted run, %s, instead of %s.",
+                    name,
+                    value,
+                    batching[name],
+                )
+        batching = position["batching"]
+    logging.info("Training on %d playlists...", len(keys))
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    if resume and not training.load_optimizer_state(checkpoint, optimizer):
+        logging.warning("%s has no optimizer state, starting it over.", checkpoint)
+    sampler = None
+    if batching["max_tokens"]:
+        # The batches only depend on the keys, the epoch and the seed, so resuming
+        # gets the same batches.
+        sampler = BucketBatchSampler(
+            keys,
+            dataset.playlist_lengths(),
+            batching["max_tokens"],
+            seed=batching["seed"],
+        )
+    saver = AsyncSaver()
+    num_steps = 0
+
+    def on_step(epoch: int, batch: int):
+        nonlocal num_steps
+        num_steps += 1
+        if checkpoint_every and num_steps % checkpoint_every == 0:
+            # `last_pid` only changes once all the keys are trained on.
+            training.save_checkpoint(
+                checkpoint,
+                model,
+                dataset.multi_hot_encoder,
+                last_pid,
+                position={
+                    "epoch": epoch,
+                    "batch": batch,
+                    "keys": keys_fingerprint,
+                    "batching": batching,
+                },
+                saver=saver,
+                optimizer=optimizer,
+            )
+
+    METRICS.reset()
+    with profiled(profile_path):
+        if isinstance(model, SkipGram):
+            losses = training.fit_skip_gram(
+                model,
+                dataset,
+                keys,
+                epochs=epochs,
+                learning_rate=learning_rate,
+                batch_size=batching["batch_size"],
+                prefetch_depth=prefetch_depth,
+                start=start,
+                on_step=on_step,
+                sampler=sampler,
+                optimizer=optimizer,
+            )
+        else:
+            losses = training.fit(
+                model,
+                dataset,
+                keys,
+                epochs=epochs,
+                learning_rate=learning_rate,
+                prefetch_depth=prefetch_depth,
+                start=start,
+                on_step=on_step,
+                sampler=sampler,
+                optimizer=optimizer,
+            )
+    saver.close()
+    logging.info("Done training! Losses: %s", losses)
+    click.echo(METRICS.report(), err=True)
+
+    last_pid = max((int(key) for key in keys), default=last_pid)
+    training.save_checkpoint(checkpoint, model, dataset.multi_hot_encoder, last_pid)
+    logging.info("Saved checkpoint to %s.", checkpoint)
@@ -0,0 +1,36 @@
+"""Click group that imports its commands on demand, so that running one command doesn't
+import the dependencies of all the others.
+"""
+import importlib
+from typing import Dict, List, Optional
+
+import click
+
+
+class LazyGroup(click.Group):
+    """Group whose commands are imported the first time they are used.
+
+    Attributes:
+        lazy_commands: maps command names to the import path of the command, as
+            "module:attribute".
+    """
+
+    lazy_commands: Dict[str, str]
+
+    def __init__(self, *args, lazy_commands: Optional[Dict[str, str]] = None, **kwargs):
+        """Initiate an instance of the class.
+
+        Arguments:
+            See class docstring and `click.Group`.
+        """
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> List[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_commands])
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> Optional[click.Command]:
+        if cmd_name in self.lazy_commands:
+            module_name, attribute = self.lazy_commands[cmd_name].split(":")
+            return getattr(importlib.import_module(module_name), attribute)
+        return super().get_command(ctx, cmd_name)
@@ -1,25 +1,119 @@
 """Functions to load data into the db. I think a functional approach makes more sense
 when processing data.
 """
+import gzip
 import json
 import os
-from typing import Callable, Generator, Iterable, List, Set, Type
+import queue as queue_module
+import zipfile
+from typing import BinaryIO, Dict, Generator, List, Set
 
 import sqlalchemy
 from tqdm import tqdm
 
 from song2vec import db
+from song2vec.instrumentation import METRICS
 
 from . import settings
 
 
 def get_slices(raw_data_dir: str) -> List[str]:
-    """Get files names containing the slices of the data."""
-    return [
-        os.path.join(raw_data_dir, filename)
-        for filename in os.listdir(raw_data_dir)
-        if settings.DATA_FILE_RE.match(filename)
-    ]
+    """Get files names containing the slices of the data. `raw_data_dir` can also be the
+    zip archive of the dataset, in which case the slices are members of the archive,
+    joined to its path by `settings.ARCHIVE_SEPARATOR`. A slice that is in several
+    files, e.g. compressed and not, is only returned once, see
+    `settings.SLICE_EXTENSIONS`.
+    """
+    if os.path.isfile(raw_data_dir) and zipfile.is_zipfile(raw_data_dir):
+        with zipfile.ZipFile(raw_data_dir) as archive:
+            filenames = [
+                f"{raw_data_dir}{settings.ARCHIVE_SEPARATOR}{member}"
+                for member in archive.namelist()
+                if settings.DATA_FILE_RE.match(os.path.basename(member))
+            ]
+    else:
+        filenames = [
+            os.path.join(raw_data_dir, filename)
+            for filename in os.listdir(raw_data_dir)
+            if settings.DATA_FILE_RE.match(filename)
+        ]
+
+    slices: Dict[str, str] = {}
+    for path in sorted(
+        filenames,
+        key=lambda x: settings.SLICE_EXTENSIONS.index(os.path.splitext(x)[1]),
+    ):
+        slices.setdefault(get_slice_name(path), path)
+    return [path for path in filenames if slices[get_slice_name(path)] == path]
+
+
+def get_slice_name(slice_path: str) -> str:
+    """Name of a slice regardless of where it is and how it is compressed, e.g.
+    "mpd.slice.0-999.json".
+    """
+    name = os.path.basename(slice_path.split(settings.ARCHIVE_SEPARATOR)[-1])
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def get_new_slices(session: sqlalchemy.orm.Session, filenames: List[str]) -> List[str]:
+    """Filter out the slices that have already been loaded into the db.
+
+    Arguments:
+        session: session connected to the db.
+        filenames: list of file paths that contain the dataset.
+
+    Returns:
+        The file paths whose name is not in the `slice` table.
+
+    Raises:
+        ValueError: if the db has playlists but no slices, i.e. it was loaded before
+            slices were recorded, so there is no way to tell which files are new.
+    """
+    loaded = {name for name, in session.query(db.Slice.name).all()}
+    if not loaded and session.query(db.Playlist.pid).first() is not None:
+        raise ValueError(
+            "The db has playlists but no record of the slices they were loaded from, "
+            "so it was loaded by an older version. Load the data into a new db to load "
+            "slices incrementally."
+        )
+    return [path for path in filenames if get_slice_name(path) not in loaded]
+
+
+def read_raw_slice(slice_path: str) -> bytes:
+    """Read the json of a slice, decompressing it in memory. Nothing is extracted to
+    disk.
+
+    Arguments:
+        slice_path: a path returned by `get_slices`. Files ending in ".gz" are gzipped
+            and files ending in ".zst" are compressed with zstd, which requires the
+            zstandard package.
+
+    Returns:
+        The uncompressed json.
+    """
+    if settings.ARCHIVE_SEPARATOR in slice_path:
+        archive_path, member = slice_path.split(settings.ARCHIVE_SEPARATOR)
+        with zipfile.ZipFile(archive_path) as archive, archive.open(member) as file:
+            return _decompress(file, slice_path)
+    with open(slice_path, "rb") as file:
+        return _decompress(file, slice_path)
+
+
+def _decompress(file: BinaryIO, slice_path: str) -> bytes:
+    """Read a file, decompressing it based on the suffix of its path."""
+    if slice_path.endswith(".gz"):
+        with gzip.GzipFile(fileobj=file) as gzip_file:
+            return gzip_file.read()
+    if slice_path.endswith(".zst"):
+        # pylint: disable=import-outside-toplevel
+        import zstandard
+
+        with zstandard.ZstdDecompressor().stream_reader(file) as zstd_file:
+            return zstd_file.readall()
+    return file.read()
 
 
 def create_artists(
@@ -120,39 +214,202 @@ def create_associations(
         for track in playlist["tracks"]:
             track_uri = track["track_uri"].split(":")[-1]
             playlist_id = playlist["pid"]
-            yield {"track_uri": track_uri, "playlist_id": playlist_id}
+            pos = track["pos"]
+            yield {"track_uri": track_uri, "playlist_id": playlist_id, "pos": pos}
+
+
+# Tables in the order they are inserted, with the functions that create their rows.
+# Tables with a uri are deduplicated by the writer since each parser only knows about
+# the rows it created.
+TABLES = {
+    db.Artist.__tablename__: (db.Artist, create_artists),
+    db.Album.__tablename__: (db.Album, create_albums),
+    db.Track.__tablename__: (db.Track, create_tracks),
+    db.Playlist.__tablename__: (db.Playlist, create_playlists),
+    db.Association.__tablename__: (db.Association, create_associations),
+}
+DEDUPLICATED_TABLES = (
+    db.Artist.__tablename__,
+    db.Album.__tablename__,
+    db.Track.__tablename__,
+)
+
+
+def read_slice(slice_path: str, ids: Dict[str, Set[str]]) -> Dict[str, List[dict]]:
+    """Parse a slice into the rows of each table.
 
+    Arguments:
+        slice_path: a path returned by `get_slices`.
+        ids: for each table, the ids of rows that were already created. Updated in place.
 
-def load_objects(
-    cls: db.Base,
-    db_url: str,
-    filenames: List[str],
-    create_objects: Callable[[List[dict], Set[str]], Iterable[db.Base]],
-) -> None:
-    """Load objects into the database. This function is mostly here to get rid of
-    boilerplate for multiprocessing.
+    Returns:
+        A dict mapping table names to rows.
+    """
+    with METRICS.timer("parse"):
+        with METRICS.timer("parse.read"):
+            raw = read_raw_slice(slice_path)
+        METRICS.count("parse.bytes", len(raw))
+        with METRICS.timer("parse.json"):
+            playlists = json.loads(raw)["playlists"]
+        with METRICS.timer("parse.create"):
+            return {
+                table: list(create_objects(playlists, ids[table]))
+                for table, (_, create_objects) in TABLES.items()
+            }
+
+
+def parse_slices(filenames: List[str], queue) -> None:
+    """Parse slices into rows and send them to `write_rows`. Puts a `None` in the queue
+    when done, even if parsing fails, so the writer knows when to stop.
 
     Arguments:
-        db_url: the url of the database (e.g. "sqlite:///data/db").
         filenames: list of file paths that contain the dataset.
-        create_objects: a callable like `create_albums`. Must take two arguments:
-            a list of playlists and a set of strings (usually ids of already-created
-            objects), and return Sqlalchemy ORM objects.
-        mapper: the object type.
+        queue: a `multiprocessing.Queue` shared with `write_rows`. Each item is the
+            name of a slice and a dict mapping table names to rows.
     """
-    ids = set()
-    engine = sqlalchemy.create_engine(db_url, connect_args={"timeout": 10})
-    # pylint: disable=invalid-name
-    Session = sqlalchemy.orm.sessionmaker(bind=engine)
-    for slice_path in tqdm(filenames):
-        session = Session()
-        with open(slice_path) as file:
-            data_slice = json.load(file)
-            # iterate through the generator so we don't keep all the files open.
-            objs = create_objects(data_slice["playlists"], ids)
-        session.bulk_insert_mappings(sqlalchemy.inspect(cls), objs)
-        session.commit()
+    ids = {table: set() for table in TABLES}
+    try:
+        for slice_path in filenames:
+            rows = read_slice(slice_path, ids)
+            with METRICS.timer("parse.queue_wait"):
+                queue.put((get_slice_name(slice_path), rows))
+    finally:
+        queue.put(None)
+
+
+def write_rows(
+    db_url: str, queue, parsers: List, commit_every: int = 10, timeout: float = 1.0
+) -> List[str]:
+    """Insert the rows sent by `parse_slices` processes. This is the only process that
+    writes to the db, so there is no lock contention, and slices are committed in large
+    transactions. Loaded slices are recorded in the same transaction as their rows.
+
+    Arguments:
+        db_url: the url of the database (e.g. "sqlite:///data/db").
+        queue: the queue the parsers put rows in.
+        parsers: the `multiprocessing.Process` of each parser, i.e. how many `None` to
+            wait for.
+        commit_every: number of slices per transaction.
+        timeout: seconds between checks that the parsers are alive.
+
+    Returns:
+        The base names of the slices that were loaded. Slices of transactions that
+        were committed before an error stay loaded.
+
+    Raises:
+        RuntimeError: if a parser exited without sending its `None`, e.g. killed by
+            the OOM killer.
+    """
+    engine = sqlalchemy.create_engine(db_url)
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    # Seed with the rows already in the db so new slices can be loaded into it.
+    ids = {
+        table: {x for x, in session.query(TABLES[table][0].uri).all()}
+        for table in DEDUPLICATED_TABLES
+    }
+    loaded = []
+    num_done = 0
+    progress = tqdm(unit="slice")
+    try:
+        with METRICS.timer("write"):
+            _begin_write(session)
+            while num_done < len(parsers):
+                # Parsers put their `None` in the queue before they exit, so if more
+                # of them were dead before waiting than sent one and nothing came, a
+                # parser died without finishing.
+                num_dead = sum(not parser.is_alive() for parser in parsers)
+                try:
+                    with METRICS.timer("write.queue_wait"):
+                        item = queue.get(timeout=timeout)
+                except queue_module.Empty:
+                    if num_dead > num_done:
+                        raise RuntimeError(
+                            "A parser exited before parsing all its slices."
+                        ) from None
+                    continue
+                if item is None:
+                    num_done += 1
+                    continue
+
+                name, rows = item
+                with METRICS.timer("write.insert"):
+                    for table, (cls, _) in TABLES.items():
+                        table_rows = rows[table]
+                        if table in ids:
+                            table_rows = [
+                                x for x in table_rows if x["uri"] not in ids[table]
+                            ]
+                            ids[table].update(x["uri"] for x in table_rows)
+                        session.bulk_insert_mappings(
+                            sqlalchemy.inspect(cls), table_rows
+                        )
+                        METRICS.count("write.rows", len(table_rows))
+                    session.bulk_insert_mappings(
+                        sqlalchemy.inspect(db.Slice), [{"name": name}]
+                    )
+                loaded.append(name)
+                progress.update()
+
+                if len(loaded) % commit_every == 0:
+                    with METRICS.timer("write.commit"):
+                        session.commit()
+                    _begin_write(session)
+            with METRICS.timer("write.commit"):
+                session.commit()
+    finally:
+        # Rolls back the transaction if inserting failed, releasing the write lock.
+        progress.close()
         session.close()
+    return loaded
+
+
+def _begin_write(session: sqlalchemy.orm.Session) -> None:
+    """Take the write lock of a SQLite db right away instead of on the first insert, so
+    nothing else can write to the db in the middle of a transaction.
+    """
+    if session.get_bind().dialect.name == "sqlite":
+        session.execute(sqlalchemy.text("BEGIN IMMEDIATE"))
+
+
+def add_missing_columns(engine: sqlalchemy.engine.Engine) -> List[str]:
+    """Add the columns that were added to the tables after a db was created, since
+    `create_all` only creates missing tables. Does nothing if they exist.
+
+    Returns:
+        The columns that were added, e.g. "association.pos".
+    """
+    added = []
+    columns = {
+        x["name"]
+        for x in sqlalchemy.inspect(engine).get_columns(db.Association.__tablename__)
+    }
+    if "pos" not in columns:
+        with engine.begin() as connection:
+            connection.execute(
+                sqlalchemy.text("ALTER TABLE association ADD COLUMN pos INTEGER")
+            )
+        added.append("association.pos")
+    return added
+
+
+def create_indices(engine: sqlalchemy.engine.Engine) -> None:
+    """Index the association table. We do this after loading the data because inserts
+    are faster without indices.
+
+    We don't use `sqlalchemy.Index` because it adds the index to the table metadata,
+    which breaks `create_all` when loading more than once in the same process.
+    """
+    with engine.begin() as connection:
+        connection.execute(
+            sqlalchemy.text(
+                "CREATE INDEX IF NOT EXISTS playlist_id ON association (playlist_id)"
+            )
+        )
+        connection.execute(
+            sqlalchemy.text(
+                "CREATE INDEX IF NOT EXISTS track_uri ON association (track_uri)"
+            )
+        )
 
 
 def remove_unique_tracks(session: sqlalchemy.orm.Session) -> None:
@@ -1,4 +1,12 @@
 import re
 
-# Format for data slices
-DATA_FILE_RE = re.compile(r"^mpd\.slice\.\d+-\d+\.json$")
+# Format for data slices, optionally compressed.
+DATA_FILE_RE = re.compile(r"^mpd\.slice\.\d+-\d+\.json(\.gz|\.zst)?$")
+
+# Extensions of the files a slice can be in. When a slice is in several files, only
+# the one with the first extension is loaded.
+SLICE_EXTENSIONS = (".json", ".gz", ".zst")
+
+# Separates the path of a zip archive from the name of a slice in it, e.g.
+# "spotify_million_playlist_dataset.zip::data/mpd.slice.0-999.json".
+ARCHIVE_SEPARATOR = "::"
@@ -1,4 +1,4 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import sqlalchemy
 from sqlalchemy import func
@@ -6,6 +6,8 @@ from torch import Tensor
 from torch.utils.data import Dataset
 
 from song2vec import db
+from song2vec.cache import ArtifactCache, db_fingerprint
+from song2vec.instrumentation import METRICS
 from song2vec.utils import MultiHotEncoder
 
 
@@ -16,15 +18,44 @@ class MillionPlaylistDataset(Dataset):
     db_url: str
     engine: sqlalchemy.engine.Engine
     Session: sqlalchemy.orm.Session
+    cache: Optional[ArtifactCache]
 
-    def __init__(self, db_url: str):
+    def __init__(
+        self,
+        db_url: str,
+        multi_hot_encoder: Optional[MultiHotEncoder] = None,
+        cache: Optional[ArtifactCache] = None,
+    ):
+        """Pass `multi_hot_encoder` to reuse the vocabulary of a trained model instead of
+        building one from all the tracks in the db. Pass `cache` to only build the
+        vocabulary and the playlist lengths again when the db has changed."""
         self.db_url = db_url
-        self.engine = sqlalchemy.create_engine(db_url)
+        self.cache = cache
+        # Batches can be fetched from background threads, see `prefetch`. Connections
+        # are still only used by one thread at a time.
+        connect_args = (
+            {"check_same_thread": False} if db_url.startswith("sqlite") else {}
+        )
+        self.engine = sqlalchemy.create_engine(db_url, connect_args=connect_args)
         self.Session = sqlalchemy.orm.sessionmaker(bind=self.engine)
+        if multi_hot_encoder is None and cache is not None:
+            vocabulary = cache.get_or_build(
+                "vocabulary",
+                db_url,
+                db_fingerprint(self.engine),
+                lambda: MultiHotEncoder(self.track_uris()).vocabulary,
+            )
+            multi_hot_encoder = MultiHotEncoder(vocabulary, sort=False)
+        elif multi_hot_encoder is None:
+            multi_hot_encoder = MultiHotEncoder(self.track_uris())
+        self.multi_hot_encoder = multi_hot_encoder
+
+    def track_uris(self) -> List[str]:
+        """Uris of all the tracks in the db."""
         session = self.Session()
-        self.multi_hot_encoder = MultiHotEncoder(
-            x for x, in session.query(db.Track.uri).all()
-        )
+        uris = [x for x, in session.query(db.Track.uri).all()]
+        session.close()
+        return uris
 
     def query_db(self, index: List[str]) -> List[List[str]]:
         session = self.Session()
@@ -39,20 +70,76 @@ class MillionPlaylistDataset(Dataset):
         session.close()
         return [res[key].split(",") for key in index if key in res]
 
+    def query_sequences(self, index: List[str]) -> List[List[str]]:
+        """Like `query_db`, but the tracks are in the order of the playlist. Rows loaded
+        before positions were stored have none, but the loader inserts the tracks of a
+        playlist in order, so their ids are in order too."""
+        session = self.Session()
+        res = {}
+        for playlist_id, track_uri in (
+            session.query(db.Association.playlist_id, db.Association.track_uri)
+            .filter(db.Association.playlist_id.in_(index))
+            .order_by(db.Association.playlist_id, db.Association.pos, db.Association.id)
+            .all()
+        ):
+            res.setdefault(playlist_id, []).append(track_uri)
+        session.close()
+        return [res[key] for key in index if key in res]
+
     @property
     def keys(self):
         session = self.Session()
         return [x for x, in session.query(db.Playlist.pid).all()]
 
+    def keys_after(self, pid: int) -> List[str]:
+        """Keys of the playlists with an id greater than `pid`. Playlist ids increase
+        from one slice to the next, so these are the playlists loaded after `pid`."""
+        session = self.Session()
+        keys = [
+            str(x)
+            for x, in session.query(db.Playlist.pid).filter(db.Playlist.pid > pid).all()
+        ]
+        session.close()
+        return keys
+
+    def playlist_lengths(self) -> Dict[str, int]:
+        """Number of tracks of each playlist, e.g. to batch playlists by length."""
+        if self.cache is None:
+            return self._count_tracks()
+        return self.cache.get_or_build(
+            "playlist_lengths",
+            self.db_url,
+            db_fingerprint(self.engine),
+            self._count_tracks,
+        )
+
+    def _count_tracks(self) -> Dict[str, int]:
+        session = self.Session()
+        lengths = {
+            str(playlist_id): count
+            for playlist_id, count in session.query(
+                db.Association.playlist_id, func.count(db.Association.track_uri)
+            )
+            .group_by(db.Association.playlist_id)
+            .all()
+        }
+        session.close()
+        return lengths
+
     def __getitem__(self, index) -> Tensor:
         """Index should be a string or a list of strings."""
-        single = isinstance(index, str)
-        if single:
-            index = [index]
-        ret = self.multi_hot_encoder.encode(token_lists=self.query_db(index))
-        if single:
-            return ret[0].coalesce()
-        return ret.coalesce()
+        with METRICS.timer("dataset"):
+            single = isinstance(index, str)
+            if single:
+                index = [index]
+            with METRICS.timer("dataset.query"):
+                token_lists = self.query_db(index)
+            METRICS.count("dataset.playlists", len(token_lists))
+            with METRICS.timer("dataset.encode"):
+                ret = self.multi_hot_encoder.encode(token_lists=token_lists)
+                if single:
+                    return ret[0].coalesce()
+                return ret.coalesce()
 
     def __len__(self) -> int:
         """Number of playlists in the db."""
@@ -0,0 +1,207 @@
+"""Turn track indices and uris back into names, artists and albums.
+
+Going through the relationships of `db.Track` takes one query per track and one more
+per relationship. `MetadataResolver` fetches a whole batch of tracks with their artist
+and album in a single joined query, and keeps recent results in an LRU cache.
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+
+import numpy as np
+import sqlalchemy
+
+from song2vec import db
+from song2vec.instrumentation import METRICS
+
+
+class TrackInfo(NamedTuple):
+    """Human readable description of a track."""
+
+    uri: str
+    name: Optional[str]
+    artist_uri: str
+    artist_name: str
+    album_uri: str
+    album_name: Optional[str]
+
+
+class TrackTable:
+    """All the tracks of the db in memory, stored by column. Artists and albums are
+    stored once and tracks refer to them by index, so the table is much smaller than a
+    `TrackInfo` per track.
+
+    Attributes:
+        uris: uri of each track.
+        names: name of each track.
+        artist_ids: index in `artists` of the artist of each track.
+        album_ids: index in `albums` of the album of each track.
+        artists: (uri, name) of each artist.
+        albums: (uri, name) of each album.
+        rows: row of each track uri.
+    """
+
+    uris: List[str]
+    names: List[Optional[str]]
+    artist_ids: np.ndarray
+    album_ids: np.ndarray
+    artists: List[tuple]
+    albums: List[tuple]
+    rows: Dict[str, int]
+
+    def __init__(self, tracks: Iterable[TrackInfo]):
+        """Initiate an instance of the class.
+
+        Arguments:
+            tracks: the tracks to store.
+        """
+        self.uris, self.names, artist_ids, album_ids = [], [], [], []
+        artists: Dict[tuple, int] = {}
+        albums: Dict[tuple, int] = {}
+        for track in tracks:
+            self.uris.append(track.uri)
+            self.names.append(track.name)
+            artist_ids.append(
+                artists.setdefault((track.artist_uri, track.artist_name), len(artists))
+            )
+            album_ids.append(
+                albums.setdefault((track.album_uri, track.album_name), len(albums))
+            )
+        self.artist_ids = np.array(artist_ids, dtype=np.int32)
+        self.album_ids = np.array(album_ids, dtype=np.int32)
+        self.artists = list(artists)
+        self.albums = list(albums)
+        self.rows = {uri: i for i, uri in enumerate(self.uris)}
+
+    def __getitem__(self, uri: str) -> TrackInfo:
+        row = self.rows[uri]
+        return TrackInfo(
+            self.uris[row],
+            self.names[row],
+            *self.artists[self.artist_ids[row]],
+            *self.albums[self.album_ids[row]],
+        )
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self.rows
+
+    def __len__(self) -> int:
+        return len(self.uris)
+
+
+class MetadataResolver:
+    """Look up the metadata of batches of tracks.
+
+    Attributes:
+        engine: engine of the db.
+        vocabulary: vocabulary of the encoder the model was trained with, used to turn
+            indices into uris.
+        cache_size: maximum number of tracks kept in `cache`.
+        cache: the most recently resolved tracks, least recently used first. Tracks
+            that aren't in the db are cached as `None`.
+        table: all the tracks, if they were loaded with `preload`.
+    """
+
+    engine: sqlalchemy.engine.Engine
+    vocabulary: Optional[Sequence[str]]
+    cache_size: int
+    cache: "OrderedDict[str, Optional[TrackInfo]]"
+    table: Optional[TrackTable]
+
+    def __init__(
+        self,
+        db_url: str,
+        vocabulary: Optional[Sequence[str]] = None,
+        cache_size: int = 100_000,
+        preload: bool = False,
+    ):
+        """Initiate an instance of the class.
+
+        Arguments:
+            db_url: url of the db.
+            preload: whether to load all the tracks in memory right away. See
+                `preload`.
+            See class docstring for the rest.
+        """
+        self.engine = sqlalchemy.create_engine(db_url)
+        self.Session = sqlalchemy.orm.sessionmaker(bind=self.engine)
+        self.vocabulary = vocabulary
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.table = None
+        if preload:
+            self.preload()
+
+    def query(self, uris: Optional[List[str]] = None) -> List[TrackInfo]:
+        """Fetch tracks with their artist and album in a single query.
+
+        Arguments:
+            uris: uris of the tracks to fetch. All the tracks if `None`.
+
+        Returns:
+            The tracks that are in the db, in no particular order.
+        """
+        with METRICS.timer("metadata.query"):
+            session = self.Session()
+            query = (
+                session.query(
+                    db.Track.uri,
+                    db.Track.name,
+                    db.Artist.uri,
+                    db.Artist.name,
+                    db.Album.uri,
+                    db.Album.name,
+                )
+                .join(db.Artist, db.Track.artist_uri == db.Artist.uri)
+                .join(db.Album, db.Track.album_uri == db.Album.uri)
+            )
+            if uris is not None:
+                query = query.filter(db.Track.uri.in_(uris))
+            tracks = [TrackInfo(*row) for row in query.all()]
+            session.close()
+        METRICS.count("metadata.queries")
+        return tracks
+
+    def preload(self) -> None:
+        """Load all the tracks in a `TrackTable`. Lookups no longer touch the db, so
+        tracks added to the db afterwards aren't found."""
+        self.table = TrackTable(self.query())
+        self.cache.clear()
+
+    def resolve(self, tracks: Iterable[Union[int, str]]) -> List[Optional[TrackInfo]]:
+        """Find the metadata of a batch of tracks with at most one query.
+
+        Arguments:
+            tracks: uris of tracks or their indices in `vocabulary`, e.g. an array of
+                indices returned by `inference.blocked_top_k`.
+
+        Returns:
+            The metadata of each track, in the same order, or `None` for tracks that
+            aren't in the db.
+        """
+        uris = [
+            self.vocabulary[x] if isinstance(x, (int, np.integer)) else x
+            for x in tracks
+        ]
+        if self.table is not None:
+            METRICS.count("metadata.hits", len(uris))
+            return [self.table[uri] if uri in self.table else None for uri in uris]
+
+        misses = list(dict.fromkeys(uri for uri in uris if uri not in self.cache))
+        METRICS.count("metadata.hits", len(uris) - len(misses))
+        METRICS.count("metadata.misses", len(misses))
+        found = {}
+        if misses:
+            found = {track.uri: track for track in self.query(misses)}
+
+        res = []
+        for uri in uris:
+            if uri in self.cache:
+                self.cache.move_to_end(uri)
+                res.append(self.cache[uri])
+            else:
+                res.append(found.get(uri))
+        for uri in misses:
+            self.cache[uri] = found.get(uri)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return res
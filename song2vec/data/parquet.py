@@ -0,0 +1,199 @@
+"""Columnar storage of the dataset as Parquet files, an alternative to the db for bulk
+reads. Each table is a directory with one file per slice, e.g.
+`association/mpd.slice.0-999.parquet`, so slices can be written in parallel without
+locks. URIs are dictionary encoded.
+
+Unlike the db, artists, albums and tracks are only deduplicated within the files
+written by the same process, so readers should deduplicate them.
+"""
+import os
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.instrumentation import METRICS
+from song2vec.utils import MultiHotEncoder
+
+URI = pa.dictionary(pa.int32(), pa.string())
+
+SCHEMAS = {
+    "artist": pa.schema([("uri", URI), ("name", pa.string())]),
+    "album": pa.schema([("uri", URI), ("name", pa.string())]),
+    "track": pa.schema(
+        [
+            ("uri", URI),
+            ("name", pa.string()),
+            ("album_uri", URI),
+            ("artist_uri", URI),
+        ]
+    ),
+    "playlist": pa.schema([("pid", pa.int64()), ("name", pa.string())]),
+    "association": pa.schema(
+        [("track_uri", URI), ("playlist_id", pa.int64()), ("pos", pa.int32())]
+    ),
+}
+
+# Written last, so a slice is only complete if it has a file in this table.
+MARKER_TABLE = "association"
+
+
+def get_path(parquet_dir: str, table: str, slice_path: str) -> str:
+    """Path to the file of a table for a slice of the dataset."""
+    # pylint: disable=import-outside-toplevel
+    from song2vec.cli.load import get_slice_name
+
+    name = os.path.splitext(get_slice_name(slice_path))[0]
+    return os.path.join(parquet_dir, table, f"{name}.parquet")
+
+
+def get_new_slices(parquet_dir: str, filenames: List[str]) -> List[str]:
+    """Filter out the slices that have already been written to `parquet_dir`."""
+    return [
+        path
+        for path in filenames
+        if not os.path.exists(get_path(parquet_dir, MARKER_TABLE, path))
+    ]
+
+
+def write_slice(parquet_dir: str, slice_path: str, rows: Dict[str, List[dict]]) -> None:
+    """Write the rows of a slice, as returned by `load.read_slice`, to Parquet files."""
+    with METRICS.timer("write"):
+        # `SCHEMAS` ends with `MARKER_TABLE`, so it is written last.
+        for table, schema in SCHEMAS.items():
+            _write_table(parquet_dir, table, slice_path, rows[table], schema)
+        METRICS.count("write.rows", sum(map(len, rows.values())))
+
+
+def _write_table(
+    parquet_dir: str, table: str, slice_path: str, rows: List[dict], schema: pa.Schema
+) -> None:
+    """Write the rows of one table to a file."""
+    os.makedirs(os.path.join(parquet_dir, table), exist_ok=True)
+    pq.write_table(
+        pa.Table.from_pylist(rows, schema=schema),
+        get_path(parquet_dir, table, slice_path),
+    )
+
+
+def write_slices(filenames: List[str], parquet_dir: str) -> None:
+    """Convert slices to Parquet files. Meant to be run in parallel processes, each
+    writing different slices.
+
+    Arguments:
+        filenames: list of file paths that contain the dataset.
+        parquet_dir: directory to write the tables to.
+    """
+    # pylint: disable=import-outside-toplevel
+    from song2vec.cli import load
+
+    ids = {table: set() for table in load.TABLES}
+    for slice_path in filenames:
+        write_slice(parquet_dir, slice_path, load.read_slice(slice_path, ids))
+
+
+def read_table(
+    parquet_dir: str,
+    table: str,
+    columns: Optional[List[str]] = None,
+    filter: Optional[ds.Expression] = None,  # pylint: disable=redefined-builtin
+) -> pa.Table:
+    """Read the columns of a table, only loading the rows that match `filter`. Filters
+    are pushed down to the files, so row groups that can't match are skipped.
+    """
+    dataset = ds.dataset(
+        os.path.join(parquet_dir, table), schema=SCHEMAS[table], format="parquet"
+    )
+    return dataset.to_table(columns=columns, filter=filter)
+
+
+class ParquetPlaylistDataset(MillionPlaylistDataset):
+    """Dataset to load the million playlist dataset from Parquet files written by
+    `load-playlists --parquet-dir`. Has the same interface as `MillionPlaylistDataset`.
+    """
+
+    parquet_dir: str
+
+    # pylint: disable=super-init-not-called
+    def __init__(
+        self, parquet_dir: str, multi_hot_encoder: Optional[MultiHotEncoder] = None
+    ):
+        """Pass `multi_hot_encoder` to reuse the vocabulary of a trained model instead of
+        building one from all the tracks."""
+        self.parquet_dir = parquet_dir
+        if multi_hot_encoder is None:
+            multi_hot_encoder = MultiHotEncoder(self.track_uris())
+        self.multi_hot_encoder = multi_hot_encoder
+
+    def query_db(self, index: List[str]) -> List[List[str]]:
+        pids = [int(key) for key in index]
+        associations = read_table(
+            self.parquet_dir,
+            "association",
+            columns=["playlist_id", "track_uri"],
+            filter=ds.field("playlist_id").isin(pids),
+        )
+        res = {}
+        for playlist_id, track_uri in zip(
+            associations["playlist_id"].to_pylist(),
+            associations["track_uri"].cast(pa.string()).to_pylist(),
+        ):
+            res.setdefault(playlist_id, []).append(track_uri)
+        return [res[pid] for pid in pids if pid in res]
+
+    def query_sequences(self, index: List[str]) -> List[List[str]]:
+        """Like `query_db`, but the tracks are in the order of the playlist."""
+        pids = [int(key) for key in index]
+        associations = read_table(
+            self.parquet_dir,
+            "association",
+            columns=["playlist_id", "track_uri", "pos"],
+            filter=ds.field("playlist_id").isin(pids),
+        ).sort_by([("playlist_id", "ascending"), ("pos", "ascending")])
+        res = {}
+        for playlist_id, track_uri in zip(
+            associations["playlist_id"].to_pylist(),
+            associations["track_uri"].cast(pa.string()).to_pylist(),
+        ):
+            res.setdefault(playlist_id, []).append(track_uri)
+        return [res[pid] for pid in pids if pid in res]
+
+    def track_uris(self) -> List[str]:
+        """Uris of all the tracks, without duplicates."""
+        uris = read_table(self.parquet_dir, "track", columns=["uri"])["uri"]
+        return pc.unique(uris.cast(pa.string())).to_pylist()
+
+    @property
+    def keys(self):
+        playlists = read_table(self.parquet_dir, "playlist", columns=["pid"])
+        return playlists["pid"].to_pylist()
+
+    def keys_after(self, pid: int) -> List[str]:
+        """Keys of the playlists with an id greater than `pid`."""
+        playlists = read_table(
+            self.parquet_dir, "playlist", columns=["pid"], filter=ds.field("pid") > pid
+        )
+        return [str(x) for x in playlists["pid"].to_pylist()]
+
+    def playlist_lengths(self) -> Dict[str, int]:
+        """Number of tracks of each playlist."""
+        counts = (
+            read_table(self.parquet_dir, "association", columns=["playlist_id"])
+            .group_by("playlist_id")
+            .aggregate([("playlist_id", "count")])
+        )
+        return dict(
+            zip(
+                map(str, counts["playlist_id"].to_pylist()),
+                counts["playlist_id_count"].to_pylist(),
+            )
+        )
+
+    def __len__(self) -> int:
+        """Number of playlists."""
+        return ds.dataset(
+            os.path.join(self.parquet_dir, "playlist"), format="parquet"
+        ).count_rows()
@@ -0,0 +1,55 @@
+"""Fetch batches in background threads so the trainer doesn't wait on the db."""
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Iterable, Iterator, TypeVar
+
+from song2vec.instrumentation import METRICS
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def prefetch(
+    fetch: Callable[[T], R],
+    items: Iterable[T],
+    depth: int = 4,
+    num_workers: int = 2,
+    timer: str = "prefetch.stall",
+) -> Iterator[R]:
+    """Yield `fetch(item)` for each item, in order, while up to `depth` of the next
+    items are fetched in a thread pool. Fetching the playlists and encoding them mostly
+    waits on the db, so it can overlap with training steps.
+
+    Arguments:
+        fetch: function that builds a batch, e.g. `dataset.__getitem__`. Must be safe
+            to call from several threads.
+        items: the arguments to `fetch`, e.g. the keys of each batch.
+        depth: maximum number of batches that are fetched ahead. 0 fetches each batch
+            when it is needed, without threads.
+        num_workers: number of threads.
+        timer: name of the timer in `METRICS` that measures how long the consumer
+            waits for batches. If it stays small, loading is off the critical path.
+
+    Yields:
+        The fetched batches.
+    """
+    if depth <= 0:
+        for item in items:
+            with METRICS.timer(timer):
+                batch = fetch(item)
+            yield batch
+        return
+
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures: Deque = deque(
+            executor.submit(fetch, item) for item in itertools.islice(iterator, depth)
+        )
+        while futures:
+            with METRICS.timer(timer):
+                batch = futures.popleft().result()
+            # Keep the queue full while the consumer uses this batch.
+            for item in itertools.islice(iterator, 1):
+                futures.append(executor.submit(fetch, item))
+            yield batch
@@ -0,0 +1,86 @@
+"""Batches of playlists of similar lengths, sized by their total number of tracks.
+
+Playlists range from a handful to hundreds of tracks, and a step costs about the same
+per track. Batches with a fixed number of playlists have very different costs, while
+batches with a fixed number of tracks have stable step times and memory use.
+"""
+import random
+from typing import Dict, List, Optional, Sequence
+
+
+class BucketBatchSampler:
+    """Group playlists into buckets by length and pack each bucket into batches with up
+    to `max_tokens` tracks. A playlist with more tracks is a batch on its own.
+
+    Attributes:
+        buckets: the keys of the playlists in each bucket.
+        lengths: the number of tracks of each playlist.
+        max_tokens: maximum total number of tracks in a batch.
+        shuffle: whether to shuffle the playlists of each bucket and the order of the
+            batches every epoch.
+        seed: random seed. The batches of an epoch only depend on the seed and the
+            epoch, so training can be resumed in the middle of an epoch.
+    """
+
+    buckets: List[List[str]]
+    lengths: Dict[str, int]
+    max_tokens: int
+    shuffle: bool
+    seed: int
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        lengths: Dict[str, int],
+        max_tokens: int,
+        boundaries: Optional[Sequence[int]] = None,
+        min_length: int = 2,
+        shuffle: bool = True,
+        seed: int = 0,
+    ):
+        """Initiate an instance of the class.
+
+        Arguments:
+            keys: the keys of the playlists to sample.
+            lengths: the number of tracks of each playlist, e.g. from
+                `MillionPlaylistDataset.playlist_lengths`.
+            boundaries: the smallest length of each bucket after the first. Powers of 2
+                by default.
+            min_length: playlists with fewer tracks are skipped, since they have no
+                examples.
+            See class docstring for the rest.
+        """
+        self.lengths = lengths
+        self.max_tokens = max_tokens
+        self.shuffle = shuffle
+        self.seed = seed
+        keys = [key for key in keys if lengths.get(key, 0) >= min_length]
+        if boundaries is None:
+            max_length = max((lengths[key] for key in keys), default=1)
+            boundaries = [2 ** i for i in range(1, max_length.bit_length() + 1)]
+        buckets: Dict[int, List[str]] = {}
+        for key in keys:
+            bucket = sum(1 for x in boundaries if lengths[key] >= x)
+            buckets.setdefault(bucket, []).append(key)
+        self.buckets = [buckets[x] for x in sorted(buckets)]
+
+    def batches(self, epoch: int = 0) -> List[List[str]]:
+        """The batches of keys of an epoch."""
+        rng = random.Random(f"{self.seed}-{epoch}")
+        batches = []
+        for bucket in self.buckets:
+            if self.shuffle:
+                bucket = rng.sample(bucket, len(bucket))
+            batch: List[str] = []
+            num_tokens = 0
+            for key in bucket:
+                if batch and num_tokens + self.lengths[key] > self.max_tokens:
+                    batches.append(batch)
+                    batch, num_tokens = [], 0
+                batch.append(key)
+                num_tokens += self.lengths[key]
+            if batch:
+                batches.append(batch)
+        if self.shuffle:
+            rng.shuffle(batches)
+        return batches
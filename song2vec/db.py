@@ -6,9 +6,11 @@ from sqlalchemy.orm import declarative_base, relationship
 Base = declarative_base()
 
 # Intermediate table for many-to-many relationships between tracks and playlists.
+# `pos` is the position of the track in the playlist.
 class Association(Base):
     __tablename__ = "association"
     id = Column(Integer, primary_key=True)
+    pos = Column(Integer)
     track_uri = Column(
         String,
         ForeignKey("track.uri", ondelete="CASCADE"),
@@ -82,7 +84,7 @@ class Track(Base):
 
 
 class Playlist(Base):
-    """A __unordered__ set of tracks.
+    """A list of tracks. The order is given by `Association.pos`.
 
     Fields:
         pid (Integer): unique identifier.
@@ -117,3 +119,20 @@ class Album(Base):
     uri = Column(String, primary_key=True)
     name = Column(String)
     tracks = relationship("Track", back_populates="album", cascade="all, delete")
+
+
+class Slice(Base):
+    """A file of the dataset that has already been loaded. Used to only load new
+    slices when the same data directory is loaded more than once.
+
+    Fields:
+        name (String): name of the slice file without compression suffixes (e.g.
+            "mpd.slice.0-999.json").
+    """
+
+    __tablename__ = "slice"
+
+    name = Column(String, primary_key=True)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} NAME: {self.name}>"
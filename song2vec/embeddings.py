@@ -0,0 +1,240 @@
+"""Embedding indexes of tracks, artists and albums, for similarity search.
+
+Artist and album embeddings are the mean of the embeddings of their tracks, weighted by
+how many playlists each track is in. They are computed for all artists and albums at
+once: tracks are sorted by artist (or album) and the embeddings of each run of tracks
+are summed with `np.add.reduceat`.
+
+Indexes are saved in the format of `song2vec.checkpoint`, so they are memory-mapped
+when loaded.
+"""
+import os
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import sqlalchemy
+import torch
+from sqlalchemy import func
+
+from song2vec import checkpoint, db
+from song2vec.cache import ArtifactCache, db_fingerprint
+from song2vec.inference import blocked_top_k
+from song2vec.instrumentation import METRICS
+
+# Kinds of indexes, and the column of `db.Track` that groups tracks for each.
+GROUP_COLUMNS = {"artist": db.Track.artist_uri, "album": db.Track.album_uri}
+
+
+def segment_means(
+    embeddings: np.ndarray, segments: np.ndarray, weights: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Weighted mean of the rows of each segment.
+
+    Arguments:
+        embeddings: `n x embedding_dim` array.
+        segments: the segment of each row, or -1 to ignore the row.
+        weights: the weight of each row.
+
+    Returns:
+        The id of each segment that has rows, sorted, and the mean of its rows. Segments
+        whose weights sum to 0 get the unweighted mean.
+    """
+    keep = segments >= 0
+    order = np.argsort(segments[keep], kind="stable")
+    sorted_segments = segments[keep][order]
+    sorted_embeddings = embeddings[keep][order]
+    sorted_weights = weights[keep][order].astype(np.float64)
+    if not len(sorted_segments):
+        return sorted_segments, np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+
+    starts = np.flatnonzero(np.r_[True, sorted_segments[1:] != sorted_segments[:-1]])
+    totals = np.add.reduceat(sorted_weights, starts)
+    sums = np.add.reduceat(sorted_embeddings * sorted_weights[:, None], starts)
+    unweighted = totals == 0
+    if unweighted.any():
+        counts = np.diff(np.r_[starts, len(sorted_segments)])
+        sums[unweighted] = np.add.reduceat(sorted_embeddings, starts)[unweighted]
+        totals[unweighted] = counts[unweighted]
+    means = sums / totals[:, None]
+    return sorted_segments[starts], means.astype(np.float32)
+
+
+def track_groups(
+    engine: sqlalchemy.engine.Engine, vocabulary: Sequence[str]
+) -> Dict[str, Tuple[List[str], np.ndarray]]:
+    """Find the artist and album of each track of a vocabulary with one query.
+
+    Returns:
+        For each kind in `GROUP_COLUMNS`, the uris of the groups and the index of the
+        group of each track in `vocabulary`, or -1 if the track isn't in the db.
+    """
+    indices = {uri: i for i, uri in enumerate(vocabulary)}
+    session = sqlalchemy.orm.sessionmaker(bind=engine)()
+    rows = session.query(db.Track.uri, *GROUP_COLUMNS.values()).all()
+    session.close()
+
+    res = {}
+    for column, kind in enumerate(GROUP_COLUMNS, 1):
+        group_ids: Dict[str, int] = {}
+        segments = np.full(len(vocabulary), -1, dtype=np.int64)
+        for row in rows:
+            if row[0] in indices:
+                segments[indices[row[0]]] = group_ids.setdefault(
+                    row[column], len(group_ids)
+                )
+        res[kind] = (list(group_ids), segments)
+    return res
+
+
+def track_frequencies(
+    engine: sqlalchemy.engine.Engine,
+    vocabulary: Sequence[str],
+    cache: Optional[ArtifactCache] = None,
+) -> np.ndarray:
+    """Number of playlists each track of a vocabulary is in. Counting scans the whole
+    association table, so the counts of all the tracks are kept in `cache`, if given,
+    until the db changes."""
+
+    def count() -> Dict[str, int]:
+        session = sqlalchemy.orm.sessionmaker(bind=engine)()
+        counts = (
+            session.query(
+                db.Association.track_uri, func.count(db.Association.playlist_id)
+            )
+            .group_by(db.Association.track_uri)
+            .all()
+        )
+        session.close()
+        return dict(counts)
+
+    if cache is None:
+        counts = count()
+    else:
+        counts = cache.get_or_build(
+            "track_frequencies", str(engine.url), db_fingerprint(engine), count
+        )
+    return np.array([counts.get(uri, 0) for uri in vocabulary], dtype=np.int64)
+
+
+def save_index(
+    path: str, embeddings: np.ndarray, vocabulary: List[str], metadata: dict
+) -> None:
+    """Save embeddings for similarity search. See `EmbeddingIndex`."""
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+    checkpoint.save(
+        path,
+        {
+            "embeddings": torch.from_numpy(np.ascontiguousarray(embeddings)),
+            "normalized": torch.from_numpy(normalized.astype(np.float32)),
+        },
+        vocabulary,
+        metadata,
+    )
+
+
+def build_indexes(
+    embeddings: np.ndarray,
+    vocabulary: List[str],
+    engine: sqlalchemy.engine.Engine,
+    output_dir: str,
+    cache: Optional[ArtifactCache] = None,
+) -> Dict[str, int]:
+    """Build the track, artist and album indexes of trained track embeddings.
+
+    Arguments:
+        embeddings: the embedding of each track of `vocabulary`.
+        vocabulary: the uri of each track.
+        engine: engine of the db with the artists and albums of the tracks.
+        output_dir: directory to save an index per kind to, e.g. `output_dir/artist`.
+        cache: cache for the number of playlists of each track.
+
+    Returns:
+        The number of rows of each index.
+    """
+    metadata = {"tracks_fingerprint": checkpoint.vocabulary_fingerprint(vocabulary)}
+    save_index(os.path.join(output_dir, "track"), embeddings, vocabulary, metadata)
+    sizes = {"track": len(vocabulary)}
+
+    with METRICS.timer("embeddings.query"):
+        frequencies = track_frequencies(engine, vocabulary, cache)
+        groups = track_groups(engine, vocabulary)
+    for kind, (uris, segments) in groups.items():
+        with METRICS.timer("embeddings.reduce"):
+            ids, means = segment_means(embeddings, segments, frequencies)
+        save_index(
+            os.path.join(output_dir, kind),
+            means,
+            [uris[i] for i in ids],
+            {**metadata, "kind": kind},
+        )
+        sizes[kind] = len(ids)
+    return sizes
+
+
+class EmbeddingIndex:
+    """Memory-mapped embeddings with cosine similarity search.
+
+    Attributes:
+        embeddings: the embedding of each row.
+        normalized: `embeddings` with rows of norm 1.
+        vocabulary: the uri of each row.
+        indices: the row of each uri.
+        metadata: metadata saved with the index.
+    """
+
+    embeddings: np.ndarray
+    normalized: np.ndarray
+    vocabulary: List[str]
+    indices: Dict[str, int]
+    metadata: dict
+
+    def __init__(self, path: str):
+        """Load an index saved with `save_index`.
+
+        Arguments:
+            path: directory of the index.
+        """
+        tensors, self.vocabulary, self.metadata = checkpoint.load(path)
+        self.embeddings = tensors["embeddings"].numpy()
+        self.normalized = tensors["normalized"].numpy()
+        self.indices = {uri: i for i, uri in enumerate(self.vocabulary)}
+
+    def __len__(self) -> int:
+        return len(self.vocabulary)
+
+    def most_similar(
+        self, queries: Sequence[Union[str, int]], k: int = 10, block_size: int = 65536
+    ) -> List[List[Tuple[str, float]]]:
+        """Find the most similar rows to each query.
+
+        Arguments:
+            queries: uris or rows of the index.
+            k: number of results per query. The query itself is excluded.
+            block_size: number of rows compared at once, to bound memory.
+
+        Returns:
+            The uri and cosine similarity of the results of each query, most similar
+            first.
+        """
+        rows = np.array(
+            [self.indices[x] if isinstance(x, str) else x for x in queries],
+            dtype=np.int64,
+        )
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return [[] for _ in queries]
+        best_rows, best_scores = blocked_top_k(
+            self.normalized[rows],
+            self.normalized,
+            k,
+            exclude=(np.arange(len(rows)), rows),
+            block_size=block_size,
+        )
+        return [
+            [
+                (self.vocabulary[row], float(score))
+                for row, score in zip(rows_i, scores_i)
+            ]
+            for rows_i, scores_i in zip(best_rows, best_scores)
+        ]
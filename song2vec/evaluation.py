@@ -0,0 +1,298 @@
+"""Evaluate models on playlist continuation, like the RecSys Challenge 2018.
+
+The first tracks of each playlist are given to the model as seeds and the rest are held
+out. The model recommends tracks that aren't seeds, and the recommendations are scored
+against the held out tracks with R-precision, NDCG and recommended songs clicks. Only
+exact track matches count, there is no partial credit for the artist.
+
+Scoring runs in a process pool. The weights are put in shared memory once instead of
+being pickled for each worker.
+"""
+import multiprocessing
+import random
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.inference import blocked_top_k
+from song2vec.instrumentation import METRICS
+from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+from song2vec.models.skip_gram import SkipGram
+
+# A playlist split into the indices of its seeds and of its held out tracks.
+Example = Tuple[np.ndarray, np.ndarray]
+
+# Arrays of the process, attached to shared memory by `_init_worker`.
+_WEIGHTS: Dict[str, np.ndarray] = {}
+_BLOCKS: List[SharedMemory] = []
+
+
+def r_precision(recommended: Sequence[int], relevant: Set[int]) -> float:
+    """Fraction of the first `len(relevant)` recommendations that are relevant."""
+    hits = sum(1 for x in recommended[: len(relevant)] if x in relevant)
+    return hits / len(relevant)
+
+
+def ndcg(recommended: Sequence[int], relevant: Set[int]) -> float:
+    """Normalized discounted cumulative gain of the recommendations."""
+    gains = np.array([x in relevant for x in recommended], dtype=np.float64)
+    discounts = 1 / np.log2(np.maximum(np.arange(1, len(recommended) + 1), 2))
+    dcg = gains @ discounts
+    idcg = discounts[: min(len(relevant), len(recommended))].sum()
+    return dcg / idcg if idcg else 0.0
+
+
+def clicks(recommended: Sequence[int], relevant: Set[int]) -> int:
+    """Number of refreshes of 10 recommendations until a relevant track shows up. 51 if
+    none of them are relevant, as in the challenge."""
+    for i, x in enumerate(recommended):
+        if x in relevant:
+            return i // 10
+    return 51
+
+
+def export_weights(
+    model: Union[ContinousBagOfWords, SkipGram]
+) -> Dict[str, np.ndarray]:
+    """Copy the weights needed to score tracks to NumPy arrays.
+
+    Arguments:
+        model: a trained model.
+
+    Returns:
+        `embeddings`, the input vector of each track, and `weights` and `bias`, the
+        output layer. Both matrices are `vocab_size x embedding_dim`.
+    """
+    embeddings = model.embeddings.weight.detach().numpy()
+    if isinstance(model, ContinousBagOfWords):
+        embeddings = embeddings.T
+    return {
+        "embeddings": np.ascontiguousarray(embeddings, dtype=np.float32),
+        "weights": model.linear.weight.detach().numpy().astype(np.float32),
+        "bias": model.linear.bias.detach().numpy().astype(np.float32),
+    }
+
+
+def embedding_weights(embeddings: np.ndarray) -> Dict[str, np.ndarray]:
+    """Weights to score tracks by the dot product of their embedding with the mean of
+    the seeds, for embeddings that don't come with an output layer."""
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    return {
+        "embeddings": embeddings,
+        "weights": embeddings,
+        "bias": np.zeros(len(embeddings), dtype=np.float32),
+    }
+
+
+def recommend(
+    seeds: List[np.ndarray],
+    weights: Dict[str, np.ndarray],
+    num_recommendations: int,
+    block_size: int = 16384,
+) -> np.ndarray:
+    """Recommend tracks for a batch of playlists with a matrix product. The tracks are
+    scored `block_size` at a time, so memory doesn't grow with the vocabulary.
+
+    Arguments:
+        seeds: the indices of the seeds of each playlist.
+        weights: see `export_weights`.
+        num_recommendations: number of tracks to recommend for each playlist.
+        block_size: see `inference.blocked_top_k`.
+
+    Returns:
+        A `len(seeds) x num_recommendations` array of track indices, best first. Seeds
+        are never recommended.
+    """
+    embeddings = weights["embeddings"]
+    contexts = np.zeros((len(seeds), embeddings.shape[1]), dtype=np.float32)
+    for i, seeds_i in enumerate(seeds):
+        if len(seeds_i):
+            contexts[i] = embeddings[seeds_i].mean(axis=0)
+    rows = np.repeat(np.arange(len(seeds)), [len(x) for x in seeds])
+    exclude = (rows, np.concatenate(seeds).astype(np.int64))
+    top, _ = blocked_top_k(
+        contexts,
+        weights["weights"],
+        min(num_recommendations, len(weights["weights"])),
+        bias=weights["bias"],
+        exclude=exclude,
+        block_size=block_size,
+    )
+    return top
+
+
+def score_examples(
+    examples: List[Example],
+    weights: Dict[str, np.ndarray],
+    num_recommendations: int,
+) -> np.ndarray:
+    """Compute the metrics of a batch of playlists.
+
+    Returns:
+        A `len(examples) x 3` array with the R-precision, NDCG and clicks of each
+        playlist.
+    """
+    recommendations = recommend(
+        [seeds for seeds, _ in examples], weights, num_recommendations
+    )
+    res = np.zeros((len(examples), 3))
+    for i, (_, holdout) in enumerate(examples):
+        recommended = recommendations[i].tolist()
+        relevant = set(holdout.tolist())
+        res[i] = (
+            r_precision(recommended, relevant),
+            ndcg(recommended, relevant),
+            clicks(recommended, relevant),
+        )
+    return res
+
+
+def split_playlists(
+    sequences: List[List[str]], indices: Dict[str, int], num_seeds: int
+) -> List[Example]:
+    """Split playlists into seeds and held out tracks. Playlists that have no tracks left
+    to hold out are skipped.
+
+    Arguments:
+        sequences: the tracks of each playlist, in order.
+        indices: index of each track in the vocabulary of the model.
+        num_seeds: number of tracks at the start of each playlist to use as seeds.
+
+    Returns:
+        The indices of the seeds and of the held out tracks of each playlist. Seeds the
+        model doesn't know are dropped. Held out tracks it doesn't know get negative
+        indices, so they count as relevant but can never be recommended.
+    """
+    examples = []
+    for sequence in sequences:
+        if len(sequence) <= num_seeds:
+            continue
+        seeds = [indices[x] for x in sequence[:num_seeds] if x in indices]
+        holdout = [indices.get(x, -1 - i) for i, x in enumerate(sequence[num_seeds:])]
+        examples.append(
+            (np.array(seeds, dtype=np.int64), np.array(holdout, dtype=np.int64))
+        )
+    return examples
+
+
+def share(arrays: Dict[str, np.ndarray]) -> Tuple[List[SharedMemory], dict]:
+    """Copy arrays to shared memory.
+
+    Returns:
+        The shared memory blocks, which must be kept open and unlinked when done, and
+        the specs to pass to `attach`.
+    """
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        block = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def attach(specs: dict) -> Tuple[List[SharedMemory], Dict[str, np.ndarray]]:
+    """Open arrays shared with `share` without copying them."""
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(specs: dict) -> None:
+    """Attach a worker of the pool to the shared weights."""
+    global _BLOCKS, _WEIGHTS  # pylint: disable=global-statement
+    _BLOCKS, _WEIGHTS = attach(specs)
+
+
+def _score_in_worker(args: Tuple[List[Example], int]) -> np.ndarray:
+    examples, num_recommendations = args
+    return score_examples(examples, _WEIGHTS, num_recommendations)
+
+
+def evaluate(
+    weights: Dict[str, np.ndarray],
+    dataset: MillionPlaylistDataset,
+    keys: List[str],
+    num_seeds: int = 5,
+    num_recommendations: int = 500,
+    batch_size: int = 64,
+    num_workers: int = 1,
+) -> Dict[str, float]:
+    """Evaluate a model on some of the playlists of a dataset.
+
+    Arguments:
+        weights: see `export_weights`.
+        dataset: the dataset to get the playlists from. Its encoder must be the one the
+            model was trained with.
+        keys: the keys of the playlists to evaluate on.
+        num_seeds: see `split_playlists`.
+        num_recommendations: number of tracks to recommend for each playlist. 500 in
+            the challenge.
+        batch_size: number of playlists scored at once.
+        num_workers: number of processes. With 1, everything runs in this process.
+
+    Returns:
+        The number of playlists evaluated and the mean of each metric.
+    """
+    indices = dataset.multi_hot_encoder.indices
+
+    def batches() -> Iterator[Tuple[List[Example], int]]:
+        for i in range(0, len(keys), batch_size):
+            with METRICS.timer("evaluate.query"):
+                sequences = dataset.query_sequences(keys[i : i + batch_size])
+            examples = split_playlists(sequences, indices, num_seeds)
+            if examples:
+                yield examples, num_recommendations
+
+    results = []
+    with METRICS.timer("evaluate"):
+        if num_workers <= 1:
+            for examples, _ in batches():
+                results.append(score_examples(examples, weights, num_recommendations))
+        else:
+            blocks, specs = share(weights)
+            try:
+                with multiprocessing.Pool(
+                    num_workers, initializer=_init_worker, initargs=(specs,)
+                ) as pool:
+                    results = list(pool.imap(_score_in_worker, batches()))
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+    scores = np.concatenate(results) if results else np.zeros((0, 3))
+    METRICS.count("evaluate.playlists", len(scores))
+
+    means = scores.mean(axis=0) if len(scores) else np.full(3, np.nan)
+    return {
+        "playlists": len(scores),
+        "r_precision": float(means[0]),
+        "ndcg": float(means[1]),
+        "clicks": float(means[2]),
+    }
+
+
+def sample_keys(
+    dataset: MillionPlaylistDataset,
+    num_playlists: int,
+    after_pid: int = -1,
+    seed: Optional[int] = 0,
+) -> List[str]:
+    """Sample the keys of playlists to evaluate on.
+
+    Arguments:
+        dataset: the dataset to sample from.
+        num_playlists: number of keys to sample. All the keys if there aren't enough.
+        after_pid: only sample playlists with a larger id, e.g. the ones that were
+            loaded after training.
+        seed: random seed.
+    """
+    keys = dataset.keys_after(after_pid)
+    if len(keys) <= num_playlists:
+        return keys
+    return random.Random(seed).sample(keys, num_playlists)
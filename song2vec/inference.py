@@ -0,0 +1,357 @@
+"""Recommend tracks for contexts of tracks with NumPy only, to serve trained models.
+
+Calling the model's `forward` builds a sparse multi-hot tensor for each context, tracks
+gradients and computes the log-softmax over the whole vocabulary, only to keep the best
+few tracks. `InferenceEngine` mean-pools the embeddings of the context, computes the
+logits one block of tracks at a time, and only sorts the best `k` of each block. The
+softmax doesn't change the order of the tracks, so it is skipped.
+
+Concurrent requests are scored together by `MicroBatcher`, since a matrix product for a
+batch of contexts costs about as much as for one.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from song2vec import checkpoint
+from song2vec.instrumentation import METRICS
+
+# A context is the uris, or the indices in the vocabulary, of some tracks.
+Context = Sequence[Union[str, int]]
+
+
+def top_k_columns(scores: np.ndarray, k: int, group_size: int = 64) -> np.ndarray:
+    """Find the columns of the `k` largest scores of each row.
+
+    `np.argpartition` is slow on long rows. Instead, the columns are split into groups
+    of `group_size` and the maximum of each group is computed, which is fast. At least
+    `k` scores are as large as the `k`-th largest maximum, so only the columns of the
+    groups that reach it are candidates. Columns `j, j + num_groups, ...` are a group,
+    so the maxima are computed over contiguous rows of a reshaped `scores`.
+
+    Arguments:
+        scores: `n x m` array.
+        k: number of columns per row, at most `m`.
+        group_size: number of columns in each group.
+
+    Returns:
+        An `n x k` array of columns, best first.
+    """
+    num_rows, num_columns = scores.shape
+    num_groups = num_columns // group_size
+    if num_groups >= k:
+        width = num_groups * group_size
+        maxima = scores[:, :width].reshape(num_rows, group_size, num_groups).max(axis=1)
+        thresholds = np.partition(maxima, num_groups - k, axis=1)[:, num_groups - k]
+    if num_groups < k or np.isneginf(thresholds).any():
+        top = np.argpartition(scores, num_columns - k, axis=1)[:, num_columns - k :]
+    else:
+        rows, groups = np.nonzero(maxima >= thresholds[:, None])
+        rows = np.repeat(rows, group_size)
+        columns = (groups[:, None] + num_groups * np.arange(group_size)).ravel()
+        # The last columns aren't in any group.
+        tail = np.arange(width, num_columns)
+        if len(tail):
+            rows = np.concatenate([rows, np.repeat(np.arange(num_rows), len(tail))])
+            columns = np.concatenate([columns, np.tile(tail, num_rows)])
+            order = np.argsort(rows, kind="stable")
+            rows, columns = rows[order], columns[order]
+
+        # Put the candidates of each row in a row of a small array. The padding can't be
+        # picked, since each row has at least `k` candidates with finite scores.
+        counts = np.bincount(rows, minlength=num_rows)
+        positions = np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows]
+        candidates = np.full((num_rows, counts.max()), -np.inf, dtype=scores.dtype)
+        candidates[rows, positions] = scores[rows, columns]
+        candidate_columns = np.zeros(candidates.shape, dtype=np.int64)
+        candidate_columns[rows, positions] = columns
+        top = np.argpartition(candidates, candidates.shape[1] - k, axis=1)
+        top = np.take_along_axis(
+            candidate_columns, top[:, candidates.shape[1] - k :], axis=1
+        )
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def blocked_top_k(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    k: int,
+    bias: Optional[np.ndarray] = None,
+    exclude: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    block_size: int = 65536,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the rows of a matrix with the largest dot product with each query.
+
+    Arguments:
+        queries: `n x d` array.
+        matrix: `m x d` array, e.g. memory-mapped.
+        k: number of rows to find per query, at most `m`.
+        bias: added to the scores of the rows of `matrix`.
+        exclude: rows that can't be found for some queries, as an array of queries and
+            an array of rows of `matrix`. Their score is `-inf`.
+        block_size: number of rows of `matrix` scored at once, to bound memory.
+
+    Returns:
+        The rows and scores of the results of each query, as `n x k` arrays, best first.
+    """
+    if k <= 0:
+        return (
+            np.zeros((len(queries), 0), dtype=np.int64),
+            np.zeros((len(queries), 0), dtype=np.float32),
+        )
+    if exclude is None:
+        exclude = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    excluded_queries, excluded_rows = exclude
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(matrix), block_size):
+        scores = queries @ matrix[start : start + block_size].T
+        if bias is not None:
+            scores += bias[start : start + block_size]
+        in_block = (excluded_rows >= start) & (excluded_rows < start + block_size)
+        scores[excluded_queries[in_block], excluded_rows[in_block] - start] = -np.inf
+        # Keep the best `k` of the block and of the previous blocks.
+        top = top_k_columns(scores, min(k, scores.shape[1]))
+        best_scores = np.hstack([best_scores, np.take_along_axis(scores, top, axis=1)])
+        best_rows = np.hstack([best_rows, top + start])
+        if start > 0:
+            keep = top_k_columns(best_scores, min(k, best_scores.shape[1]))
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+    return best_rows, best_scores
+
+
+class InferenceEngine:
+    """Score tracks for contexts with the weights of a trained model.
+
+    Attributes:
+        embeddings: the input vector of each track, `vocab_size x embedding_dim`.
+        weights: the output vector of each track, `vocab_size x embedding_dim`.
+        bias: the output bias of each track.
+        vocabulary: the uri of each track.
+        indices: the index of each uri.
+        block_size: number of tracks scored at once.
+    """
+
+    embeddings: np.ndarray
+    weights: np.ndarray
+    bias: np.ndarray
+    vocabulary: List[str]
+    indices: Dict[str, int]
+    block_size: int
+
+    def __init__(
+        self,
+        weights: Dict[str, np.ndarray],
+        vocabulary: List[str],
+        block_size: int = 65536,
+    ):
+        """Initiate an instance of the class.
+
+        Arguments:
+            weights: see `evaluation.export_weights`.
+            See class docstring for the rest.
+        """
+        self.embeddings = weights["embeddings"]
+        self.weights = weights["weights"]
+        self.bias = weights["bias"]
+        self.vocabulary = vocabulary
+        self.indices = {uri: i for i, uri in enumerate(vocabulary)}
+        self.block_size = block_size
+
+    @classmethod
+    def from_checkpoint(cls, path: str, block_size: int = 65536) -> "InferenceEngine":
+        """Load the weights of a checkpoint saved with `training.save_checkpoint`,
+        without building the model. The output layer stays memory-mapped."""
+        tensors, vocabulary, metadata = checkpoint.load(path)
+        embeddings = tensors["embeddings.weight"].numpy()
+        if metadata.get("model") != "skip-gram":
+            # CBOW embeddings are the weights of a linear layer, one column per track.
+            embeddings = embeddings.T
+        weights = {
+            "embeddings": np.ascontiguousarray(embeddings),
+            "weights": tensors["linear.weight"].numpy(),
+            "bias": tensors["linear.bias"].numpy(),
+        }
+        return cls(weights, vocabulary, block_size=block_size)
+
+    def __len__(self) -> int:
+        return len(self.vocabulary)
+
+    def to_indices(self, context: Context) -> np.ndarray:
+        """Indices of the tracks of a context. Unknown uris are dropped.
+
+        Raises:
+            ValueError: if an index is not in the vocabulary.
+        """
+        indices = np.array(
+            [
+                x if isinstance(x, (int, np.integer)) else self.indices[x]
+                for x in context
+                if not isinstance(x, str) or x in self.indices
+            ],
+            dtype=np.int64,
+        )
+        # Negative indices would silently count from the end of the vocabulary.
+        if ((indices < 0) | (indices >= len(self))).any():
+            raise ValueError(f"Indices must be in [0, {len(self)}), got {context}.")
+        return indices
+
+    def pool(self, contexts: List[np.ndarray]) -> np.ndarray:
+        """Mean of the embeddings of the tracks of each context, or 0 for contexts with
+        no tracks."""
+        counts = np.array([len(x) for x in contexts], dtype=np.int64)
+        pooled = np.zeros((len(contexts), self.embeddings.shape[1]), dtype=np.float32)
+        non_empty = counts > 0
+        if non_empty.any():
+            starts = np.cumsum(counts)[non_empty] - counts[non_empty]
+            sums = np.add.reduceat(self.embeddings[np.concatenate(contexts)], starts)
+            pooled[non_empty] = sums / counts[non_empty, None]
+        return pooled
+
+    def recommend(
+        self, contexts: Sequence[Context], k: int = 10, exclude_context: bool = True
+    ) -> List[List[Tuple[str, float]]]:
+        """Find the most likely tracks given each context.
+
+        Arguments:
+            contexts: the uris or indices of the tracks of each context.
+            k: number of tracks to recommend per context.
+            exclude_context: whether tracks of a context can be recommended for it.
+
+        Returns:
+            The uri and logit of the recommendations for each context, best first.
+
+        Raises:
+            ValueError: if an index is not in the vocabulary.
+        """
+        with METRICS.timer("inference"):
+            indices = [self.to_indices(x) for x in contexts]
+            exclude = None
+            if exclude_context:
+                exclude = (
+                    np.repeat(np.arange(len(indices)), [len(x) for x in indices]),
+                    np.concatenate(indices) if indices else np.zeros(0, np.int64),
+                )
+            rows, scores = blocked_top_k(
+                self.pool(indices),
+                self.weights,
+                min(k, len(self)),
+                bias=self.bias,
+                exclude=exclude,
+                block_size=self.block_size,
+            )
+            res = [
+                [
+                    (self.vocabulary[row], float(score))
+                    for row, score in zip(rows_i, scores_i)
+                    if score > -np.inf
+                ]
+                for rows_i, scores_i in zip(rows.tolist(), scores.tolist())
+            ]
+        METRICS.count("inference.requests", len(contexts))
+        return res
+
+
+class MicroBatcher:
+    """Collect requests from several threads and score them in batches.
+
+    A background thread waits for a request, then for up to `max_wait` seconds for
+    more, and scores up to `max_batch_size` requests at once.
+
+    Attributes:
+        engine: the engine to score requests with.
+        max_batch_size: maximum number of requests in a batch.
+        max_wait: maximum number of seconds a request waits for others.
+        requests: the requests that aren't in a batch yet.
+        thread: the thread that scores batches.
+    """
+
+    engine: InferenceEngine
+    max_batch_size: int
+    max_wait: float
+    requests: queue.Queue
+    thread: threading.Thread
+
+    def __init__(
+        self, engine: InferenceEngine, max_batch_size: int = 64, max_wait: float = 0.002
+    ):
+        """Initiate an instance of the class and start its thread."""
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, context: Context, k: int = 10) -> Future:
+        """Request recommendations for a context. See `InferenceEngine.recommend`.
+
+        Returns:
+            A future with the recommendations, or the error if the context is invalid.
+            Invalid contexts are rejected here, so they don't fail the other requests
+            of their batch.
+        """
+        future: Future = Future()
+        try:
+            indices = self.engine.to_indices(context)
+        except ValueError as error:
+            future.set_exception(error)
+            return future
+        self.requests.put((indices, k, future))
+        return future
+
+    def recommend(self, context: Context, k: int = 10) -> List[Tuple[str, float]]:
+        """Request recommendations for a context and wait for them."""
+        return self.submit(context, k).result()
+
+    def close(self) -> None:
+        """Score the pending requests and stop the thread."""
+        self.requests.put(None)
+        self.thread.join()
+
+    def _next_batch(self) -> Tuple[list, bool]:
+        """Wait for a batch of requests.
+
+        Returns:
+            The requests and whether `close` was called.
+        """
+        request = self.requests.get()
+        if request is None:
+            return [], True
+        batch = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self) -> None:
+        closed = False
+        while not closed:
+            batch, closed = self._next_batch()
+            if not batch:
+                continue
+            METRICS.count("inference.batches")
+            try:
+                results = self.engine.recommend(
+                    [context for context, _, _ in batch],
+                    k=max(k for _, k, _ in batch),
+                )
+            except Exception as error:  # pylint: disable=broad-except
+                for _, _, future in batch:
+                    future.set_exception(error)
+                continue
+            for (_, k, future), result in zip(batch, results):
+                future.set_result(result[:k])
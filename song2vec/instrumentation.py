@@ -0,0 +1,181 @@
+"""Lightweight timers, counters and profiling hooks for the data pipeline.
+
+Timers and counters are grouped by name with dots, e.g. `load.parse`. A counter is
+reported as a rate when there is a timer named after its prefix, e.g. `load.rows` is
+divided by the time in `load`. Each process has its own `METRICS`, which its threads
+share; workers started with `run_instrumented` send theirs back to the parent to be
+merged.
+"""
+import cProfile
+import os
+import queue as queue_module
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class Metrics:
+    """Accumulate wall clock time and counts.
+
+    Attributes:
+        timers: total seconds spent in each timer. Summed over processes when merged.
+        calls: number of times each timer was entered.
+        counters: total value of each counter.
+        lock: guards the updates, since `+=` on a dict isn't atomic and timers are
+            also updated from background threads, e.g. by `prefetch`.
+    """
+
+    timers: Dict[str, float]
+    calls: Dict[str, int]
+    counters: Dict[str, float]
+    lock: threading.Lock
+
+    def __init__(self):
+        """Initiate an instance of the class."""
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Clear all the timers and counters."""
+        with self.lock:
+            self.timers = defaultdict(float)
+            self.calls = defaultdict(int)
+            self.counters = defaultdict(float)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time the body of a `with` statement."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.timers[name] += elapsed
+                self.calls[name] += 1
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Add `value` to a counter."""
+        with self.lock:
+            self.counters[name] += value
+
+    def rate(self, name: str) -> Optional[float]:
+        """Value of a counter per second of its prefix's timer, if there is one."""
+        prefix = name.rpartition(".")[0]
+        seconds = self.timers.get(prefix)
+        if not seconds:
+            return None
+        return self.counters[name] / seconds
+
+    def as_dict(self) -> dict:
+        """Plain dict that can be pickled or dumped to JSON."""
+        with self.lock:
+            return {
+                "timers": dict(self.timers),
+                "calls": dict(self.calls),
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, other: dict) -> None:
+        """Add the metrics of another process, as returned by `as_dict`."""
+        with self.lock:
+            for name, value in other["timers"].items():
+                self.timers[name] += value
+            for name, value in other["calls"].items():
+                self.calls[name] += value
+            for name, value in other["counters"].items():
+                self.counters[name] += value
+
+    def report(self) -> str:
+        """Human readable summary of all the timers and counters."""
+        lines = []
+        for name in sorted(self.timers):
+            lines.append(
+                f"{name}: {self.timers[name]:.3f}s over {self.calls[name]} calls"
+            )
+        for name in sorted(self.counters):
+            line = f"{name}: {self.counters[name]:.0f}"
+            rate = self.rate(name)
+            if rate is not None:
+                line += f" ({rate:.1f}/s)"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+# Metrics of the current process.
+METRICS = Metrics()
+
+
+@contextmanager
+def profiled(path: Optional[str]) -> Iterator[None]:
+    """Profile the body of a `with` statement with cProfile and dump the stats to
+    `path`. Does nothing if `path` is `None`. Read the output with `pstats`.
+    """
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+
+def run_instrumented(
+    name: str,
+    queue,
+    profile_dir: Optional[str],
+    target: Callable,
+    *args,
+    **kwargs,
+) -> None:
+    """Run `target` in a worker process and send its metrics to the parent. Use this as
+    the target of a `multiprocessing.Process`.
+
+    Arguments:
+        name: name of the worker. Used for the profile file name.
+        queue: a `multiprocessing.Queue` the metrics are put in, even if `target` fails.
+        profile_dir: directory to dump cProfile stats to, or `None` to not profile.
+        target: the function to run.
+        args, kwargs: the arguments to `target`.
+    """
+    METRICS.reset()
+    profile_path = None
+    if profile_dir is not None:
+        profile_path = os.path.join(profile_dir, f"{name}.pstats")
+    try:
+        with profiled(profile_path):
+            target(*args, **kwargs)
+    finally:
+        queue.put(METRICS.as_dict())
+
+
+def collect_metrics(queue, processes: List, timeout: float = 1.0) -> int:
+    """Merge the metrics that `run_instrumented` workers send into `METRICS`. Workers
+    that die before sending them, e.g. killed by the OOM killer, are not waited for.
+
+    Arguments:
+        queue: the queue passed to `run_instrumented`.
+        processes: the `multiprocessing.Process` of each worker.
+        timeout: seconds between checks that the workers are alive.
+
+    Returns:
+        The number of workers whose metrics were merged.
+    """
+    num_merged = 0
+    while num_merged < len(processes):
+        # Metrics are in the queue before a worker exits, so if they were all dead
+        # before waiting and nothing came, nothing will.
+        all_dead = not any(process.is_alive() for process in processes)
+        try:
+            METRICS.merge(queue.get(timeout=timeout))
+        except queue_module.Empty:
+            if all_dead:
+                break
+            continue
+        num_merged += 1
+    return num_merged
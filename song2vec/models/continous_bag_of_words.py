@@ -67,22 +67,65 @@ class ContinousBagOfWords(nn.Module):
         return probs
 
     def create_batch(self, data_point: Tensor) -> Tuple[Tensor, Tensor]:
-        """Create a batch of data given a bag."""
+        """Create a batch of data given a bag, or given a bag in each row of a 2D
+        tensor. Each track of a bag is predicted from the other tracks of the bag."""
+        if data_point.dim() == 2:
+            return self._create_batches(data_point)
         indices = data_point.indices()
         num_batch_indices = indices.shape[1]
         y = indices[0]
         hidden_value_indices = torch.vstack([torch.arange(0, num_batch_indices), y])
         hidden_values = torch.sparse_coo_tensor(
-            indices=hidden_value_indices, values=torch.ones(num_batch_indices)
+            indices=hidden_value_indices,
+            values=torch.ones(num_batch_indices),
+            size=(num_batch_indices, self.vocab_size),
         )
         embeddings = self.embeddings(data_point) - self.embeddings(hidden_values)
         embeddings = embeddings / (num_batch_indices - 1)
 
         return embeddings, y
 
-    def training_step(self, train_batch, batch_idx) -> float:
+    def _create_batches(self, data_points: Tensor) -> Tuple[Tensor, Tensor]:
+        """Like `create_batch`, for a 2D tensor with a bag in each row. Bags with a single
+        track are skipped."""
+        rows, y = data_points.indices()
+        lengths = torch.bincount(rows, minlength=data_points.shape[0])
+        keep = lengths[rows] > 1
+        rows, y = rows[keep], y[keep]
+        # Subtract each track from the sum of its bag instead of building a one-hot
+        # tensor per track.
+        sums = self.embeddings(data_points)
+        embeddings = sums[rows] - self.embeddings.weight[:, y].T
+        embeddings = embeddings / (lengths[rows] - 1)[:, None]
+        return embeddings, y
+
+    def training_step(self, train_batch, batch_idx) -> Tensor:
         assert len(train_batch) == 1
         data_point = train_batch[0]
         embeddings, y = self.create_batch(data_point=data_point)
-        preds = self.log_softmax(embeddings, axis=1)
+        preds = self.log_softmax(self.linear(embeddings))
         return self.loss(preds, y)
+
+    def grow(self, vocab_size: int) -> None:
+        """Grow the vocabulary to `vocab_size` tokens, keeping the weights of the
+        existing tokens so training can be warm-started. New tokens are added at the end,
+        like in `MultiHotEncoder.extend`.
+
+        Arguments:
+            vocab_size: the new size of the vocab.
+        """
+        if vocab_size < self.vocab_size:
+            raise ValueError(
+                f"Cannot shrink the vocab from {self.vocab_size} to {vocab_size}."
+            )
+        old_vocab_size = self.vocab_size
+        embeddings = nn.Linear(vocab_size, self.embedding_dim, bias=False)
+        linear = nn.Linear(self.embedding_dim, vocab_size, bias=True)
+        with torch.no_grad():
+            embeddings.weight[:, :old_vocab_size] = self.embeddings.weight
+            linear.weight[:old_vocab_size] = self.linear.weight
+            linear.bias[:old_vocab_size] = self.linear.bias
+        self.vocab_size = vocab_size
+        self.embeddings = embeddings
+        self.linear = linear
+        self.ones = torch.ones(vocab_size, 1)  # pylint: disable=no-member
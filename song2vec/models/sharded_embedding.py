@@ -0,0 +1,224 @@
+"""Embedding table stored in memory-mapped shard files.
+
+The rows are split into contiguous ranges, one file per range, so the table doesn't have
+to fit in memory: only the rows a batch touches are read and written, and the operating
+system pages the rest in and out. The table has its own sparse optimizer, so gradients
+are pushed back as rows too instead of as a dense `vocab_size x embedding_dim` tensor.
+"""
+import json
+import math
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import Tensor
+
+from song2vec.instrumentation import METRICS
+
+INDEX_FILE = "index.json"
+
+
+class ShardedEmbedding:
+    """Embedding table trained with sparse Adagrad.
+
+    Use `pull` to get the rows of a batch as a tensor that requires gradients, compute
+    the loss and call `backward`, then `push` the gradients of the rows:
+
+        unique, rows, inverse = table.pull(indices)
+        loss = f(rows[inverse])
+        loss.backward()
+        table.push(unique, rows.grad)
+
+    Attributes:
+        path: directory with the shard files and the index.
+        num_embeddings: number of rows.
+        embedding_dim: size of each row.
+        num_shards: number of files the rows are split into.
+        learning_rate: learning rate of Adagrad.
+        eps: term added to the denominator of Adagrad for numerical stability.
+        weights: the rows of each shard.
+        accumulators: the sum of the squared gradients of each shard.
+    """
+
+    path: str
+    num_embeddings: int
+    embedding_dim: int
+    num_shards: int
+    learning_rate: float
+    eps: float
+    weights: List[np.memmap]
+    accumulators: List[np.memmap]
+
+    def __init__(
+        self,
+        path: str,
+        num_embeddings: Optional[int] = None,
+        embedding_dim: Optional[int] = None,
+        num_shards: int = 8,
+        learning_rate: float = 0.1,
+        eps: float = 1e-10,
+        init_std: float = 1.0,
+        seed: int = 0,
+    ):
+        """Open the table in `path`, or create it if it doesn't exist.
+
+        Arguments:
+            init_std: standard deviation of the initial weights, which are normally
+                distributed. 1 like in `torch.nn.Embedding` by default. Only used when
+                creating the table.
+            seed: random seed of the initial weights.
+            See class docstring for the rest. `num_embeddings`, `embedding_dim` and
+            `num_shards` are read from the index when opening a table.
+        """
+        index_path = os.path.join(path, INDEX_FILE)
+        self.path = path
+        if os.path.exists(index_path):
+            with open(index_path) as file:
+                index = json.load(file)
+            self.num_embeddings = index["num_embeddings"]
+            self.embedding_dim = index["embedding_dim"]
+            self.num_shards = index["num_shards"]
+            mode = "r+"
+        else:
+            if num_embeddings is None or embedding_dim is None:
+                raise ValueError(
+                    f"{path} has no table. Pass num_embeddings and embedding_dim to "
+                    "create one."
+                )
+            self.num_embeddings = num_embeddings
+            self.embedding_dim = embedding_dim
+            # Don't create empty shards.
+            rows_per_shard = math.ceil(num_embeddings / max(num_shards, 1))
+            self.num_shards = math.ceil(num_embeddings / rows_per_shard)
+            mode = "w+"
+            os.makedirs(path, exist_ok=True)
+        self.learning_rate = learning_rate
+        self.eps = eps
+
+        rng = np.random.default_rng(seed)
+        self.weights, self.accumulators = [], []
+        for shard in range(self.num_shards):
+            shape = (self.shard_size(shard), self.embedding_dim)
+            weights = np.lib.format.open_memmap(
+                self._shard_path("weights", shard),
+                mode=mode,
+                dtype=np.float32,
+                shape=shape,
+            )
+            accumulators = np.lib.format.open_memmap(
+                self._shard_path("accumulators", shard),
+                mode=mode,
+                dtype=np.float32,
+                shape=shape,
+            )
+            if mode == "w+":
+                weights[:] = init_std * rng.standard_normal(shape, dtype=np.float32)
+                accumulators[:] = 0
+            self.weights.append(weights)
+            self.accumulators.append(accumulators)
+
+        if mode == "w+":
+            self.flush()
+            # Written last, so a table is only opened once all its shards exist.
+            with open(index_path, "w") as file:
+                json.dump(
+                    {
+                        "num_embeddings": self.num_embeddings,
+                        "embedding_dim": self.embedding_dim,
+                        "num_shards": self.num_shards,
+                    },
+                    file,
+                )
+
+    @property
+    def rows_per_shard(self) -> int:
+        return math.ceil(self.num_embeddings / self.num_shards)
+
+    def shard_size(self, shard: int) -> int:
+        """Number of rows in a shard. The last one can be smaller."""
+        start = shard * self.rows_per_shard
+        return max(min(self.rows_per_shard, self.num_embeddings - start), 0)
+
+    def _shard_path(self, name: str, shard: int) -> str:
+        return os.path.join(self.path, f"{name}-{shard:05d}.npy")
+
+    def _split(self, indices: np.ndarray) -> List[Tuple[int, slice, np.ndarray]]:
+        """Group sorted indices by shard.
+
+        Returns:
+            The shard, the positions in `indices` and the rows in the shard of each
+            group.
+        """
+        bounds = np.searchsorted(
+            indices, np.arange(self.num_shards + 1) * self.rows_per_shard
+        )
+        groups = []
+        for shard in range(self.num_shards):
+            start, end = bounds[shard], bounds[shard + 1]
+            if start < end:
+                rows = indices[start:end] - shard * self.rows_per_shard
+                groups.append((shard, slice(start, end), rows))
+        return groups
+
+    def lookup(self, indices: np.ndarray) -> np.ndarray:
+        """Read rows of the table.
+
+        Arguments:
+            indices: 1D array of row indices, with repetitions or not.
+
+        Returns:
+            A `len(indices) x embedding_dim` array.
+        """
+        unique, inverse = np.unique(indices, return_inverse=True)
+        rows = np.empty((len(unique), self.embedding_dim), dtype=np.float32)
+        for shard, positions, shard_rows in self._split(unique):
+            rows[positions] = self.weights[shard][shard_rows]
+        return rows[inverse]
+
+    def pull(self, indices: Tensor) -> Tuple[Tensor, Tensor, Tensor]:
+        """Read the rows of a batch as a leaf tensor that accumulates gradients.
+
+        Arguments:
+            indices: tensor of row indices, of any shape.
+
+        Returns:
+            The distinct indices of the batch, their rows, and the position in them of
+            each index, so `rows[inverse]` has a row for each index.
+        """
+        with METRICS.timer("embedding.pull"):
+            unique, inverse = torch.unique(indices, return_inverse=True)
+            rows = torch.from_numpy(self.lookup(unique.numpy()))
+        METRICS.count("embedding.pull.rows", len(unique))
+        return unique, rows.requires_grad_(), inverse
+
+    def push(self, indices: Tensor, grads: Tensor) -> None:
+        """Apply gradients to some rows with Adagrad.
+
+        Arguments:
+            indices: 1D tensor of row indices. The gradients of repeated indices are
+                summed.
+            grads: the gradient of the row of each index.
+        """
+        with METRICS.timer("embedding.push"):
+            unique, inverse = np.unique(indices.numpy(), return_inverse=True)
+            summed = np.zeros((len(unique), self.embedding_dim), dtype=np.float32)
+            np.add.at(summed, inverse.ravel(), grads.detach().numpy())
+            for shard, positions, shard_rows in self._split(unique):
+                grad = summed[positions]
+                accumulator = self.accumulators[shard][shard_rows] + grad ** 2
+                self.accumulators[shard][shard_rows] = accumulator
+                self.weights[shard][shard_rows] -= (
+                    self.learning_rate * grad / (np.sqrt(accumulator) + self.eps)
+                )
+        METRICS.count("embedding.push.rows", len(unique))
+
+    def flush(self) -> None:
+        """Write the changes to disk."""
+        for array in self.weights + self.accumulators:
+            array.flush()
+
+    def to_numpy(self) -> np.ndarray:
+        """All the rows in memory. See `training.save_sharded_checkpoint` to export
+        tables that don't fit in memory."""
+        return np.concatenate(self.weights)
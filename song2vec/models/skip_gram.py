@@ -0,0 +1,143 @@
+"""Skip-gram model."""
+from typing import List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torch import Tensor
+
+
+class SkipGram(nn.Module):
+    r"""Skip-gram model over ordered playlists. Each track predicts the tracks around it
+    in a sliding window:
+
+    .. math::
+        p( c | w ) = \text{softmax}(A v_w + b)
+
+    where :math:`v_w` is the row of :code:`embeddings` for :math:`w`, :math:`c` is
+    within :code:`window` positions of :math:`w`, and :math:`A` and :math:`b` are the
+    weights and biases of :code:`linear`. Unlike :code:`ContinousBagOfWords`, the cost
+    of an example doesn't depend on the length of the playlist.
+
+    Attributes:
+        vocab_size: the size of the vocab.
+        embedding_dim: the dimensionality of the latent space.
+        window: the maximum distance between a track and its context.
+        shrink_window: whether to sample the window of each track uniformly between 1
+            and `window`, as in word2vec, which gives more weight to closer tracks.
+        embeddings: layer with embeddings.
+        linear: layer with prediction weights.
+    """
+
+    vocab_size: int
+    embedding_dim: int
+    window: int
+    shrink_window: bool
+    embeddings: nn.Embedding
+    linear: nn.Linear
+    log_softmax: nn.LogSoftmax
+    loss: nn.NLLLoss
+
+    def __init__(
+        self,
+        vocab_size: int,
+        embedding_dim: int,
+        window: int = 5,
+        shrink_window: bool = True,
+    ):
+        """Initialize an instance of the class.
+
+        Attrbutes:
+            See class docstring."""
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.embedding_dim = embedding_dim
+        self.window = window
+        self.shrink_window = shrink_window
+        self.embeddings = nn.Embedding(vocab_size, embedding_dim)
+        self.loss = nn.NLLLoss()
+        self.log_softmax = nn.LogSoftmax(dim=1)
+        self.linear = nn.Linear(embedding_dim, vocab_size, bias=True)
+
+    def forward(self, centers: Tensor) -> Tensor:
+        """Find the probability of each word given a word.
+
+        Arguments:
+            centers: 1D tensor with the index of a token in each row.
+
+        Returns:
+            The log probability distribution of tokens in the context of each token.
+        """
+        return self.log_softmax(self.linear(self.embeddings(centers)))
+
+    def create_batch(
+        self, sequences: List[Tensor], generator: Optional[torch.Generator] = None
+    ) -> Tuple[Tensor, Tensor]:
+        """Create all the (center, context) pairs of a list of playlists at once. See
+        `skip_gram_pairs`."""
+        return skip_gram_pairs(sequences, self.window, self.shrink_window, generator)
+
+    def training_step(self, train_batch: List[Tensor], batch_idx) -> Tensor:
+        centers, contexts = self.create_batch(train_batch)
+        return self.loss(self(centers), contexts)
+
+    def grow(self, vocab_size: int) -> None:
+        """Grow the vocabulary to `vocab_size` tokens, keeping the weights of the
+        existing tokens. See `ContinousBagOfWords.grow`.
+
+        Arguments:
+            vocab_size: the new size of the vocab.
+        """
+        if vocab_size < self.vocab_size:
+            raise ValueError(
+                f"Cannot shrink the vocab from {self.vocab_size} to {vocab_size}."
+            )
+        old_vocab_size = self.vocab_size
+        embeddings = nn.Embedding(vocab_size, self.embedding_dim)
+        linear = nn.Linear(self.embedding_dim, vocab_size, bias=True)
+        with torch.no_grad():
+            embeddings.weight[:old_vocab_size] = self.embeddings.weight
+            linear.weight[:old_vocab_size] = self.linear.weight
+            linear.bias[:old_vocab_size] = self.linear.bias
+        self.vocab_size = vocab_size
+        self.embeddings = embeddings
+        self.linear = linear
+
+
+def skip_gram_pairs(
+    sequences: List[Tensor],
+    window: int,
+    shrink_window: bool = True,
+    generator: Optional[torch.Generator] = None,
+) -> Tuple[Tensor, Tensor]:
+    """Create all the (center, context) pairs of a list of playlists at once. See
+    `SkipGram`.
+
+    Arguments:
+        sequences: 1D tensors with the indices of the tracks of each playlist, in order.
+        window: the maximum distance between a track and its context.
+        shrink_window: whether to sample the window of each track.
+        generator: random generator for the size of the windows.
+
+    Returns:
+        The index of the center and the index of the context of each pair.
+    """
+    tokens = torch.cat(sequences)
+    num_tokens = len(tokens)
+    lengths = torch.tensor([len(x) for x in sequences])
+    # Which playlist each token belongs to, so windows don't cross playlists.
+    segments = torch.repeat_interleave(torch.arange(len(sequences)), lengths)
+
+    offsets = torch.cat([torch.arange(-window, 0), torch.arange(1, window + 1)])
+    positions = torch.arange(num_tokens)[:, None] + offsets[None, :]
+    if shrink_window:
+        windows = torch.randint(1, window + 1, (num_tokens, 1), generator=generator)
+    else:
+        windows = torch.full((num_tokens, 1), window)
+    valid = (positions >= 0) & (positions < num_tokens)
+    valid &= offsets.abs()[None, :] <= windows
+    positions = positions.clamp(0, num_tokens - 1)
+    valid &= segments[positions] == segments[:, None]
+
+    centers = tokens[:, None].expand_as(positions)[valid]
+    contexts = tokens[positions][valid]
+    return centers, contexts
@@ -0,0 +1,408 @@
+"""Functions to train models and save them to disk."""
+import os
+from typing import Callable, List, Optional, Tuple, Union
+
+import torch
+import torch.nn.functional as F
+from torch import optim
+from tqdm import tqdm
+
+from song2vec import checkpoint
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.data.prefetch import prefetch
+from song2vec.data.sampler import BucketBatchSampler
+from song2vec.instrumentation import METRICS
+from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+from song2vec.models.sharded_embedding import ShardedEmbedding
+from song2vec.models.skip_gram import SkipGram, skip_gram_pairs
+from song2vec.utils import MultiHotEncoder
+
+# Prefix of the names of the optimizer state tensors in checkpoints.
+OPTIMIZER_PREFIX = "optimizer."
+
+
+def fit(
+    model: ContinousBagOfWords,
+    dataset: MillionPlaylistDataset,
+    keys: List[str],
+    epochs: int = 1,
+    learning_rate: float = 1e-3,
+    prefetch_depth: int = 4,
+    start: Tuple[int, int] = (0, 0),
+    on_step: Optional[Callable[[int, int], None]] = None,
+    sampler: Optional[BucketBatchSampler] = None,
+    optimizer: Optional[optim.Optimizer] = None,
+) -> List[float]:
+    """Train a model on some of the playlists of a dataset.
+
+    Arguments:
+        model: the model to train. Its vocab must match the dataset's encoder.
+        dataset: the dataset to get the playlists from.
+        keys: the keys of the playlists to train on.
+        epochs: number of passes over `keys`.
+        learning_rate: learning rate of the optimizer.
+        prefetch_depth: number of batches fetched ahead in background threads. See
+            `prefetch`. The time the model waits for data is in the `train.stall` timer.
+        start: the epoch and batch to start from, to resume training.
+        on_step: called after each step with the epoch and the next batch, e.g. to
+            save checkpoints that can be resumed from.
+        sampler: gives the batches of keys of each epoch. By default each batch is a
+            single playlist of `keys`, in order.
+        optimizer: the optimizer of the model's parameters, e.g. with the state loaded
+            by `load_optimizer_state` to resume training. By default Adam with
+            `learning_rate`.
+
+    Returns:
+        The mean loss of each epoch.
+    """
+    if optimizer is None:
+        optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    losses = []
+    start_epoch, start_batch = start
+    for epoch in range(start_epoch, epochs):
+        total_loss = 0.0
+        num_steps = 0
+        first = start_batch if epoch == start_epoch else 0
+        batch_keys = keys if sampler is None else sampler.batches(epoch)
+        batches = prefetch(
+            dataset.__getitem__,
+            batch_keys[first:],
+            depth=prefetch_depth,
+            timer="train.stall",
+        )
+        with METRICS.timer("train"):
+            for batch_idx, data_point in enumerate(
+                tqdm(batches, total=len(batch_keys) - first), first
+            ):
+                # We can't predict a track from an empty context.
+                if len(data_point.values()) < 2:
+                    continue
+                with METRICS.timer("train.step"):
+                    optimizer.zero_grad()
+                    loss = model.training_step([data_point], batch_idx)
+                    loss.backward()
+                    optimizer.step()
+                METRICS.count("train.steps")
+                METRICS.count("train.examples", len(data_point.values()))
+                total_loss += loss.item()
+                num_steps += 1
+                if on_step is not None:
+                    on_step(epoch, batch_idx + 1)
+        losses.append(total_loss / max(num_steps, 1))
+    return losses
+
+
+def fit_skip_gram(
+    model: SkipGram,
+    dataset: MillionPlaylistDataset,
+    keys: List[str],
+    epochs: int = 1,
+    learning_rate: float = 1e-3,
+    batch_size: int = 32,
+    prefetch_depth: int = 4,
+    start: Tuple[int, int] = (0, 0),
+    on_step: Optional[Callable[[int, int], None]] = None,
+    sampler: Optional[BucketBatchSampler] = None,
+    optimizer: Optional[optim.Optimizer] = None,
+) -> List[float]:
+    """Train a skip-gram model on some of the playlists of a dataset. Pairs are created
+    for `batch_size` playlists at a time.
+
+    Arguments:
+        See `fit`.
+        batch_size: number of playlists in each batch. Ignored if `sampler` is given.
+
+    Returns:
+        The mean loss of each epoch.
+    """
+    if optimizer is None:
+        optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+    fetch, batch_keys = _sequence_batches(dataset, keys, batch_size)
+    losses = []
+    start_epoch, start_batch = start
+    for epoch in range(start_epoch, epochs):
+        total_loss = 0.0
+        num_steps = 0
+        first = start_batch if epoch == start_epoch else 0
+        if sampler is not None:
+            batch_keys = sampler.batches(epoch)
+        batches = prefetch(
+            fetch, batch_keys[first:], depth=prefetch_depth, timer="train.stall"
+        )
+        with METRICS.timer("train"):
+            for batch_idx, sequences in enumerate(
+                tqdm(batches, total=len(batch_keys) - first), first
+            ):
+                if not sequences:
+                    continue
+                with METRICS.timer("train.step"):
+                    optimizer.zero_grad()
+                    loss = model.training_step(sequences, batch_idx)
+                    loss.backward()
+                    optimizer.step()
+                METRICS.count("train.steps")
+                METRICS.count("train.examples", sum(map(len, sequences)))
+                total_loss += loss.item()
+                num_steps += 1
+                if on_step is not None:
+                    on_step(epoch, batch_idx + 1)
+        losses.append(total_loss / max(num_steps, 1))
+    return losses
+
+
+def fit_sharded_skip_gram(
+    inputs: ShardedEmbedding,
+    outputs: ShardedEmbedding,
+    dataset: MillionPlaylistDataset,
+    keys: List[str],
+    window: int = 5,
+    epochs: int = 1,
+    batch_size: int = 32,
+    num_negatives: int = 5,
+    prefetch_depth: int = 4,
+    seed: int = 0,
+) -> List[float]:
+    """Train skip-gram embeddings stored in sharded tables. The full softmax of
+    `SkipGram` needs every output row at each step, so it is replaced by negative
+    sampling: each step only reads and writes the rows of the tracks in the batch and
+    of `num_negatives` random tracks per pair. The tables have their own optimizer.
+
+    Arguments:
+        inputs: the embedding of each track.
+        outputs: the output vector of each track, initialized close to 0.
+        window: see `SkipGram`.
+        num_negatives: number of random tracks each context is contrasted with.
+        seed: random seed of the windows and the negatives.
+        See `fit_skip_gram` for the rest.
+
+    Returns:
+        The mean loss of each epoch.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    fetch, batch_keys = _sequence_batches(dataset, keys, batch_size)
+    losses = []
+    for _ in range(epochs):
+        total_loss = 0.0
+        num_steps = 0
+        batches = prefetch(fetch, batch_keys, depth=prefetch_depth, timer="train.stall")
+        with METRICS.timer("train"):
+            for sequences in tqdm(batches, total=len(batch_keys)):
+                if not sequences:
+                    continue
+                with METRICS.timer("train.step"):
+                    centers, contexts = skip_gram_pairs(
+                        sequences, window, generator=generator
+                    )
+                    negatives = torch.randint(
+                        outputs.num_embeddings,
+                        (len(centers), num_negatives),
+                        generator=generator,
+                    )
+                    # The first target of each pair is the context, the others are
+                    # negatives.
+                    targets = torch.cat([contexts[:, None], negatives], dim=1)
+                    labels = torch.zeros(targets.shape)
+                    labels[:, 0] = 1
+                    center_ids, center_rows, center_inverse = inputs.pull(centers)
+                    target_ids, target_rows, target_inverse = outputs.pull(targets)
+                    logits = (
+                        target_rows[target_inverse]
+                        @ center_rows[center_inverse][:, :, None]
+                    ).squeeze(2)
+                    loss = (
+                        F.binary_cross_entropy_with_logits(
+                            logits, labels, reduction="none"
+                        )
+                        .sum(dim=1)
+                        .mean()
+                    )
+                    loss.backward()
+                    inputs.push(center_ids, center_rows.grad)
+                    outputs.push(target_ids, target_rows.grad)
+                METRICS.count("train.steps")
+                METRICS.count("train.examples", len(centers))
+                total_loss += loss.item()
+                num_steps += 1
+        losses.append(total_loss / max(num_steps, 1))
+    inputs.flush()
+    outputs.flush()
+    return losses
+
+
+def _sequence_batches(
+    dataset: MillionPlaylistDataset, keys: List[str], batch_size: int
+) -> Tuple[Callable[[List[str]], List[torch.Tensor]], List[List[str]]]:
+    """Split keys into batches for skip-gram and make the function to fetch them.
+
+    Returns:
+        A function that returns the indices of the tracks of each playlist in a batch,
+        in order, and the keys of each batch.
+    """
+    encoder = dataset.multi_hot_encoder
+
+    def fetch(batch_keys: List[str]) -> List[torch.Tensor]:
+        sequences = encoder.to_indices(dataset.query_sequences(batch_keys))
+        # Playlists with a single track have no pairs.
+        return [x for x in sequences if len(x) > 1]
+
+    batch_keys = [keys[i : i + batch_size] for i in range(0, len(keys), batch_size)]
+    return fetch, batch_keys
+
+
+def save_checkpoint(
+    path: str,
+    model: Union[ContinousBagOfWords, SkipGram],
+    multi_hot_encoder: MultiHotEncoder,
+    last_pid: int,
+    position: Optional[dict] = None,
+    saver: Optional[checkpoint.AsyncSaver] = None,
+    optimizer: Optional[optim.Optimizer] = None,
+) -> None:
+    """Save a model with everything needed to warm-start training later. See
+    `checkpoint` for the format.
+
+    Arguments:
+        path: directory to save the checkpoint to.
+        model: the trained model.
+        multi_hot_encoder: the encoder the model was trained with.
+        last_pid: the largest playlist id the model was trained on.
+        position: where to resume training from if it was interrupted, e.g. the
+            arguments of `on_step`. `None` if training is done.
+        saver: saves the checkpoint in the background if given.
+        optimizer: the optimizer to save the state of, to resume training with it. See
+            `load_optimizer_state`.
+    """
+    tensors = dict(model.state_dict())
+    metadata = {
+        "model": "skip-gram" if isinstance(model, SkipGram) else "cbow",
+        "window": getattr(model, "window", None),
+        "embedding_dim": model.embedding_dim,
+        "last_pid": last_pid,
+        "position": position,
+    }
+    if optimizer is not None:
+        # The tensors of the state (e.g. Adam's moments) go next to the weights, the
+        # rest in the metadata.
+        state_dict = optimizer.state_dict()
+        state = {}
+        for index, param_state in state_dict["state"].items():
+            state[index] = {}
+            for name, value in param_state.items():
+                if isinstance(value, torch.Tensor):
+                    tensors[f"{OPTIMIZER_PREFIX}{index}.{name}"] = value
+                else:
+                    state[index][name] = value
+        metadata["optimizer"] = {
+            "state": state,
+            "param_groups": state_dict["param_groups"],
+        }
+    save = checkpoint.save if saver is None else saver.save
+    save(path, tensors, multi_hot_encoder.vocabulary, metadata)
+
+
+def save_sharded_checkpoint(
+    path: str,
+    inputs: ShardedEmbedding,
+    outputs: ShardedEmbedding,
+    multi_hot_encoder: MultiHotEncoder,
+    last_pid: int,
+    window: int,
+) -> None:
+    """Save embeddings trained with `fit_sharded_skip_gram` as a skip-gram checkpoint,
+    so they can be loaded like any other model. The tables are written one shard at a
+    time, so they never have to fit in memory.
+
+    Arguments:
+        inputs: the embedding of each track.
+        outputs: the output vector of each track. Negative sampling has no bias, so the
+            bias of the output layer is 0.
+        window: the window the embeddings were trained with.
+        See `save_checkpoint` for the rest.
+    """
+    inputs.flush()
+    outputs.flush()
+    tensors = {
+        "embeddings.weight": list(inputs.weights),
+        "linear.weight": list(outputs.weights),
+        "linear.bias": torch.zeros(outputs.num_embeddings),
+    }
+    metadata = {
+        "model": "skip-gram",
+        "window": window,
+        "embedding_dim": inputs.embedding_dim,
+        "last_pid": last_pid,
+        "position": None,
+    }
+    checkpoint.save(path, tensors, multi_hot_encoder.vocabulary, metadata)
+
+
+def load_checkpoint(
+    path: str,
+) -> Tuple[Union[ContinousBagOfWords, SkipGram], MultiHotEncoder, int]:
+    """Load a checkpoint saved with `save_checkpoint`. The weights are memory-mapped, so
+    they are only read when used. Checkpoints saved with `torch.save` by older versions
+    can still be loaded.
+
+    Arguments:
+        path: path to the checkpoint.
+
+    Returns:
+        The model, the encoder, and the largest playlist id the model was trained on.
+    """
+    if os.path.isfile(path):
+        saved = torch.load(path)
+        state_dict, vocabulary = saved.pop("state_dict"), saved.pop("vocabulary")
+        metadata = saved
+    else:
+        state_dict, vocabulary, metadata = checkpoint.load(path)
+    multi_hot_encoder = MultiHotEncoder(vocabulary, sort=False)
+    if metadata.get("model") == "skip-gram":
+        model = SkipGram(
+            vocab_size=len(multi_hot_encoder.vocabulary),
+            embedding_dim=metadata["embedding_dim"],
+            window=metadata["window"],
+        )
+    else:
+        model = ContinousBagOfWords(
+            vocab_size=len(multi_hot_encoder.vocabulary),
+            embedding_dim=metadata["embedding_dim"],
+        )
+    # Use the loaded tensors instead of copying them, so they stay memory-mapped.
+    for name, param in model.named_parameters():
+        param.data = state_dict[name]
+    return model, multi_hot_encoder, metadata["last_pid"]
+
+
+def load_optimizer_state(path: str, optimizer: optim.Optimizer) -> bool:
+    """Load the optimizer state saved with `save_checkpoint`.
+
+    Arguments:
+        path: path to the checkpoint.
+        optimizer: the optimizer of the parameters of the model loaded from `path`.
+
+    Returns:
+        Whether there was a state to load. If not, the optimizer starts from scratch.
+    """
+    if os.path.isfile(path):
+        return False
+    tensors, _, metadata = checkpoint.load(path)
+    if metadata.get("optimizer") is None:
+        return False
+    state = {
+        int(index): dict(param_state)
+        for index, param_state in metadata["optimizer"]["state"].items()
+    }
+    for name, tensor in tensors.items():
+        if name.startswith(OPTIMIZER_PREFIX):
+            index, key = name[len(OPTIMIZER_PREFIX) :].split(".", 1)
+            state.setdefault(int(index), {})[key] = tensor
+    optimizer.load_state_dict(
+        {"state": state, "param_groups": metadata["optimizer"]["param_groups"]}
+    )
+    return True
+
+
+def checkpoint_position(path: str) -> Optional[dict]:
+    """Where to resume training from, as passed to `save_checkpoint`, without loading
+    the model."""
+    return checkpoint.read_index(path)["metadata"].get("position")
@@ -9,22 +9,44 @@ class MultiHotEncoder:
     """Encode values into multi hot encodings.
 
     Attributes:
-        vocabulary: Sorted list of the vocabulary.
+        vocabulary: List of the vocabulary. Sorted on creation unless `sort` is false.
+            Tokens added with `extend` are appended so existing indices don't change.
         indicis: Quick lookup for indices of each item in the vocabulary.
     """
 
     vocabulary: List[Hashable]
     indices: Dict[Hashable, int]
 
-    def __init__(self, vocabulary: Iterable[Hashable]):
+    def __init__(self, vocabulary: Iterable[Hashable], sort: bool = True):
         """Initiate an instance of the class.
 
         Arguments:
             See class docstring
+            sort: whether to sort the vocabulary. Pass false to keep the order of a
+                vocabulary saved from another encoder.
         """
-        self.vocabulary = sorted(set(vocabulary))  # remove duplicates and sort
+        if sort:
+            self.vocabulary = sorted(set(vocabulary))  # remove duplicates and sort
+        else:
+            self.vocabulary = list(dict.fromkeys(vocabulary))  # keep the order
         self.indices = {t: i for i, t in enumerate(self.vocabulary)}
 
+    def extend(self, tokens: Iterable[Hashable]) -> int:
+        """Add new tokens to the end of the vocabulary. Tokens that are already in the
+        vocabulary are ignored.
+
+        Arguments:
+            tokens: tokens to add.
+
+        Returns:
+            The number of tokens that were added.
+        """
+        new_tokens = sorted(set(tokens).difference(self.indices))
+        for token in new_tokens:
+            self.indices[token] = len(self.vocabulary)
+            self.vocabulary.append(token)
+        return len(new_tokens)
+
     def encode(self, token_lists: List[List[Hashable]]) -> torch.Tensor:
         """Take a list of list of tokens and multihot encode them.
 
@@ -50,3 +72,18 @@ class MultiHotEncoder:
             values=values,
             size=(len(token_lists), len(self.vocabulary)),
         )
+
+    def to_indices(self, token_lists: List[List[Hashable]]) -> List[torch.Tensor]:
+        """Take a list of list of tokens and replace each token by its index, keeping
+        the order.
+
+        Arguments:
+            token_lists: the decoded data.
+
+        Returns:
+            A 1D long tensor of indices for each list of tokens.
+        """
+        return [
+            torch.tensor([self.indices[t] for t in x_i], dtype=torch.long)
+            for x_i in token_lists
+        ]
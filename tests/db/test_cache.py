@@ -0,0 +1,127 @@
+"""Tests for the artifact cache."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import sqlalchemy
+
+from song2vec import embeddings
+from song2vec.cache import ArtifactCache, db_fingerprint
+from song2vec.cli import load
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.instrumentation import METRICS
+
+from .utils import load_synthetic
+
+
+class ArtifactCacheTestCase(unittest.TestCase):
+    """Test that entries are reused until the db changes."""
+
+    tmp_dir: str
+    cache_dir: str
+    db_url: str
+    engine: sqlalchemy.engine.Engine
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+        # The db `load_synthetic` loads into.
+        self.db_url = f"sqlite:///{os.path.join(self.tmp_dir, 'synthetic.db')}"
+        self.engine = sqlalchemy.create_engine(self.db_url)
+        METRICS.reset()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def load(self, num_playlists: int):
+        """Load synthetic slices of 10 playlists until there are `num_playlists`. Most
+        tracks are only in one playlist."""
+        load_synthetic(
+            self.tmp_dir,
+            "synthetic",
+            ["--cache-dir", self.cache_dir],
+            num_playlists=num_playlists,
+            num_tracks=1000,
+            playlists_per_slice=10,
+            max_length=20,
+        )
+
+    def test_fingerprint(self):
+        """Test that the fingerprint changes when rows are inserted or deleted."""
+        self.load(10)
+        first = db_fingerprint(self.engine)
+        self.assertEqual(db_fingerprint(self.engine), first)
+        self.load(20)
+        second = db_fingerprint(self.engine)
+        self.assertNotEqual(second, first)
+        load.remove_unique_tracks(sqlalchemy.orm.sessionmaker(bind=self.engine)())
+        self.assertNotEqual(db_fingerprint(self.engine), second)
+
+    def test_vocabulary(self):
+        """Test that the vocabulary is cached until new playlists are loaded."""
+        self.load(10)
+        cache = ArtifactCache(self.cache_dir)
+        vocabulary = MillionPlaylistDataset(self.db_url).multi_hot_encoder.vocabulary
+        for _ in range(2):
+            dataset = MillionPlaylistDataset(self.db_url, cache=cache)
+            self.assertEqual(dataset.multi_hot_encoder.vocabulary, vocabulary)
+        self.assertEqual(METRICS.counters["cache.misses"], 1)
+        self.assertEqual(METRICS.counters["cache.hits"], 1)
+        self.assertEqual(len(cache.entries()), 1)
+
+        # Loading removes the entry of the old db.
+        self.load(20)
+        self.assertEqual(cache.entries(), [])
+        METRICS.reset()
+        dataset = MillionPlaylistDataset(self.db_url, cache=cache)
+        self.assertEqual(
+            dataset.multi_hot_encoder.vocabulary,
+            MillionPlaylistDataset(self.db_url).multi_hot_encoder.vocabulary,
+        )
+        self.assertEqual(METRICS.counters["cache.misses"], 1)
+
+    def test_track_frequencies(self):
+        """Test that the number of playlists of each track is cached."""
+        self.load(10)
+        cache = ArtifactCache(self.cache_dir)
+        vocabulary = MillionPlaylistDataset(self.db_url).multi_hot_encoder.vocabulary
+        expected = embeddings.track_frequencies(self.engine, vocabulary)
+        for _ in range(2):
+            np.testing.assert_array_equal(
+                embeddings.track_frequencies(self.engine, vocabulary, cache), expected
+            )
+        self.assertEqual(METRICS.counters["cache.misses"], 1)
+        self.assertEqual(METRICS.counters["cache.hits"], 1)
+
+    def test_playlist_lengths(self):
+        """Test that the number of tracks of each playlist is cached."""
+        self.load(10)
+        expected = MillionPlaylistDataset(self.db_url).playlist_lengths()
+        dataset = MillionPlaylistDataset(
+            self.db_url, cache=ArtifactCache(self.cache_dir)
+        )
+        METRICS.reset()
+        for _ in range(2):
+            self.assertEqual(dataset.playlist_lengths(), expected)
+        self.assertEqual(METRICS.counters["cache.misses"], 1)
+        self.assertEqual(METRICS.counters["cache.hits"], 1)
+
+    def test_evict(self):
+        """Test that the least recently used entries are evicted."""
+        cache = ArtifactCache(self.cache_dir, max_bytes=2500)
+        for i in range(3):
+            cache.get_or_build("data", "source", "fp", lambda: b"x" * 1000, {"i": i})
+            # Make sure modification times differ.
+            for j, path in enumerate(cache.entries()):
+                os.utime(path, (j, j))
+        cache.get_or_build("data", "source", "fp", lambda: None, {"i": 1})
+        cache.get_or_build("data", "source", "fp", lambda: b"x" * 1000, {"i": 3})
+        self.assertEqual(len(cache.entries()), 2)
+        self.assertEqual(METRICS.counters["cache.hits"], 1)
+        # The entry that was read last is kept.
+        self.assertEqual(
+            cache.get_or_build("data", "source", "fp", lambda: None, {"i": 1}),
+            b"x" * 1000,
+        )
@@ -0,0 +1,65 @@
+"""Tests for building artist and album embeddings from the playlists in a db."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from song2vec import embeddings, training
+from song2vec.cli.commands.build_embeddings import build_embeddings
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.models.skip_gram import SkipGram
+
+from .utils import load_synthetic
+
+
+class BuildEmbeddingsTestCase(unittest.TestCase):
+    """Test building indexes from a trained model and the db."""
+
+    tmp_dir: str
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_build(self):
+        """Test building the indexes from the command line."""
+        db_url = load_synthetic(
+            self.tmp_dir, "synthetic", num_playlists=20, num_tracks=100
+        )
+        dataset = MillionPlaylistDataset(db_url)
+        vocabulary = dataset.multi_hot_encoder.vocabulary
+        checkpoint = os.path.join(self.tmp_dir, "checkpoint")
+        training.save_checkpoint(
+            checkpoint, SkipGram(len(vocabulary), 4), dataset.multi_hot_encoder, 19
+        )
+
+        output_dir = os.path.join(self.tmp_dir, "embeddings")
+        result = CliRunner().invoke(
+            build_embeddings,
+            [
+                "--db-url",
+                db_url,
+                "--checkpoint",
+                checkpoint,
+                "--output-dir",
+                output_dir,
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(
+            len(embeddings.EmbeddingIndex(os.path.join(output_dir, "track"))),
+            len(vocabulary),
+        )
+
+        # Synthetic artists have ten tracks each. The loader strips uri prefixes.
+        artists = embeddings.EmbeddingIndex(os.path.join(output_dir, "artist"))
+        self.assertCountEqual(
+            artists.vocabulary, {str(int(x) // 10) for x in vocabulary}
+        )
+        self.assertEqual(artists.metadata["kind"], "artist")
+        (results,) = artists.most_similar([artists.vocabulary[0]], k=3)
+        self.assertEqual(len(results), 3)
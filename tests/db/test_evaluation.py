@@ -0,0 +1,80 @@
+"""Tests for evaluating models on the playlists in a db."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from song2vec import evaluation, training
+from song2vec.cli.commands.evaluate import evaluate
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+
+from .utils import load_synthetic
+
+
+class EvaluateTestCase(unittest.TestCase):
+    """Test evaluating a model on synthetic playlists."""
+
+    tmp_dir: str
+    db_url: str
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.db_url = load_synthetic(
+            cls.tmp_dir,
+            "synthetic",
+            num_playlists=50,
+            num_tracks=200,
+            min_length=20,
+            max_length=30,
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_workers(self):
+        """Test that the process pool gives the same results as a single process."""
+        dataset = MillionPlaylistDataset(self.db_url)
+        model = ContinousBagOfWords(len(dataset.multi_hot_encoder.vocabulary), 8)
+        weights = evaluation.export_weights(model)
+        keys = evaluation.sample_keys(dataset, 40)
+        self.assertEqual(len(keys), 40)
+
+        results = evaluation.evaluate(weights, dataset, keys, batch_size=8)
+        self.assertEqual(results["playlists"], 40)
+        self.assertEqual(
+            evaluation.evaluate(weights, dataset, keys, batch_size=8, num_workers=2),
+            results,
+        )
+
+    def test_cli(self):
+        """Test evaluating a checkpoint from the command line."""
+        dataset = MillionPlaylistDataset(self.db_url)
+        checkpoint = os.path.join(self.tmp_dir, "checkpoint")
+        model = ContinousBagOfWords(len(dataset.multi_hot_encoder.vocabulary), 8)
+        training.save_checkpoint(checkpoint, model, dataset.multi_hot_encoder, 49)
+
+        result = CliRunner().invoke(
+            evaluate,
+            [
+                "--db-url",
+                self.db_url,
+                "--checkpoint",
+                checkpoint,
+                "--num-recommendations",
+                "50",
+                "--num-workers",
+                "1",
+            ],
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        results = json.loads(result.stdout)
+        self.assertEqual(results["playlists"], 50)
+        for metric in ("r_precision", "ndcg"):
+            self.assertGreaterEqual(results[metric], 0)
+            self.assertLessEqual(results[metric], 1)
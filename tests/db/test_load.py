@@ -1,13 +1,25 @@
 """Tests for Click data loading commands."""
+
+import gzip
+import importlib.util
+import json
+import multiprocessing
 import os
+import shutil
 import sqlite3
+import tempfile
+import unittest
+import zipfile
 
 from click.testing import CliRunner, Result
+from sqlalchemy import create_engine, text
 
 from song2vec import db
-from song2vec.cli.__main__ import load_playlists
+from song2vec.cli import load
+from song2vec.cli.commands.load_playlists import load_playlists
+from song2vec.data.datasets import MillionPlaylistDataset
 
-from .utils import AbstractDbTestCase
+from .utils import AbstractDbTestCase, load_synthetic
 
 
 class LoadTestCase(AbstractDbTestCase):
@@ -79,3 +91,236 @@ class LoadTestCase(AbstractDbTestCase):
         self.assertEqual(toxic.name, "Toxic")
         self.assertEqual(len(toxic.playlist_associations), 2)
         self.assertEqual(toxic.album.name, "In The Zone")
+        self.assertEqual(throwbacks.track_associations[0].pos, 1)
+
+
+class CompressedLoadTestCase(AbstractDbTestCase):
+    """Test that we can load the zip archive and compressed slices."""
+
+    tmp_dir: str
+    archive_path: str
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.db_url = f"sqlite:///{os.path.join(cls.tmp_dir, 'db')}"
+        cls.archive_path = os.path.join(cls.tmp_dir, "mpd.zip")
+        with zipfile.ZipFile(cls.archive_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for filename in ("mpd.slice.0-2.json", "mpd.slice.2-3.json"):
+                archive.write(os.path.join("tests/data", filename), f"data/{filename}")
+            archive.writestr("README.md", "Not a slice.")
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_get_slices(self):
+        """Test that slices are found in the archive."""
+        self.assertCountEqual(
+            load.get_slices(self.archive_path),
+            [
+                f"{self.archive_path}::data/mpd.slice.0-2.json",
+                f"{self.archive_path}::data/mpd.slice.2-3.json",
+            ],
+        )
+        self.assertEqual(
+            load.get_slice_name(f"{self.archive_path}::data/mpd.slice.0-2.json"),
+            "mpd.slice.0-2.json",
+        )
+        self.assertEqual(
+            load.get_slice_name("data/mpd.slice.0-2.json.gz"), "mpd.slice.0-2.json"
+        )
+
+    def test_read_raw_slice(self):
+        """Test that compressed slices are decompressed."""
+        with open("tests/data/mpd.slice.0-2.json", "rb") as file:
+            expected = file.read()
+        raw_data_dir = os.path.join(self.tmp_dir, "raw")
+        os.makedirs(raw_data_dir, exist_ok=True)
+        gzip_path = os.path.join(raw_data_dir, "mpd.slice.0-2.json.gz")
+        with gzip.open(gzip_path, "wb") as file:
+            file.write(expected)
+        self.assertEqual(load.get_slices(raw_data_dir), [gzip_path])
+        # The uncompressed copy is preferred.
+        json_path = os.path.join(raw_data_dir, "mpd.slice.0-2.json")
+        shutil.copy("tests/data/mpd.slice.0-2.json", json_path)
+        self.assertEqual(load.get_slices(raw_data_dir), [json_path])
+
+        self.assertEqual(load.read_raw_slice(gzip_path), expected)
+        os.remove(json_path)
+        self.assertEqual(
+            load.read_raw_slice(f"{self.archive_path}::data/mpd.slice.0-2.json"),
+            expected,
+        )
+
+    def test_load_duplicates(self):
+        """Test that a slice in several files is only loaded once."""
+        raw_data_dir = os.path.join(self.tmp_dir, "duplicates")
+        os.mkdir(raw_data_dir)
+        for filename in ("mpd.slice.0-2.json", "mpd.slice.2-3.json"):
+            shutil.copy(os.path.join("tests/data", filename), raw_data_dir)
+            with open(os.path.join("tests/data", filename), "rb") as file, gzip.open(
+                os.path.join(raw_data_dir, f"{filename}.gz"), "wb"
+            ) as gzip_file:
+                gzip_file.write(file.read())
+        db_url = f"sqlite:///{os.path.join(self.tmp_dir, 'duplicates.db')}"
+        result = CliRunner().invoke(
+            load_playlists,
+            ["--raw-data-dir", raw_data_dir, "--db-url", db_url, "--num-workers", "2"],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+
+    @unittest.skipIf(importlib.util.find_spec("zstandard") is None, "needs zstandard")
+    def test_read_zstd(self):
+        """Test that zstd compressed slices are decompressed."""
+        # pylint: disable=import-outside-toplevel
+        import zstandard
+
+        with open("tests/data/mpd.slice.2-3.json", "rb") as file:
+            expected = file.read()
+        zstd_path = os.path.join(self.tmp_dir, "mpd.slice.2-3.json.zst")
+        with open(zstd_path, "wb") as file:
+            file.write(zstandard.ZstdCompressor().compress(expected))
+        self.assertEqual(load.read_raw_slice(zstd_path), expected)
+
+    def test_load_archive(self):
+        """Test that the archive can be loaded without extracting it."""
+        result = CliRunner().invoke(
+            load_playlists,
+            ["--raw-data-dir", self.archive_path, "--db-url", self.db_url],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(3, self.session.query(db.Playlist).count())
+        self.assertCountEqual(
+            ["mpd.slice.0-2.json", "mpd.slice.2-3.json"],
+            [x for x, in self.session.query(db.Slice.name).all()],
+        )
+
+
+class LegacyDbTestCase(AbstractDbTestCase):
+    """Test loading into dbs created by older versions."""
+
+    tmp_dir: str
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.db_url = f"sqlite:///{os.path.join(cls.tmp_dir, 'db')}"
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_parser_killed(self):
+        """Test that the writer doesn't wait for a parser that died without sending its
+        `None`."""
+        queue = multiprocessing.Queue()
+        parsers = [
+            multiprocessing.Process(
+                target=load.parse_slices,
+                args=(["tests/data/mpd.slice.0-2.json"], queue),
+            ),
+            # Exits without sending anything, like a killed parser.
+            multiprocessing.Process(
+                target=os._exit, args=(1,)  # pylint: disable=protected-access
+            ),
+        ]
+        for parser in parsers:
+            parser.start()
+        db_url = f"sqlite:///{os.path.join(self.tmp_dir, 'killed.db')}"
+        db.Base.metadata.create_all(create_engine(db_url))
+        with self.assertRaises(RuntimeError):
+            load.write_rows(db_url, queue, parsers, timeout=0.1)
+        for parser in parsers:
+            parser.join()
+
+    def test_writer_fails(self):
+        """Test that the command exits when the writer fails while parsers still have
+        rows to send."""
+        raw_data_dir = os.path.join(self.tmp_dir, "duplicates")
+        os.mkdir(raw_data_dir)
+        # Slices with the same playlists, so the second one inserted fails.
+        for i in range(20):
+            shutil.copy(
+                "tests/data/mpd.slice.0-2.json",
+                os.path.join(raw_data_dir, f"mpd.slice.{100 + i}-{100 + i}.json"),
+            )
+        db_url = f"sqlite:///{os.path.join(self.tmp_dir, 'duplicates.db')}"
+        result = CliRunner().invoke(
+            load_playlists,
+            ["--raw-data-dir", raw_data_dir, "--db-url", db_url]
+            + ["--num-workers", "2", "--commit-every", "1"],
+        )
+        self.assertEqual(1, result.exit_code, result.output)
+        self.assertIn("Writing to the db failed", result.output)
+
+    def test_add_missing_columns(self):
+        """Test that columns added after a db was created are added when loading."""
+        db_url = f"sqlite:///{os.path.join(self.tmp_dir, 'no_pos.db')}"
+        engine = create_engine(db_url)
+        db.Base.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(text("ALTER TABLE association DROP COLUMN pos"))
+
+        result = CliRunner().invoke(
+            load_playlists, ["--raw-data-dir", "tests/data", "--db-url", db_url]
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(load.add_missing_columns(engine), [])
+        with engine.connect() as connection:
+            self.assertEqual(
+                connection.execute(
+                    text("SELECT pos FROM association WHERE playlist_id = 0")
+                ).all(),
+                [(1,)],
+            )
+
+    def test_null_positions(self):
+        """Test that tracks loaded without positions are in the order of the playlist."""
+        db_url = load_synthetic(
+            self.tmp_dir,
+            "null_positions",
+            num_playlists=5,
+            num_tracks=50,
+            min_length=5,
+            max_length=10,
+        )
+        with create_engine(db_url).begin() as connection:
+            connection.execute(text("UPDATE association SET pos = NULL"))
+            # Without a tie-breaker, SQLite would return the tracks in the order of
+            # this index.
+            connection.execute(
+                text("CREATE INDEX pos ON association (playlist_id, pos, track_uri)")
+            )
+
+        with open(
+            os.path.join(self.tmp_dir, "null_positions", "mpd.slice.0-4.json")
+        ) as file:
+            playlists = json.load(file)["playlists"]
+        self.assertEqual(
+            MillionPlaylistDataset(db_url).query_sequences(
+                [str(x["pid"]) for x in playlists]
+            ),
+            [
+                [track["track_uri"].split(":")[-1] for track in x["tracks"]]
+                for x in playlists
+            ],
+        )
+
+    def test_no_slices(self):
+        """Test that a db with playlists but no slices isn't loaded into again."""
+        result = CliRunner().invoke(
+            load_playlists, ["--raw-data-dir", "tests/data", "--db-url", self.db_url]
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.session.query(db.Slice).delete()
+        self.session.commit()
+
+        result = CliRunner().invoke(
+            load_playlists, ["--raw-data-dir", "tests/data", "--db-url", self.db_url]
+        )
+        self.assertEqual(1, result.exit_code, result.output)
+        self.assertIn("older version", result.output)
+        self.assertEqual(3, self.session.query(db.Playlist).count())
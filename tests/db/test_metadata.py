@@ -0,0 +1,61 @@
+"""Tests for the metadata resolver."""
+import unittest
+
+import numpy as np
+
+from song2vec.data.metadata import MetadataResolver, TrackInfo
+from song2vec.instrumentation import METRICS
+
+DB_URL = "sqlite:///tests/data/test.db"
+TOXIC = TrackInfo(
+    "6I9VzXrHxO9rA9A5euc8Ak",
+    "Toxic",
+    "26dSoYclwsYLMAKD3tpOr4",
+    "Britney Spears",
+    "0z7pVBGOD7HCIB7S8eLkLI",
+    "In The Zone",
+)
+LIKE_YOU = TrackInfo(
+    "74tqql9zP6JjF5hjkHHUXp",
+    "Like You",
+    "7lXgbtBDcCRbfc5f8FhGUL",
+    "Hoody",
+    "7hq1c0ZrLiSKxzhoRacoG7",
+    "On And On",
+)
+
+
+class MetadataResolverTestCase(unittest.TestCase):
+    """Test looking up tracks by uri and index."""
+
+    def setUp(self):
+        METRICS.reset()
+
+    def test_resolve(self):
+        """Test that uris, indices and unknown tracks are resolved in order."""
+        resolver = MetadataResolver(DB_URL, vocabulary=[TOXIC.uri, LIKE_YOU.uri])
+        self.assertEqual(
+            resolver.resolve([LIKE_YOU.uri, 0, "unknown", 1]),
+            [LIKE_YOU, TOXIC, None, LIKE_YOU],
+        )
+        self.assertEqual(METRICS.counters["metadata.queries"], 1)
+        self.assertEqual(resolver.resolve(np.array([1, 0])), [LIKE_YOU, TOXIC])
+
+    def test_cache(self):
+        """Test that cached tracks don't hit the db and the cache is bounded."""
+        resolver = MetadataResolver(DB_URL, cache_size=1)
+        self.assertEqual(resolver.resolve([TOXIC.uri]), [TOXIC])
+        self.assertEqual(resolver.resolve([TOXIC.uri]), [TOXIC])
+        self.assertEqual(METRICS.counters["metadata.queries"], 1)
+        self.assertEqual(resolver.resolve([LIKE_YOU.uri]), [LIKE_YOU])
+        self.assertEqual(list(resolver.cache), [LIKE_YOU.uri])
+
+    def test_preload(self):
+        """Test that preloaded tracks are resolved without queries."""
+        resolver = MetadataResolver(DB_URL, preload=True)
+        self.assertEqual(len(resolver.table), 2)
+        self.assertEqual(
+            resolver.resolve([TOXIC.uri, "unknown", LIKE_YOU.uri]),
+            [TOXIC, None, LIKE_YOU],
+        )
+        self.assertEqual(METRICS.counters["metadata.queries"], 1)
@@ -0,0 +1,84 @@
+"""Tests for the Parquet storage backend."""
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from song2vec.cli.commands.load_playlists import load_playlists
+from song2vec.data.datasets import MillionPlaylistDataset
+
+from .utils import AbstractDbTestCase
+
+
+@unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "requires pyarrow")
+class ParquetPlaylistDatasetTestCase(AbstractDbTestCase):
+    """Test that the Parquet files have the same data as the db."""
+
+    tmp_dir: str
+    parquet_dir: str
+
+    @classmethod
+    def setUpClass(cls):
+        # pylint: disable=import-outside-toplevel
+        from song2vec.data.parquet import ParquetPlaylistDataset
+
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.db_url = f"sqlite:///{os.path.join(cls.tmp_dir, 'db')}"
+        cls.parquet_dir = os.path.join(cls.tmp_dir, "parquet")
+        super().setUpClass()
+
+        cli_runner = CliRunner()
+        for args in (["--db-url", cls.db_url], ["--parquet-dir", cls.parquet_dir]):
+            result = cli_runner.invoke(
+                load_playlists, ["--raw-data-dir", "tests/data"] + args
+            )
+            assert result.exit_code == 0, result.output
+        cls.dataset = ParquetPlaylistDataset(cls.parquet_dir)
+        cls.db_dataset = MillionPlaylistDataset(cls.db_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_files(self):
+        """Test that there is a file per table and slice."""
+        for table in ("artist", "album", "track", "playlist", "association"):
+            self.assertCountEqual(
+                os.listdir(os.path.join(self.parquet_dir, table)),
+                ["mpd.slice.0-2.parquet", "mpd.slice.2-3.parquet"],
+            )
+
+    def test_same_as_db(self):
+        """Test that the dataset returns the same playlists as the db."""
+        self.assertEqual(len(self.dataset), len(self.db_dataset))
+        self.assertCountEqual(self.dataset.keys, self.db_dataset.keys)
+        self.assertEqual(self.dataset.keys_after(0), self.db_dataset.keys_after(0))
+        self.assertEqual(
+            self.dataset.multi_hot_encoder.vocabulary,
+            self.db_dataset.multi_hot_encoder.vocabulary,
+        )
+        keys = [str(key) for key in self.db_dataset.keys]
+        self.assertEqual(
+            [sorted(x) for x in self.dataset.query_db(keys)],
+            [sorted(x) for x in self.db_dataset.query_db(keys)],
+        )
+        self.assertEqual(
+            self.dataset.query_sequences(keys), self.db_dataset.query_sequences(keys)
+        )
+        self.assertEqual(
+            self.dataset.playlist_lengths(), self.db_dataset.playlist_lengths()
+        )
+
+    def test_incremental(self):
+        """Test that slices that were already written are skipped."""
+        path = os.path.join(self.parquet_dir, "association", "mpd.slice.0-2.parquet")
+        modified = os.path.getmtime(path)
+        result = CliRunner().invoke(
+            load_playlists,
+            ["--raw-data-dir", "tests/data", "--parquet-dir", self.parquet_dir],
+        )
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(modified, os.path.getmtime(path))
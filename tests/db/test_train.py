@@ -0,0 +1,275 @@
+"""Tests for incremental loading and training."""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from click.testing import CliRunner
+
+from song2vec import db, training
+from song2vec.checkpoint import vocabulary_fingerprint
+from song2vec.cli.commands.load_playlists import load_playlists
+from song2vec.cli.commands.train import train
+from song2vec.data.datasets import MillionPlaylistDataset
+from song2vec.inference import InferenceEngine
+from song2vec.instrumentation import METRICS
+from song2vec.models.sharded_embedding import ShardedEmbedding
+from song2vec.models.skip_gram import SkipGram
+
+from .utils import AbstractDbTestCase, load_synthetic
+
+
+class IncrementalTrainTestCase(AbstractDbTestCase):
+    """Test that new slices can be loaded and trained on without starting over."""
+
+    cli_runner: CliRunner
+    tmp_dir: str
+    raw_data_dir: str
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.raw_data_dir = os.path.join(cls.tmp_dir, "raw")
+        os.mkdir(cls.raw_data_dir)
+        cls.db_url = f"sqlite:///{os.path.join(cls.tmp_dir, 'db')}"
+        super().setUpClass()
+        cls.cli_runner = CliRunner()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def load(self, slice_name: str):
+        """Add a slice to the raw data dir and load the dir."""
+        shutil.copy(os.path.join("tests/data", slice_name), self.raw_data_dir)
+        result = self.cli_runner.invoke(
+            load_playlists,
+            ["--raw-data-dir", self.raw_data_dir, "--db-url", self.db_url],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+
+    def test_incremental(self):
+        """Test loading a second slice and warm-starting from a checkpoint."""
+        first_checkpoint = os.path.join(self.tmp_dir, "first")
+        second_checkpoint = os.path.join(self.tmp_dir, "second")
+
+        self.load("mpd.slice.0-2.json")
+        num_tracks = self.session.query(db.Track).count()
+        result = self.cli_runner.invoke(
+            train,
+            ["--db-url", self.db_url, "--checkpoint", first_checkpoint]
+            + ["--embedding-dim", "4"],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        model, encoder, last_pid = training.load_checkpoint(first_checkpoint)
+        self.assertEqual(model.vocab_size, num_tracks)
+        self.assertEqual(last_pid, 1)
+
+        # Loading again should only load the new slice.
+        self.load("mpd.slice.2-3.json")
+        self.assertEqual(2, self.session.query(db.Slice).count())
+        self.assertEqual(3, self.session.query(db.Playlist).count())
+        self.assertEqual(
+            self.session.query(db.Track).count(),
+            self.session.query(db.Track.uri).distinct().count(),
+        )
+
+        result = self.cli_runner.invoke(
+            train,
+            ["--db-url", self.db_url, "--checkpoint", second_checkpoint]
+            + ["--warm-start", first_checkpoint],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        grown, grown_encoder, last_pid = training.load_checkpoint(second_checkpoint)
+        self.assertEqual(last_pid, 2)
+        self.assertEqual(grown.vocab_size, self.session.query(db.Track).count())
+        self.assertEqual(
+            grown_encoder.vocabulary[: model.vocab_size], encoder.vocabulary
+        )
+
+    def test_skip_gram(self):
+        """Test training a skip-gram model on ordered playlists."""
+        db_url = load_synthetic(
+            self.tmp_dir,
+            "synthetic",
+            num_playlists=10,
+            num_tracks=30,
+            min_length=2,
+            max_length=10,
+        )
+
+        checkpoint = os.path.join(self.tmp_dir, "skip_gram")
+        result = self.cli_runner.invoke(
+            train,
+            ["--db-url", db_url, "--checkpoint", checkpoint, "--model", "skip-gram"]
+            + ["--window", "3", "--embedding-dim", "4", "--batch-size", "4"],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        model, _, last_pid = training.load_checkpoint(checkpoint)
+        self.assertIsInstance(model, SkipGram)
+        self.assertEqual(model.window, 3)
+        self.assertEqual(last_pid, 9)
+
+    def test_max_tokens(self):
+        """Test training on batches of playlists of similar lengths."""
+        db_url = load_synthetic(
+            self.tmp_dir,
+            "max_tokens",
+            num_playlists=20,
+            num_tracks=30,
+            min_length=1,
+            max_length=20,
+        )
+
+        dataset = MillionPlaylistDataset(db_url)
+        lengths = dataset.playlist_lengths()
+        self.assertEqual(
+            [len(x) for x in dataset.query_sequences(list(lengths))],
+            list(lengths.values()),
+        )
+        for model_name in ("cbow", "skip-gram"):
+            checkpoint = os.path.join(self.tmp_dir, f"max_tokens_{model_name}")
+            result = self.cli_runner.invoke(
+                train,
+                ["--db-url", db_url, "--checkpoint", checkpoint, "--model", model_name]
+                + ["--embedding-dim", "4", "--max-tokens", "40", "--epochs", "2"],
+            )
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertEqual(training.load_checkpoint(checkpoint)[2], 19)
+
+    def test_resume(self):
+        """Test resuming training from a checkpoint saved during training."""
+        db_url = load_synthetic(
+            self.tmp_dir,
+            "resume",
+            num_playlists=10,
+            num_tracks=30,
+            min_length=2,
+            max_length=10,
+        )
+
+        # Save a checkpoint halfway through the second epoch, like an interrupted run.
+        dataset = MillionPlaylistDataset(db_url)
+        model = SkipGram(len(dataset.multi_hot_encoder.vocabulary), 4)
+        checkpoint = os.path.join(self.tmp_dir, "resume")
+        position = {
+            "epoch": 1,
+            "batch": 2,
+            "keys": vocabulary_fingerprint(dataset.keys_after(-1)),
+            "batching": {"batch_size": 2, "max_tokens": 0, "seed": 0},
+        }
+        training.save_checkpoint(
+            checkpoint, model, dataset.multi_hot_encoder, -1, position=position
+        )
+
+        steps = []
+        training.fit_skip_gram(
+            model,
+            dataset,
+            dataset.keys_after(-1),
+            epochs=2,
+            batch_size=2,
+            start=(1, 2),
+            on_step=lambda epoch, batch: steps.append((epoch, batch)),
+        )
+        self.assertEqual(steps, [(1, 3), (1, 4), (1, 5)])
+
+        # The batch size of the interrupted run is used.
+        with self.assertLogs(level="WARNING") as logs:
+            result = self.cli_runner.invoke(
+                train,
+                ["--db-url", db_url, "--checkpoint", checkpoint, "--resume"]
+                + ["--epochs", "2", "--batch-size", "5", "--checkpoint-every", "1"],
+            )
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("batch_size", "".join(logs.output))
+        self.assertEqual(METRICS.counters["train.steps"], 3)
+        self.assertIsNone(training.checkpoint_position(checkpoint))
+        self.assertEqual(training.load_checkpoint(checkpoint)[2], 9)
+
+        del position["batching"]
+        training.save_checkpoint(
+            checkpoint, model, dataset.multi_hot_encoder, -1, position=position
+        )
+        result = self.cli_runner.invoke(
+            train, ["--db-url", db_url, "--checkpoint", checkpoint, "--resume"]
+        )
+        self.assertNotEqual(0, result.exit_code)
+        self.assertIn("batching", result.output)
+
+        # The positions would point to other playlists once more are loaded.
+        position["batching"] = {"batch_size": 2, "max_tokens": 0, "seed": 0}
+        training.save_checkpoint(
+            checkpoint, model, dataset.multi_hot_encoder, -1, position=position
+        )
+        load_synthetic(
+            self.tmp_dir,
+            "resume",
+            num_playlists=20,
+            num_tracks=30,
+            playlists_per_slice=10,
+        )
+        result = self.cli_runner.invoke(
+            train, ["--db-url", db_url, "--checkpoint", checkpoint, "--resume"]
+        )
+        self.assertNotEqual(0, result.exit_code)
+        self.assertIn("changed", result.output)
+
+    def test_sharded_skip_gram(self):
+        """Test that training embeddings in sharded tables decreases the loss."""
+        db_url = load_synthetic(
+            self.tmp_dir,
+            "sharded",
+            num_playlists=20,
+            num_tracks=50,
+            min_length=5,
+            max_length=20,
+        )
+
+        dataset = MillionPlaylistDataset(db_url)
+        vocab_size = len(dataset.multi_hot_encoder.vocabulary)
+        inputs = ShardedEmbedding(
+            os.path.join(self.tmp_dir, "inputs"), vocab_size, 8, num_shards=3
+        )
+        outputs = ShardedEmbedding(
+            os.path.join(self.tmp_dir, "outputs"), vocab_size, 8, init_std=0.01
+        )
+        losses = training.fit_sharded_skip_gram(
+            inputs,
+            outputs,
+            dataset,
+            dataset.keys_after(-1),
+            window=3,
+            epochs=5,
+            batch_size=4,
+        )
+        self.assertLess(losses[-1], losses[0])
+
+        # The tables are exported to a checkpoint like the other models.
+        checkpoint = os.path.join(self.tmp_dir, "sharded_checkpoint")
+        training.save_sharded_checkpoint(
+            checkpoint, inputs, outputs, dataset.multi_hot_encoder, 19, 3
+        )
+        model, _, last_pid = training.load_checkpoint(checkpoint)
+        self.assertIsInstance(model, SkipGram)
+        self.assertEqual(last_pid, 19)
+        np.testing.assert_array_equal(
+            model.embeddings.weight.detach().numpy(), inputs.to_numpy()
+        )
+        np.testing.assert_array_equal(
+            model.linear.weight.detach().numpy(), outputs.to_numpy()
+        )
+
+        result = self.cli_runner.invoke(
+            train,
+            ["--db-url", db_url, "--checkpoint", checkpoint]
+            + ["--model", "sharded-skip-gram", "--num-shards", "3", "--window", "3"]
+            + ["--embedding-dim", "8", "--learning-rate", "0.1"],
+        )
+        self.assertEqual(0, result.exit_code, result.output)
+        engine = InferenceEngine.from_checkpoint(checkpoint)
+        self.assertEqual(len(engine.recommend([[0, 1]], k=5)[0]), 5)
+        # The tables are removed once exported.
+        self.assertEqual(
+            [x for x in os.listdir(self.tmp_dir) if x.startswith("tmp")], []
+        )
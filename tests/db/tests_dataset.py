@@ -5,7 +5,7 @@ from click.testing import CliRunner
 from torch import tensor, testing
 
 from song2vec import db
-from song2vec.cli.__main__ import load_playlists
+from song2vec.cli.commands.load_playlists import load_playlists
 from song2vec.data.datasets import MillionPlaylistDataset
 
 from ..db.utils import AbstractDbTestCase
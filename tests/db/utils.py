@@ -1,10 +1,43 @@
 """Utility functions for testing the db."""
 # pylint: disable=invalid-name
+import os
+from typing import Sequence
 from unittest import TestCase
 
+from click.testing import CliRunner
 from sqlalchemy import create_engine, engine, orm
 
-from song2vec import db
+from song2vec import benchmark, db
+from song2vec.cli.commands.load_playlists import load_playlists
+
+
+def load_synthetic(
+    tmp_dir: str, name: str, load_args: Sequence[str] = (), **kwargs
+) -> str:
+    """Generate synthetic slices into a raw data dir of their own and load it into a db
+    of its own. Generating into the same dir again adds the new slices.
+
+    Arguments:
+        tmp_dir: directory to put the raw data dir and the db in.
+        name: name of the raw data dir and the db.
+        load_args: more arguments of `load_playlists`.
+        kwargs: passed to `benchmark.generate_slices`.
+
+    Returns:
+        The url of the db.
+    """
+    raw_data_dir = os.path.join(tmp_dir, name)
+    os.makedirs(raw_data_dir, exist_ok=True)
+    benchmark.generate_slices(raw_data_dir, **kwargs)
+    db_url = f"sqlite:///{os.path.join(tmp_dir, f'{name}.db')}"
+    result = CliRunner().invoke(
+        load_playlists,
+        ["--raw-data-dir", raw_data_dir, "--db-url", db_url, *load_args],
+    )
+    # Also called from `setUpClass`, where there are no assert methods.
+    if result.exit_code != 0:
+        raise AssertionError(result.output)
+    return db_url
 
 
 class AbstractDbTestCase(TestCase):
@@ -64,3 +64,39 @@ class ContinousBagOfWordsTestCase(unittest.TestCase):
         actual_embeddings, actual_y = self.model.create_batch(data_point=data_point)
         testing.assert_equal(actual_y, expected_y)
         testing.assert_allclose(actual_embeddings, expected_embeddings)
+
+    def test_create_batches(self):
+        """Test that a 2D batch gives the same examples as each of its bags."""
+        data_points = torch.tensor(
+            [
+                [0.0, 1.0, 0.0, 1.0, 1.0],
+                [1.0, 0.0, 0.0, 0.0, 0.0],
+                [1.0, 1.0, 0.0, 0.0, 0.0],
+            ]
+        ).to_sparse()
+        embeddings, y = self.model.create_batch(data_point=data_points)
+        expected = [self.model.create_batch(data_points[i].coalesce()) for i in (0, 2)]
+        testing.assert_close(y, torch.cat([x[1] for x in expected]))
+        testing.assert_close(embeddings, torch.cat([x[0] for x in expected]))
+
+    def test_grow(self):
+        """Test that growing the vocab keeps the weights of existing tokens."""
+        embeddings = self.model.embeddings.weight.detach().clone()
+        linear = self.model.linear.weight.detach().clone()
+        bias = self.model.linear.bias.detach().clone()
+
+        self.model.grow(self.vocab_size + 3)
+        self.assertEqual(self.model.vocab_size, self.vocab_size + 3)
+        self.assertEqual(self.model.embeddings.in_features, self.vocab_size + 3)
+        self.assertEqual(self.model.linear.out_features, self.vocab_size + 3)
+        testing.assert_close(
+            self.model.embeddings.weight[:, : self.vocab_size], embeddings
+        )
+        testing.assert_close(self.model.linear.weight[: self.vocab_size], linear)
+        testing.assert_close(self.model.linear.bias[: self.vocab_size], bias)
+
+        output = self.model(torch.rand(2, self.vocab_size + 3))
+        self.assertEqual(output.shape, (2, self.vocab_size + 3))
+
+        with self.assertRaises(ValueError):
+            self.model.grow(self.vocab_size)
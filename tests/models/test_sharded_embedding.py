@@ -0,0 +1,63 @@
+"""Tests for the sharded embedding table."""
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import torch
+
+from song2vec.models.sharded_embedding import ShardedEmbedding
+
+
+class ShardedEmbeddingTestCase(unittest.TestCase):
+    """Tests for the sharded embedding table."""
+
+    path: str
+    table: ShardedEmbedding
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.table = ShardedEmbedding(
+            self.path, num_embeddings=10, embedding_dim=3, num_shards=4
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_shards(self):
+        """Test that rows are split evenly and empty shards aren't created."""
+        self.assertEqual(self.table.num_shards, 4)
+        self.assertEqual([len(x) for x in self.table.weights], [3, 3, 3, 1])
+        small = ShardedEmbedding(
+            self.path + "/small", num_embeddings=5, embedding_dim=3, num_shards=4
+        )
+        self.assertEqual([len(x) for x in small.weights], [2, 2, 1])
+
+    def test_lookup(self):
+        """Test that rows are read from the right shard, in order."""
+        weights = self.table.to_numpy()
+        indices = np.array([9, 0, 3, 3, 5])
+        np.testing.assert_array_equal(self.table.lookup(indices), weights[indices])
+
+    def test_push(self):
+        """Test that pushes match dense Adagrad and are saved to disk."""
+        weights = torch.tensor(self.table.to_numpy(), requires_grad=True)
+        optimizer = torch.optim.Adagrad(
+            [weights], lr=self.table.learning_rate, eps=self.table.eps
+        )
+        indices = torch.tensor([[1, 4], [4, 9]])
+        for _ in range(3):
+            optimizer.zero_grad()
+            (weights[indices] ** 2).sum().backward()
+            optimizer.step()
+
+            unique, rows, inverse = self.table.pull(indices)
+            (rows[inverse] ** 2).sum().backward()
+            self.table.push(unique, rows.grad)
+
+        self.table.flush()
+        reopened = ShardedEmbedding(self.path)
+        self.assertEqual(reopened.num_embeddings, 10)
+        np.testing.assert_allclose(
+            reopened.to_numpy(), weights.detach().numpy(), rtol=1e-5
+        )
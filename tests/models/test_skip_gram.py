@@ -0,0 +1,75 @@
+"""Tests for the skip-gram model."""
+import unittest
+
+import torch
+from torch import testing
+
+from song2vec.models.skip_gram import SkipGram
+
+
+class SkipGramTestCase(unittest.TestCase):
+    """Tests for the skip-gram model."""
+
+    vocab_size: int
+    embedding_dim: int
+    model: SkipGram
+
+    def setUp(self):
+        self.vocab_size = 10
+        self.embedding_dim = 4
+        self.model = SkipGram(
+            vocab_size=self.vocab_size,
+            embedding_dim=self.embedding_dim,
+            window=2,
+            shrink_window=False,
+        )
+
+    def test_forward(self):
+        """Test that we can forward propogate."""
+        output = self.model(torch.tensor([0, 3, 9]))
+        self.assertEqual(output.shape, (3, self.vocab_size))
+        testing.assert_close(torch.ones(3), torch.exp(output).sum(axis=1))
+
+    def test_create_batch(self):
+        """Test that pairs are within the window and don't cross playlists."""
+        sequences = [[5, 6, 7, 8], [1, 2]]
+        centers, contexts = self.model.create_batch(
+            [torch.tensor(x) for x in sequences]
+        )
+        expected = {
+            (center, context)
+            for sequence in sequences
+            for i, center in enumerate(sequence)
+            for j, context in enumerate(sequence)
+            if 0 < abs(i - j) <= 2
+        }
+        actual = list(zip(centers.tolist(), contexts.tolist()))
+        self.assertEqual(len(actual), len(expected))
+        self.assertEqual(set(actual), expected)
+
+    def test_shrink_window(self):
+        """Test that shrinking windows only drops pairs."""
+        self.model.shrink_window = True
+        sequence = torch.arange(self.vocab_size)
+        generator = torch.Generator().manual_seed(0)
+        centers, contexts = self.model.create_batch([sequence], generator=generator)
+        distances = (centers - contexts).abs()
+        self.assertTrue(((distances >= 1) & (distances <= 2)).all())
+        self.assertLess(len(centers), 2 * 2 * self.vocab_size)
+        self.assertIn(1, distances.tolist())
+
+    def test_training_step(self):
+        """Test that the loss can be backpropagated."""
+        loss = self.model.training_step([torch.tensor([1, 2, 3])], 0)
+        loss.backward()
+        self.assertIsNotNone(self.model.embeddings.weight.grad)
+
+    def test_grow(self):
+        """Test that growing the vocab keeps the weights of existing tokens."""
+        embeddings = self.model.embeddings.weight.detach().clone()
+        self.model.grow(self.vocab_size + 2)
+        self.assertEqual(self.model.embeddings.num_embeddings, self.vocab_size + 2)
+        self.assertEqual(self.model.linear.out_features, self.vocab_size + 2)
+        testing.assert_close(
+            self.model.embeddings.weight[: self.vocab_size], embeddings
+        )
@@ -0,0 +1,72 @@
+"""Test the benchmarks."""
+import json
+import tempfile
+import unittest
+
+from song2vec import benchmark
+from song2vec.cli import load
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    """Test the synthetic data and the benchmark runner."""
+
+    def test_generate_slices(self):
+        """Test that the synthetic slices look like the real ones."""
+        with tempfile.TemporaryDirectory() as raw_data_dir:
+            filenames = benchmark.generate_slices(
+                raw_data_dir,
+                num_playlists=25,
+                num_tracks=50,
+                playlists_per_slice=10,
+                min_length=20,
+                max_length=30,
+            )
+            self.assertCountEqual(filenames, load.get_slices(raw_data_dir))
+            pids = []
+            for filename in filenames:
+                with open(filename) as file:
+                    playlists = json.load(file)["playlists"]
+                for playlist in playlists:
+                    pids.append(playlist["pid"])
+                    uris = [track["track_uri"] for track in playlist["tracks"]]
+                    self.assertEqual(len(uris), len(set(uris)))
+                    self.assertGreaterEqual(len(uris), 20)
+                    self.assertLessEqual(len(uris), 30)
+            self.assertEqual(sorted(pids), list(range(25)))
+
+    def test_skewed(self):
+        """Test that playlists get enough distinct tracks when a few tracks have most
+        of the weight."""
+        with tempfile.TemporaryDirectory() as raw_data_dir:
+            (filename,) = benchmark.generate_slices(
+                raw_data_dir,
+                num_playlists=20,
+                num_tracks=10000,
+                zipf_skew=3,
+                min_length=200,
+                max_length=250,
+            )
+            with open(filename) as file:
+                for playlist in json.load(file)["playlists"]:
+                    uris = {track["track_uri"] for track in playlist["tracks"]}
+                    self.assertGreaterEqual(len(uris), 200)
+
+    def test_run(self):
+        """Test that all the benchmarks run and are serializable."""
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = benchmark.run(
+                work_dir, num_playlists=20, num_tracks=100, repeat=3, batch_size=4
+            )
+        json.dumps(results)
+        for name in (
+            "load_playlists",
+            "getitem",
+            "query_db",
+            "encode",
+            "training_step",
+            "remove_unique_tracks",
+        ):
+            self.assertGreater(results["results"][name]["total_s"], 0)
+        for name in ("forward", "engine", "engine_batch"):
+            self.assertGreater(results["results"]["inference"][name]["total_s"], 0)
+        self.assertEqual(results["params"]["num_playlists"], 20)
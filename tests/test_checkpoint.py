@@ -0,0 +1,124 @@
+"""Tests for the memory-mapped checkpoint format."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+from torch import testing
+
+from song2vec import checkpoint, training
+from song2vec.models.skip_gram import SkipGram
+from song2vec.utils import MultiHotEncoder
+
+
+class CheckpointTestCase(unittest.TestCase):
+    """Test saving and loading checkpoints."""
+
+    tmp_dir: str
+    path: str
+    tensors: dict
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "checkpoint")
+        self.tensors = {
+            "a": torch.arange(3, dtype=torch.int8),
+            "b": torch.randn(4, 5),
+            "empty": torch.zeros(0, 5),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_save_load(self):
+        """Test that tensors are aligned and loaded copy-on-write."""
+        checkpoint.save(self.path, self.tensors, ["x", "y"], {"step": 3})
+        index = checkpoint.read_index(self.path)
+        for spec in index["tensors"].values():
+            self.assertEqual(spec["offset"] % checkpoint.ALIGNMENT, 0)
+
+        tensors, vocabulary, metadata = checkpoint.load(self.path)
+        self.assertEqual(vocabulary, ["x", "y"])
+        self.assertEqual(metadata, {"step": 3})
+        for name, tensor in self.tensors.items():
+            testing.assert_close(tensors[name], tensor)
+
+        # Writing to a loaded tensor doesn't change the file.
+        tensors["b"] += 1
+        testing.assert_close(checkpoint.load(self.path)[0]["b"], self.tensors["b"])
+
+    def test_replace(self):
+        """Test saving over an existing checkpoint and detecting a bad vocabulary."""
+        checkpoint.save(self.path, self.tensors, ["x"], {})
+        checkpoint.save(self.path, self.tensors, ["x", "y"], {})
+        self.assertEqual(os.listdir(self.tmp_dir), ["checkpoint"])
+        with open(os.path.join(self.path, checkpoint.VOCABULARY_FILE), "a") as file:
+            file.write("z\n")
+        with self.assertRaises(ValueError):
+            checkpoint.load(self.path)
+
+    def test_chunks(self):
+        """Test that a tensor given as chunks is saved as their concatenation."""
+        chunks = [self.tensors["b"][:3].numpy(), self.tensors["b"][3:].numpy()]
+        checkpoint.save(self.path, {"a": self.tensors["a"], "b": chunks}, ["x"], {})
+        tensors = checkpoint.load(self.path)[0]
+        testing.assert_close(tensors["a"], self.tensors["a"])
+        testing.assert_close(tensors["b"], self.tensors["b"])
+
+    def test_async(self):
+        """Test that background saves write the weights at the time of the call."""
+        saver = checkpoint.AsyncSaver()
+        expected = self.tensors["b"].clone()
+        saver.save(self.path, self.tensors, ["x"], {})
+        self.tensors["b"] += 1
+        saver.close()
+        testing.assert_close(checkpoint.load(self.path)[0]["b"], expected)
+
+    def test_model(self):
+        """Test saving a model and loading it from the old and the new format."""
+        model = SkipGram(vocab_size=3, embedding_dim=2, window=4)
+        encoder = MultiHotEncoder(["c", "a", "b"], sort=False)
+        training.save_checkpoint(self.path, model, encoder, 7, position={"epoch": 1})
+        self.assertEqual(training.checkpoint_position(self.path), {"epoch": 1})
+
+        legacy_path = os.path.join(self.tmp_dir, "legacy.pt")
+        torch.save(
+            {
+                "model": "skip-gram",
+                "window": 4,
+                "embedding_dim": 2,
+                "state_dict": model.state_dict(),
+                "vocabulary": encoder.vocabulary,
+                "last_pid": 7,
+            },
+            legacy_path,
+        )
+        for path in (self.path, legacy_path):
+            loaded, loaded_encoder, last_pid = training.load_checkpoint(path)
+            loaded_optimizer = torch.optim.Adam(loaded.parameters())
+            self.assertEqual(loaded.window, 4)
+            self.assertEqual(loaded_encoder.vocabulary, ["c", "a", "b"])
+            self.assertEqual(last_pid, 7)
+            for name, param in model.state_dict().items():
+                testing.assert_close(loaded.state_dict()[name], param)
+            self.assertFalse(training.load_optimizer_state(path, loaded_optimizer))
+
+    def test_optimizer(self):
+        """Test that the optimizer state is saved with the model and restored."""
+        model = SkipGram(vocab_size=3, embedding_dim=2, window=4)
+        encoder = MultiHotEncoder(["c", "a", "b"], sort=False)
+        optimizer = torch.optim.Adam(model.parameters(), lr=0.1)
+        model.training_step([torch.tensor([0, 1, 2])], 0).backward()
+        optimizer.step()
+        training.save_checkpoint(self.path, model, encoder, 7, optimizer=optimizer)
+
+        loaded, _, _ = training.load_checkpoint(self.path)
+        loaded_optimizer = torch.optim.Adam(loaded.parameters())
+        self.assertTrue(training.load_optimizer_state(self.path, loaded_optimizer))
+        expected, actual = optimizer.state_dict(), loaded_optimizer.state_dict()
+        self.assertEqual(actual["param_groups"][0]["lr"], 0.1)
+        self.assertEqual(actual["state"].keys(), expected["state"].keys())
+        for index, state in expected["state"].items():
+            for name, value in state.items():
+                testing.assert_close(actual["state"][index][name], value)
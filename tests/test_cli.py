@@ -0,0 +1,75 @@
+"""Test that the cli starts quickly."""
+import json
+import subprocess
+import sys
+import unittest
+
+# Imports that light commands like `--help` must not pay for.
+HEAVY_MODULES = (
+    "torch",
+    "numpy",
+    "sqlalchemy",
+    "tqdm",
+    "pyarrow",
+    "song2vec.cli.load",
+)
+# Budget for importing the cli and running a light command, not counting the startup of
+# the interpreter.
+COLD_START_BUDGET_S = 0.1
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from song2vec.cli.__main__ import cli
+try:
+    cli.main(sys.argv[1:], standalone_mode=False)
+finally:
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"elapsed": elapsed, "modules": list(sys.modules)}))
+"""
+
+
+def run_cli(*args: str) -> dict:
+    """Run the cli in a new interpreter, like a cron job would."""
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT, *args],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class ColdStartTestCase(unittest.TestCase):
+    """Test that commands are only imported when they are used."""
+
+    def test_light_commands(self):
+        """Test that help doesn't import heavy dependencies and is fast."""
+        for args in (
+            ["--help"],
+            ["load-playlists", "--help"],
+            ["train", "--help"],
+            ["evaluate", "--help"],
+            ["build-embeddings", "--help"],
+        ):
+            results = [run_cli(*args) for _ in range(3)]
+            for module in HEAVY_MODULES:
+                self.assertNotIn(module, results[0]["modules"], args)
+            self.assertLess(min(x["elapsed"] for x in results), COLD_START_BUDGET_S)
+
+    def test_list_commands(self):
+        """Test that all the commands are listed."""
+        output = subprocess.run(
+            [sys.executable, "-m", "song2vec.cli", "--help"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        for command in (
+            "load-playlists",
+            "train",
+            "benchmark",
+            "evaluate",
+            "build-embeddings",
+        ):
+            self.assertIn(command, output)
@@ -0,0 +1,61 @@
+"""Tests for artist and album embeddings and similarity search."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from song2vec import embeddings
+
+
+class SegmentMeansTestCase(unittest.TestCase):
+    """Test the segmented reduction against a loop."""
+
+    def test_segment_means(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((20, 3)).astype(np.float32)
+        segments = rng.integers(-1, 5, 20)
+        weights = rng.integers(0, 3, 20)
+        weights[segments == 4] = 0
+
+        ids, means = embeddings.segment_means(vectors, segments, weights)
+        self.assertEqual(ids.tolist(), sorted(set(segments.tolist()) - {-1}))
+        for segment, mean in zip(ids, means):
+            rows = segments == segment
+            if weights[rows].sum():
+                expected = np.average(vectors[rows], axis=0, weights=weights[rows])
+            else:
+                expected = vectors[rows].mean(axis=0)
+            np.testing.assert_allclose(mean, expected, rtol=1e-5, atol=1e-6)
+
+
+class EmbeddingIndexTestCase(unittest.TestCase):
+    """Test searching the indexes."""
+
+    tmp_dir: str
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_most_similar(self):
+        """Test that blocked search gives the same results as a full sort."""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((50, 4)).astype(np.float32)
+        path = os.path.join(self.tmp_dir, "index")
+        embeddings.save_index(path, vectors, [str(i) for i in range(50)], {})
+        index = embeddings.EmbeddingIndex(path)
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = normalized @ normalized[[3, 7]].T
+        scores[[3, 7], [0, 1]] = -np.inf
+        results = index.most_similar(["3", 7], k=5, block_size=8)
+        for i, results_i in enumerate(results):
+            expected = np.argsort(-scores[:, i])[:5]
+            self.assertEqual([uri for uri, _ in results_i], [str(x) for x in expected])
+            np.testing.assert_allclose(
+                [score for _, score in results_i], scores[expected, i], rtol=1e-5
+            )
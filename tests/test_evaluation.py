@@ -0,0 +1,56 @@
+"""Tests for the playlist continuation metrics."""
+import unittest
+
+import numpy as np
+
+from song2vec import evaluation
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Test the metrics against values computed by hand."""
+
+    def test_r_precision(self):
+        self.assertEqual(evaluation.r_precision([1, 2, 3, 4], {2, 4}), 0.5)
+        self.assertEqual(evaluation.r_precision([1, 2, 3, 4], {5}), 0.0)
+
+    def test_ndcg(self):
+        self.assertAlmostEqual(evaluation.ndcg([1, 2, 3], {1, 2}), 1.0)
+        self.assertAlmostEqual(
+            evaluation.ndcg([3, 1, 2], {1, 2}), (1 + 1 / np.log2(3)) / 2
+        )
+        self.assertEqual(evaluation.ndcg([3, 4], {1}), 0.0)
+
+    def test_clicks(self):
+        self.assertEqual(evaluation.clicks(list(range(30)), {0}), 0)
+        self.assertEqual(evaluation.clicks(list(range(30)), {25}), 2)
+        self.assertEqual(evaluation.clicks(list(range(30)), {50}), 51)
+
+    def test_recommend(self):
+        """Test that seeds are never recommended and the best tracks come first."""
+        weights = evaluation.embedding_weights(np.eye(4, dtype=np.float32))
+        weights["bias"] = np.array([0.0, 0.1, 0.2, 0.3], dtype=np.float32)
+        recommendations = evaluation.recommend(
+            [np.array([0]), np.array([], dtype=np.int64)], weights, 3
+        )
+        np.testing.assert_array_equal(recommendations, [[3, 2, 1], [3, 2, 1]])
+        for block_size in (1, 3):
+            np.testing.assert_array_equal(
+                evaluation.recommend(
+                    [np.array([0]), np.array([], dtype=np.int64)],
+                    weights,
+                    3,
+                    block_size=block_size,
+                ),
+                recommendations,
+            )
+
+    def test_split_playlists(self):
+        """Test that unknown seeds are dropped and unknown held out tracks kept."""
+        examples = evaluation.split_playlists(
+            [["a", "x", "b", "y"], ["a"]], {"a": 0, "b": 1}, num_seeds=2
+        )
+        self.assertEqual(len(examples), 1)
+        seeds, holdout = examples[0]
+        np.testing.assert_array_equal(seeds, [0])
+        self.assertEqual(holdout[0], 1)
+        self.assertLess(holdout[1], 0)
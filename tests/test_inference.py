@@ -0,0 +1,142 @@
+"""Test recommending tracks with the NumPy inference engine."""
+import itertools
+import os
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+import torch
+
+from song2vec import evaluation, training
+from song2vec.inference import (
+    InferenceEngine,
+    MicroBatcher,
+    blocked_top_k,
+    top_k_columns,
+)
+from song2vec.models.continous_bag_of_words import ContinousBagOfWords
+from song2vec.models.skip_gram import SkipGram
+from song2vec.utils import MultiHotEncoder
+
+
+class InferenceEngineTestCase(unittest.TestCase):
+    """Test `InferenceEngine` and `MicroBatcher`."""
+
+    vocabulary = [f"track{i}" for i in range(50)]
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = ContinousBagOfWords(len(self.vocabulary), 8)
+        self.engine = InferenceEngine(
+            evaluation.export_weights(self.model), self.vocabulary, block_size=16
+        )
+
+    def test_blocked_top_k(self):
+        """Test that scoring in blocks gives the same results as sorting all scores."""
+        rng = np.random.default_rng(0)
+        queries = rng.standard_normal((5, 4)).astype(np.float32)
+        matrix = rng.standard_normal((37, 4)).astype(np.float32)
+        bias = rng.standard_normal(37).astype(np.float32)
+        exclude = (np.array([0, 0, 3]), np.array([1, 30, 2]))
+        scores = queries @ matrix.T + bias
+        scores[exclude] = -np.inf
+        for k, block_size in itertools.product((1, 7, 35), (1, 10, 37, 100)):
+            rows, top_scores = blocked_top_k(
+                queries, matrix, k, bias=bias, exclude=exclude, block_size=block_size
+            )
+            np.testing.assert_array_equal(rows, np.argsort(-scores, axis=1)[:, :k])
+            np.testing.assert_allclose(
+                top_scores, -np.sort(-scores, axis=1)[:, :k], atol=1e-5
+            )
+
+    def test_top_k_columns(self):
+        """Test finding the top columns with groups of columns."""
+        rng = np.random.default_rng(0)
+        scores = rng.standard_normal((6, 1000)).astype(np.float32)
+        scores[0, :500] = -np.inf
+        for k, group_size in itertools.product((1, 10, 100), (1, 8, 64)):
+            np.testing.assert_array_equal(
+                top_k_columns(scores, k, group_size=group_size),
+                np.argsort(-scores, axis=1, kind="stable")[:, :k],
+            )
+
+    def test_same_as_forward(self):
+        """Test that the recommendations are the best tracks of the model's forward."""
+        contexts = [["track0", "track5", "track7"], ["track3", "track40"]]
+        encoder = MultiHotEncoder(self.vocabulary, sort=False)
+        with torch.no_grad():
+            log_probs = self.model(encoder.encode(contexts))
+        for i, context in enumerate(contexts):
+            log_probs[i, [encoder.indices[x] for x in context]] = -np.inf
+        expected = [[self.vocabulary[x] for x in row] for row in log_probs.topk(5)[1]]
+
+        results = self.engine.recommend(
+            contexts + [[0, 5, 7], ["unknown", "track3"]], 5
+        )
+        self.assertEqual([[uri for uri, _ in x] for x in results[:2]], expected)
+        self.assertEqual(results[2], results[0])
+        self.assertEqual(results[3], self.engine.recommend([["track3"]], 5)[0])
+
+    def test_empty(self):
+        """Test contexts without known tracks and asking for more tracks than exist."""
+        results = self.engine.recommend([[], ["unknown"]], k=3)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(len(results[0]), 3)
+        self.assertEqual(len(self.engine.recommend([[0]], k=100)[0]), 49)
+        self.assertEqual(self.engine.recommend([], k=3), [])
+
+    def test_invalid_index(self):
+        """Test that indices outside of the vocabulary are rejected."""
+        for index in (-1, 50):
+            with self.assertRaises(ValueError):
+                self.engine.recommend([[0, index]])
+
+    def test_from_checkpoint(self):
+        """Test that checkpoints of both models give the same results as their weights."""
+        encoder = MultiHotEncoder(self.vocabulary, sort=False)
+        for model in (self.model, SkipGram(len(self.vocabulary), 8)):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, "checkpoint")
+                training.save_checkpoint(path, model, encoder, -1)
+                engine = InferenceEngine.from_checkpoint(path)
+                expected = InferenceEngine(
+                    evaluation.export_weights(model), self.vocabulary
+                )
+                self.assertEqual(
+                    engine.recommend([[1, 2], [3]]), expected.recommend([[1, 2], [3]])
+                )
+
+    def test_micro_batcher(self):
+        """Test that concurrent requests get the same results as alone."""
+        batcher = MicroBatcher(self.engine, max_batch_size=4, max_wait=0.05)
+        contexts = [[i, (i * 7) % 50] for i in range(20)]
+        results = [None] * len(contexts)
+
+        def request(i):
+            results[i] = batcher.recommend(contexts[i], k=1 + i % 5)
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        batcher.close()
+        self.assertFalse(batcher.thread.is_alive())
+        for i, context in enumerate(contexts):
+            expected = self.engine.recommend([context], k=1 + i % 5)[0]
+            self.assertEqual([x for x, _ in results[i]], [x for x, _ in expected])
+            np.testing.assert_allclose(
+                [x for _, x in results[i]], [x for _, x in expected], rtol=1e-5
+            )
+
+    def test_micro_batcher_invalid(self):
+        """Test that an invalid request doesn't fail the requests batched with it."""
+        batcher = MicroBatcher(self.engine, max_batch_size=4, max_wait=0.05)
+        valid = batcher.submit(["track1", "track2"], k=3)
+        invalid = [batcher.submit([500]), batcher.submit([-1])]
+        self.assertEqual(valid.result(), self.engine.recommend([[1, 2]], k=3)[0])
+        for future in invalid:
+            with self.assertRaises(ValueError):
+                future.result()
+        batcher.close()
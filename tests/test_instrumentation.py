@@ -0,0 +1,112 @@
+"""Test the timers, counters and profiling hooks."""
+import multiprocessing
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from song2vec import instrumentation
+
+
+class MetricsTestCase(unittest.TestCase):
+    """Test the `Metrics` class."""
+
+    def setUp(self):
+        self.metrics = instrumentation.Metrics()
+
+    def test_timer(self):
+        """Test that timers accumulate time and calls."""
+        for _ in range(3):
+            with self.metrics.timer("load"):
+                pass
+        self.assertEqual(self.metrics.calls["load"], 3)
+        self.assertGreater(self.metrics.timers["load"], 0)
+
+        with self.assertRaises(KeyError):
+            with self.metrics.timer("fail"):
+                raise KeyError()
+        self.assertEqual(self.metrics.calls["fail"], 1)
+
+    def test_threads(self):
+        """Test that updates from several threads aren't lost."""
+        ticks = threading.local()
+
+        def clock():
+            # Let other threads run while a timer is being updated, and make each timed
+            # block last 1 second.
+            time.sleep(0)
+            ticks.value = getattr(ticks, "value", 0) + 1
+            return (ticks.value + 1) % 2
+
+        def update():
+            for _ in range(1000):
+                with self.metrics.timer("fetch"):
+                    self.metrics.count("fetch.rows")
+
+        with mock.patch.object(instrumentation.time, "perf_counter", clock):
+            threads = [threading.Thread(target=update) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(self.metrics.timers["fetch"], 8000)
+        self.assertEqual(self.metrics.calls["fetch"], 8000)
+        self.assertEqual(self.metrics.counters["fetch.rows"], 8000)
+
+    def test_rate(self):
+        """Test that counters are divided by the timer of their prefix."""
+        self.metrics.timers["load"] = 2.0
+        self.metrics.count("load.rows", 10)
+        self.metrics.count("load.rows", 30)
+        self.metrics.count("other.rows", 5)
+        self.assertEqual(self.metrics.rate("load.rows"), 20.0)
+        self.assertIsNone(self.metrics.rate("other.rows"))
+        self.assertIn("load.rows: 40 (20.0/s)", self.metrics.report())
+
+    def test_merge(self):
+        """Test that metrics from other processes are added."""
+        self.metrics.count("load.rows", 1)
+        with self.metrics.timer("load"):
+            pass
+        other = instrumentation.Metrics()
+        other.merge(self.metrics.as_dict())
+        other.merge(self.metrics.as_dict())
+        self.assertEqual(other.counters["load.rows"], 2)
+        self.assertEqual(other.calls["load"], 2)
+        self.assertAlmostEqual(other.timers["load"], 2 * self.metrics.timers["load"])
+
+    def test_run_instrumented(self):
+        """Test that workers send back their metrics and profiles."""
+        queue = multiprocessing.Queue()
+        with tempfile.TemporaryDirectory() as profile_dir:
+            instrumentation.run_instrumented(
+                "worker", queue, profile_dir, instrumentation.METRICS.count, "rows", 3
+            )
+            pstats.Stats(os.path.join(profile_dir, "worker.pstats"))
+        self.assertEqual(queue.get()["counters"], {"rows": 3})
+
+    def test_collect_metrics(self):
+        """Test that workers that die without sending metrics aren't waited for."""
+        queue = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=instrumentation.run_instrumented,
+                args=("worker", queue, None, instrumentation.METRICS.count, "rows", 3),
+            ),
+            # Exits without sending anything, like a killed worker.
+            multiprocessing.Process(
+                target=os._exit, args=(1,)  # pylint: disable=protected-access
+            ),
+        ]
+        for process in processes:
+            process.start()
+        instrumentation.METRICS.reset()
+        self.assertEqual(
+            instrumentation.collect_metrics(queue, processes, timeout=0.1), 1
+        )
+        self.assertEqual(instrumentation.METRICS.counters, {"rows": 3})
+        for process in processes:
+            process.join()
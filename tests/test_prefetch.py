@@ -0,0 +1,54 @@
+"""Test the background prefetching of batches."""
+import threading
+import time
+import unittest
+
+from song2vec.data.prefetch import prefetch
+from song2vec.instrumentation import METRICS
+
+
+class PrefetchTestCase(unittest.TestCase):
+    """Test the `prefetch` generator."""
+
+    def test_order(self):
+        """Test that batches come out in order, with or without threads."""
+        for depth in (0, 1, 3):
+            self.assertEqual(
+                list(prefetch(lambda x: x * 2, range(10), depth=depth)),
+                [x * 2 for x in range(10)],
+            )
+
+    def test_depth(self):
+        """Test that at most `depth` batches are fetched ahead."""
+        lock = threading.Lock()
+        started = []
+
+        def fetch(item):
+            with lock:
+                started.append(item)
+            return item
+
+        batches = prefetch(fetch, range(20), depth=3, num_workers=2)
+        for item in batches:
+            time.sleep(0.001)
+            with lock:
+                self.assertLessEqual(len(started), item + 1 + 3)
+        self.assertCountEqual(started, range(20))
+
+    def test_stall_timer(self):
+        """Test that the time spent waiting for batches is measured."""
+        METRICS.reset()
+        list(prefetch(time.sleep, [0.01] * 3, depth=2, timer="test.stall"))
+        self.assertEqual(METRICS.calls["test.stall"], 3)
+        self.assertGreater(METRICS.timers["test.stall"], 0)
+
+    def test_errors(self):
+        """Test that errors in the threads are raised in the consumer."""
+
+        def fetch(item):
+            if item == 2:
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError):
+            list(prefetch(fetch, range(5), depth=2))
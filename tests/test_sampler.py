@@ -0,0 +1,43 @@
+"""Test batching playlists by length."""
+import unittest
+
+from song2vec.data.sampler import BucketBatchSampler
+
+
+class BucketBatchSamplerTestCase(unittest.TestCase):
+    """Test the `BucketBatchSampler` class."""
+
+    def setUp(self):
+        self.lengths = {str(i): 1 + (i * 7) % 40 for i in range(100)}
+        self.lengths["big"] = 100
+        self.sampler = BucketBatchSampler(list(self.lengths), self.lengths, 64)
+
+    def test_budget(self):
+        """Test that batches fit the budget, unless a playlist is larger on its own."""
+        for batch in self.sampler.batches():
+            num_tokens = sum(self.lengths[key] for key in batch)
+            self.assertTrue(num_tokens <= 64 or batch == ["big"], batch)
+
+    def test_coverage(self):
+        """Test that each playlist with at least 2 tracks is in exactly one batch."""
+        keys = [key for batch in self.sampler.batches() for key in batch]
+        self.assertCountEqual(
+            keys, [key for key, length in self.lengths.items() if length >= 2]
+        )
+
+    def test_buckets(self):
+        """Test that the playlists of a batch are in the same power of 2 range."""
+        for batch in self.sampler.batches():
+            self.assertEqual(
+                len({self.lengths[key].bit_length() for key in batch}), 1, batch
+            )
+
+    def test_epochs(self):
+        """Test that the batches only depend on the seed and the epoch."""
+        other = BucketBatchSampler(list(self.lengths), self.lengths, 64)
+        self.assertEqual(self.sampler.batches(1), other.batches(1))
+        self.assertNotEqual(self.sampler.batches(0), self.sampler.batches(1))
+        unshuffled = BucketBatchSampler(
+            list(self.lengths), self.lengths, 64, shuffle=False
+        )
+        self.assertEqual(unshuffled.batches(0), unshuffled.batches(1))
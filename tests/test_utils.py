@@ -23,3 +23,14 @@ class UtilsTestCase(unittest.TestCase):
             torch.Tensor([[1, 1, 0, 0], [0, 0, 1, 1], [0, 0, 0, 0]]), encoded.to_dense()
         )
         self.assertTrue(encoded.is_sparse)
+
+    def test_extend(self):
+        """Test that new tokens are appended without changing existing indices."""
+        encoder = utils.MultiHotEncoder(vocabulary=["b", "c"])
+        self.assertEqual(encoder.extend(["a", "c", "d"]), 2)
+        self.assertEqual(encoder.vocabulary, ["b", "c", "a", "d"])
+        for index, value in enumerate(encoder.vocabulary):
+            self.assertEqual(encoder.indices[value], index)
+
+        unsorted = utils.MultiHotEncoder(vocabulary=encoder.vocabulary, sort=False)
+        self.assertEqual(unsorted.vocabulary, encoder.vocabulary)